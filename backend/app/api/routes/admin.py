@@ -0,0 +1,84 @@
+# this file has admin-only endpoints for looking inside a running worker
+# they are switched off unless ADMIN_TOKEN is set, and every call must send it in X-Admin-Token
+import secrets
+from fastapi import APIRouter, Depends, Header, HTTPException
+from pydantic import BaseModel, Field
+from app.core.config import settings
+from app.core.logging import log_levels, set_levels
+from app.core.memory import MEMORY
+from app.core.profiler import PROFILER
+
+
+# rejects the request unless it carries the configured admin token
+def require_admin(x_admin_token: str | None = Header(default=None)):
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled")
+    if not x_admin_token or not secrets.compare_digest(x_admin_token, settings.ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+# creating a router for admin endpoints (all of them need the admin token)
+router = APIRouter(prefix="/admin", tags=["Admin"], dependencies=[Depends(require_admin)])
+
+
+# how many requests to profile and how often to take a stack sample
+class ProfileRequest(BaseModel):
+    requests: int = Field(default=50, ge=1, le=10000)
+    interval_ms: float = Field(default=5.0, ge=1.0, le=1000.0)
+
+
+# starts the sampling profiler for the next N requests handled by this worker
+@router.post("/profile")
+async def start_profile(request: ProfileRequest):
+    if not PROFILER.start(request.requests, request.interval_ms, settings.PROFILE_DIR):
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    return {"status": "started", **PROFILER.status()}
+
+
+# shows whether a profile is running and where the last one was written
+@router.get("/profile")
+async def profile_status():
+    return PROFILER.status()
+
+
+# stops the running profile early and writes what was sampled so far
+@router.delete("/profile")
+async def stop_profile():
+    PROFILER.stop()
+    return {"status": "stopping", **PROFILER.status()}
+
+
+# estimated bytes of each resident structure of this worker (and its RSS) against the budget
+# (plain def: estimating the docstore walks part of it, so it runs in the threadpool)
+@router.get("/memory")
+def memory_report():
+    return MEMORY.report()
+
+
+# unloads the least recently used structures now until this worker is under its budget
+@router.post("/memory/enforce")
+def enforce_memory_budget():
+    unloaded = MEMORY.enforce()
+    return {"unloaded": unloaded, **MEMORY.report()}
+
+
+# log levels to change, by module ("app.vectorstore": "DEBUG"); "root" is the default level
+class LogLevelsRequest(BaseModel):
+    levels: dict[str, str]
+
+
+# the modules with their own log level in this worker
+@router.get("/logging")
+async def get_log_levels():
+    return {"levels": log_levels()}
+
+
+# changes log levels of this worker until it restarts (LOG_LEVELS sets them at startup)
+@router.post("/logging")
+async def change_log_levels(request: LogLevelsRequest):
+    levels = {("" if name == "root" else name): level.upper() for name, level in request.levels.items()}
+    try:
+        set_levels(levels)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return {"levels": log_levels()}
@@ -0,0 +1,17 @@
+# this file has the endpoints the load balancer uses to check if this worker can take traffic
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from app.services.warmup_service import get_readiness
+
+# creating a router for health related endpoints
+router = APIRouter(tags=["Health"])
+
+
+# returns 200 once the embedding model, vector index and Gemini model are loaded, 503 before that
+@router.get("/ready")
+async def ready():
+    is_ready, components = get_readiness()
+    return JSONResponse(
+        status_code=200 if is_ready else 503,
+        content={"ready": is_ready, "components": components}
+    )
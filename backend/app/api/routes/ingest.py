@@ -3,17 +3,18 @@ from fastapi import APIRouter, UploadFile, File, HTTPException, BackgroundTasks
 import os
 import shutil
 import logging
+import zipfile
+from contextlib import contextmanager
+from functools import partial
 from urllib.parse import unquote
 from concurrent.futures import ThreadPoolExecutor
-from app.services.ingestion_service import ingest_pdf
+from app.services import job_store, text_store
+from app.services.ingestion_service import reconcile_uploads, submit_document
 from app.core.config import settings
-import threading
+from app.core.metrics import INGEST_DOCUMENTS_TOTAL, gauge_func
+from app.vectorstore.faiss_store import clear_vectorstore, vectorstore_write_lock
 
 logger = logging.getLogger(__name__)
-# lock to prevent race conditions when modifying INGESTION_STATUS
-_status_lock = threading.Lock()
-# lock to prevent concurrent vectorstore modifications
-_vectorstore_lock = threading.Lock()
 
 # creating a router for all PDF ingestion related endpoints
 router = APIRouter(prefix="/ingest", tags=["Document Ingestion"])
@@ -34,66 +35,68 @@ executor = ThreadPoolExecutor(
     thread_name_prefix="pdf_ingest_"
 )
 
-# keeps track of which PDFs are processing, completed, or failed
-INGESTION_STATUS = {}
+# which PDFs are pending, processing, completed, or failed is kept in job_store
+# (a SQLite file), so every worker process answers /status the same way
+
+
+# how many ingestion jobs are in each state (read only when /metrics is scraped)
+def _jobs_by_status():
+    return {(status,): count for status, count in job_store.count_by_status().items()}
+
+
+gauge_func("ingest_jobs", "Ingestion jobs by status", _jobs_by_status, ["status"])
+# the depth admission control compares with MAX_INGEST_QUEUE (without entries of dead workers)
+gauge_func("ingest_queue_depth", "Ingestion jobs pending or processing", job_store.count_in_progress)
 
 
 # this runs in the background to process a PDF without blocking the user
 def ingest_background(file_path: str, filename: str):
-    # check if already processing (with thread safety)
-    with _status_lock:
-        if (
-            filename in INGESTION_STATUS
-            and INGESTION_STATUS[filename]["status"] == "processing"
-        ):
-            return
-        
-        # mark the file as currently being processed
-        INGESTION_STATUS[filename] = {
-            "status": "processing",
-            "pages": 0,
-            "chunks": 0,
-            "error": None,
-        }
+    ingest_files_background([(file_path, filename)])
 
-    try:
-        # run the actual PDF processing in a separate thread with vectorstore lock
-        with _vectorstore_lock:
-            future = executor.submit(ingest_pdf, file_path)
-            # wait for it to finish and get the result (with timeout to prevent hanging)
-            result = future.result(timeout=300)  # 5 minute timeout
-
-        # update status to completed with page and chunk counts (with lock)
-        with _status_lock:
-            INGESTION_STATUS[filename].update({
-                "status": "completed",
-                "pages": result.get("pages", 0),
-                "chunks": result.get("chunks", 0),
-            })
-        logger.info(f"Successfully processed {filename}: {result.get('pages', 0)} pages, {result.get('chunks', 0)} chunks")
 
-    except Exception as e:
-        # if something went wrong, mark it as failed with the error message (with lock)
-        error_msg = str(e)
-        logger.error(f"Error processing PDF {filename}: {error_msg}")
-        with _status_lock:
-            if filename in INGESTION_STATUS:
-                INGESTION_STATUS[filename].update({
-                    "status": "failed",
-                    "error": error_msg,
-                })
-
-
-# rebuilds the search database after a PDF is deleted (runs in background)
-def rebuild_vectorstore_background():
+# processes uploaded files in the background: two at a time are read and embedded, and the
+# index writer saves the ones that finish close together in one commit
+def ingest_files_background(files: list):
+    jobs = []
+    for file_path, filename in files:
+        # mark the file as currently being processed, unless some worker already is
+        if job_store.claim(filename):
+            # run the actual PDF processing in a separate thread
+            # (the index writer takes the inter-process write lock when it saves)
+            jobs.append((filename, executor.submit(submit_document, file_path)))
+
+    for filename, future in jobs:
+        try:
+            # wait for the file to be read and embedded, then for the commit that makes it
+            # searchable (with timeouts to prevent hanging)
+            result = future.result(timeout=300).result(timeout=300)  # 5 minute timeouts
+
+            # update status to completed with page and chunk counts
+            job_store.update_status(
+                filename,
+                status="completed",
+                pages=result.get("pages", 0),
+                chunks=result.get("chunks", 0),
+            )
+            logger.info(f"Successfully processed {filename}: {result.get('pages', 0)} pages, {result.get('chunks', 0)} chunks")
+            INGEST_DOCUMENTS_TOTAL.labels(outcome="completed").inc()
+
+        except Exception as e:
+            # if something went wrong, mark it as failed with the error message
+            error_msg = str(e)
+            logger.error(f"Error processing PDF {filename}: {error_msg}")
+            INGEST_DOCUMENTS_TOTAL.labels(outcome="failed").inc()
+            job_store.update_status(filename, status="failed", error=error_msg)
+
+
+# brings the search database in line with the uploads folder after a PDF is deleted
+# (runs in background; only the deleted file's chunks are dropped, nothing is re-embedded)
+def reconcile_vectorstore_background():
     try:
-        # use lock to prevent concurrent vectorstore modifications
-        with _vectorstore_lock:
-            from app.services.ingestion_service import rebuild_vectorstore_from_uploads
-            rebuild_vectorstore_from_uploads()
-            logger.info("Background vectorstore rebuild completed")
+        reconcile_uploads()
+        logger.info("Background vectorstore reconcile completed")
     except Exception as e:
-        logger.error(f"Background rebuild failed: {e}")
+        logger.error(f"Background reconcile failed: {e}")
 
 
 # API endpoint to upload a PDF file
@@ -103,6 +106,122 @@ async def ingest(background_tasks: BackgroundTasks, file: UploadFile = File(...)
     if not file or not file.filename:
         raise HTTPException(status_code=400, detail="No file provided")
     
+    _validate_upload(file)
+
+    # save the uploaded file to disk
+    file_path = os.path.join(UPLOAD_DIR, file.filename)
+    try:
+        with open(file_path, "wb") as f:
+            shutil.copyfileobj(file.file, f)
+    except Exception as e:
+        logger.error(f"Failed to save file {file.filename}: {e}")
+        raise HTTPException(status_code=500, detail="Failed to save file")
+
+    # set initial status to pending (so frontend knows we got the file)
+    job_store.mark_pending(file.filename)
+
+    # start processing the PDF in the background so we can respond immediately
+    background_tasks.add_task(
+        ingest_background,
+        file_path,
+        file.filename
+    )
+
+    # tell the frontend we got the file and started processing
+    return {
+        "status": "accepted",
+        "filename": file.filename,
+        "message": "PDF upload received. Processing started."
+    }
+
+
+# API endpoint to upload several files at once (a course pack), as PDF/DOCX files and/or zip archives
+# of them. they are processed together, so the index is saved a few times instead of once per file
+# (plain def: unpacking and saving up to MAX_BATCH_SIZE blocks, so it runs in the threadpool)
+@router.post("/batch")
+def ingest_batch(background_tasks: BackgroundTasks, files: list[UploadFile] = File(...)):
+    # everything is checked before anything is saved, so a bad upload leaves no files behind
+    sources = {}
+    skipped = []
+    # names that came more than once (files are saved under their name without folders)
+    duplicates = []
+    total_size = 0
+    for upload in files:
+        if not upload or not upload.filename:
+            raise HTTPException(status_code=400, detail="No file provided")
+        if os.path.splitext(upload.filename.lower())[1] == ".zip":
+            try:
+                archive = zipfile.ZipFile(upload.file)
+            except zipfile.BadZipFile:
+                raise HTTPException(status_code=400, detail=f"{upload.filename} is not a valid zip archive")
+            for info in archive.infolist():
+                name = os.path.basename(info.filename)
+                # folders, hidden files and macOS resource forks
+                if info.is_dir() or not name or name.startswith(".") or info.filename.startswith("__MACOSX/"):
+                    continue
+                if os.path.splitext(name.lower())[1] not in settings.ALLOWED_FILE_EXTENSIONS:
+                    skipped.append(name)
+                    continue
+                if info.file_size > settings.MAX_FILE_SIZE:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"{name} exceeds {settings.MAX_FILE_SIZE / (1024*1024):.0f}MB limit"
+                    )
+                total_size += info.file_size
+                if name in sources:
+                    duplicates.append(name)
+                sources[name] = partial(archive.open, info)
+        else:
+            total_size += _validate_upload(upload)
+            name = os.path.basename(upload.filename)
+            if name in sources:
+                duplicates.append(name)
+            sources[name] = partial(_upload_stream, upload)
+
+    if duplicates:
+        raise HTTPException(
+            status_code=400,
+            detail=f"More than one file is named {', '.join(sorted(set(duplicates)))}. Rename them and upload again."
+        )
+
+    if not sources:
+        raise HTTPException(
+            status_code=400, detail=f"No {', '.join(settings.ALLOWED_FILE_EXTENSIONS)} files in the upload"
+        )
+    if len(sources) > settings.MAX_BATCH_FILES:
+        raise HTTPException(status_code=400, detail=f"At most {settings.MAX_BATCH_FILES} files per upload")
+    if total_size > settings.MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=413, detail=f"Upload exceeds {settings.MAX_BATCH_SIZE / (1024*1024):.0f}MB limit"
+        )
+
+    # save the files to disk
+    saved = []
+    for filename, open_source in sources.items():
+        file_path = os.path.join(UPLOAD_DIR, filename)
+        try:
+            with open_source() as source, open(file_path, "wb") as f:
+                shutil.copyfileobj(source, f)
+        except Exception as e:
+            logger.error(f"Failed to save file {filename}: {e}")
+            raise HTTPException(status_code=500, detail=f"Failed to save {filename}")
+        # set initial status to pending (so frontend knows we got the file)
+        job_store.mark_pending(filename)
+        saved.append((file_path, filename))
+
+    # process all of them in one background task, so they share index commits
+    background_tasks.add_task(ingest_files_background, saved)
+
+    return {
+        "status": "accepted",
+        "filenames": [filename for _, filename in saved],
+        "skipped": skipped,
+        "message": f"{len(saved)} files received. Processing started."
+    }
+
+
+# checks the extension and size of an uploaded file and returns its size
+def _validate_upload(file: UploadFile) -> int:
     # validate file extension (case-insensitive)
     file_lower = file.filename.lower()
     file_ext = os.path.splitext(file_lower)[1]
@@ -128,52 +247,25 @@ async def ingest(background_tasks: BackgroundTasks, file: UploadFile = File(...)
     except Exception as e:
         logger.error(f"Error validating file size: {e}")
         raise HTTPException(status_code=400, detail="Invalid file")
+    return file_size
 
-    # save the uploaded file to disk
-    file_path = os.path.join(UPLOAD_DIR, file.filename)
-    try:
-        with open(file_path, "wb") as f:
-            shutil.copyfileobj(file.file, f)
-    except Exception as e:
-        logger.error(f"Failed to save file {file.filename}: {e}")
-        raise HTTPException(status_code=500, detail="Failed to save file")
-
-    # set initial status to pending (so frontend knows we got the file) - use lock for thread safety
-    with _status_lock:
-        if file.filename not in INGESTION_STATUS or INGESTION_STATUS[file.filename]["status"] not in ("pending", "processing"):
-            INGESTION_STATUS[file.filename] = {
-                "status": "pending",
-                "pages": 0,
-                "chunks": 0,
-                "error": None,
-            }
 
-    # start processing the PDF in the background so we can respond immediately
-    background_tasks.add_task(
-        ingest_background,
-        file_path,
-        file.filename
-    )
-
-    # tell the frontend we got the file and started processing
-    return {
-        "status": "accepted",
-        "filename": file.filename,
-        "message": "PDF upload received. Processing started."
-    }
+# the content of an uploaded file, rewound (closing it is left to FastAPI)
+@contextmanager
+def _upload_stream(file: UploadFile):
+    file.file.seek(0)
+    yield file.file
 
 
 # API endpoint to check the processing status of uploaded files
 @router.get("/status")
 async def ingest_status(filename: str | None = None):
-    # use lock to ensure consistent reads
-    with _status_lock:
-        # if a specific filename is given, return just that files status
-        if filename:
-            decoded = unquote(filename)
-            return INGESTION_STATUS.get(decoded, {"status": "not_found"})
-        # otherwise return all statuses (make a copy to avoid external modifications)
-        return dict(INGESTION_STATUS)
+    # if a specific filename is given, return just that files status
+    if filename:
+        decoded = unquote(filename)
+        return job_store.get_status(decoded) or {"status": "not_found"}
+    # otherwise return all statuses
+    return job_store.all_statuses()
 
 
 # API endpoint to delete a specific PDF
@@ -194,44 +286,42 @@ async def delete_pdf(background_tasks: BackgroundTasks, filename: str):
         logger.error(f"Failed to delete file {decoded_filename}: {e}")
         raise HTTPException(status_code=500, detail="Failed to delete file")
     
-    # remove it from our status tracking (with thread safety)
-    with _status_lock:
-        INGESTION_STATUS.pop(decoded_filename, None)
+    # remove it from our status tracking
+    job_store.remove(decoded_filename)
     
-    # rebuild the search database in the background (so the response is instant)
-    background_tasks.add_task(rebuild_vectorstore_background)
+    # update the search database in the background (so the response is instant)
+    background_tasks.add_task(reconcile_vectorstore_background)
 
-    # respond immediately - the database rebuild happens in background
+    # respond immediately - the database update happens in background
     return {"status": "deleted", "filename": decoded_filename}
 
 
 # API endpoint to delete ALL uploaded PDFs and reset everything
 @router.delete("/reset")
 async def reset_all_pdfs(background_tasks: BackgroundTasks):
-    # use locks for thread safety
-    with _vectorstore_lock:
-        # delete the entire uploads folder and recreate it empty
+    # delete the entire uploads folder and recreate it empty
+    try:
+        if os.path.exists(UPLOAD_DIR):
+            shutil.rmtree(UPLOAD_DIR)
+        os.makedirs(UPLOAD_DIR, exist_ok=True)
+    except Exception as e:
+        logger.error(f"Failed to reset uploads folder: {e}")
+        raise HTTPException(status_code=500, detail="Failed to reset uploads")
+
+    # clear all status tracking (for every worker)
+    job_store.clear()
+
+    # clean up the vector database in the background
+    # (the write lock waits for any running write; clear_vectorstore tells the other workers to drop their copy)
+    def cleanup_vectordb():
         try:
-            if os.path.exists(UPLOAD_DIR):
-                shutil.rmtree(UPLOAD_DIR)
-            os.makedirs(UPLOAD_DIR, exist_ok=True)
+            with vectorstore_write_lock():
+                clear_vectorstore()
+                text_store.clear()
+            logger.info("Vector DB cleared successfully")
         except Exception as e:
-            logger.error(f"Failed to reset uploads folder: {e}")
-            raise HTTPException(status_code=500, detail="Failed to reset uploads")
+            logger.error(f"Failed to clear vector DB: {e}")
 
-        # clear all status tracking
-        with _status_lock:
-            INGESTION_STATUS.clear()
-        
-        # clean up the vector database in the background
-        def cleanup_vectordb():
-            try:
-                if os.path.exists(settings.VECTOR_DB_PATH):
-                    shutil.rmtree(settings.VECTOR_DB_PATH)
-                    logger.info("Vector DB cleared successfully")
-            except Exception as e:
-                logger.error(f"Failed to clear vector DB: {e}")
-        
-        background_tasks.add_task(cleanup_vectordb)
+    background_tasks.add_task(cleanup_vectordb)
 
     return {"status": "reset", "message": "All PDFs and vector database cleared"}
\ No newline at end of file
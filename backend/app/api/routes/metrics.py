@@ -0,0 +1,13 @@
+# this file exposes the app's metrics for Prometheus (or anything that reads its text format)
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from app.core.metrics import REGISTRY
+
+# creating a router for the metrics endpoint
+router = APIRouter(tags=["Monitoring"])
+
+
+# returns every counter, gauge and histogram in the Prometheus text exposition format
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -1,20 +1,60 @@
 # this file handles the question-answering API endpoint
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 from app.api.schemas.qa import QARequest, QAResponse
 from app.services.rag_service import run_rag
-from app.vectorstore.faiss_store import load_vectorstore
+from app.vectorstore.faiss_store import get_vectorstore, index_signature
+import hashlib
+import json
 import os
 # importing settings separately as it might be used differently
 from app.core.config import settings
+from app.core.admission import ADMISSION, busy_error
+from app.core.cancellation import ClientDisconnected, cancel_on_disconnect, run_cancellable
+from app.core.deadline import request_deadline
+from app.core.single_flight import SingleFlight
+from app.core.tracing import span
 import logging
 
 logger = logging.getLogger(__name__)
 # creating a router for all QA related endpoints
 router = APIRouter(prefix="/qa", tags=["qa"])
 
+# identical questions asked at the same time share one retrieval and one Gemini call
+_qa_flights = SingleFlight("qa")
+
+
+# everything the answer depends on - requests with the same key get the same answer
+def _question_key(question: str, marks: int, syllabus_context: str, chat_history, signature) -> str:
+    payload = json.dumps(
+        [
+            question,
+            marks,
+            hashlib.sha256(syllabus_context.encode("utf-8")).hexdigest(),
+            chat_history or [],
+            signature,
+        ],
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# runs the pipeline and gives back the admission slot taken for it
+def _run_rag_admitted(*args):
+    try:
+        return run_rag(*args)
+    finally:
+        ADMISSION.leave_llm()
+
+
+def _admit_question():
+    if not ADMISSION.try_enter_llm():
+        raise busy_error("llm", "The server is busy answering other questions. Try again shortly.")
+
 # this endpoint receives a question and returns an AI-generated answer from the PDFs
 @router.post("/ask", response_model=QAResponse)
-async def ask_question(request: QARequest):
+async def ask_question(request: QARequest, http_request: Request):
+    # the answer has to be ready within REQUEST_TIMEOUT of now, the pipeline does less if needed
+    deadline = request_deadline(settings.REQUEST_TIMEOUT)
     try:
         # make sure the question is not empty
         if not request.question or not request.question.strip():
@@ -32,7 +72,7 @@ async def ask_question(request: QARequest):
         
         # enforce chat history limit
         if request.chat_history and len(request.chat_history) > settings.MAX_CHAT_HISTORY:
-            logger.warning(f"Chat history exceeds limit: {len(request.chat_history)} > {settings.MAX_CHAT_HISTORY}")
+            logger.warning("Chat history exceeds limit: %d > %d", len(request.chat_history), settings.MAX_CHAT_HISTORY)
             # truncate to most recent messages
             request.chat_history = request.chat_history[-settings.MAX_CHAT_HISTORY:]
         
@@ -45,18 +85,19 @@ async def ask_question(request: QARequest):
         
         # check if we even have any PDFs uploaded and processed
         if not os.path.exists(settings.VECTOR_DB_PATH):
-            logger.warning("Vectorstore not found at {}".format(settings.VECTOR_DB_PATH))
+            logger.warning("Vectorstore not found at %s", settings.VECTOR_DB_PATH)
             raise HTTPException(
                 status_code=400, 
                 detail="No documents uploaded yet. Please upload PDFs first."
             )
         
-        # try to load our search database
+        # get our search database (cached in memory, reloaded only when it changes)
         try:
-            vectorstore = load_vectorstore()
+            with span("load_vectorstore"):
+                signature = index_signature()
+                vectorstore = get_vectorstore()
         except Exception as e:
-            error_msg = f"Failed to load vectorstore: {str(e)}"
-            logger.error(error_msg)
+            logger.error("Failed to load vectorstore: %s", e)
             raise HTTPException(
                 status_code=500,
                 detail="Failed to load vectorstore. Please try re-uploading documents."
@@ -74,17 +115,31 @@ async def ask_question(request: QARequest):
         if request.chat_history:
             chat_history = [{"role": msg.role, "content": msg.content} for msg in request.chat_history]
         
-        # run the RAG pipeline to get the answer
+        # run the RAG pipeline to get the answer (in a worker thread, so the server keeps
+        # accepting requests - and joining an identical question that is already running).
+        # if the student closes the tab meanwhile, the pipeline stops at its next stage
+        question = request.question.strip()
+        syllabus_context = request.syllabus_context or ""
+        marks = request.marks or 3
         try:
-            result = run_rag(
-                question=request.question.strip(),
-                vectorstore=vectorstore,
-                syllabus_context=request.syllabus_context or "",
-                marks=request.marks or 3,
-                chat_history=chat_history
-            )
+            args = (question, vectorstore, syllabus_context, marks, chat_history, deadline)
+            if settings.QA_COALESCE_REQUESTS:
+                key = _question_key(question, marks, syllabus_context, chat_history, signature)
+                # only a new computation needs a slot, joining a running one is free
+                if not _qa_flights.is_running(key):
+                    _admit_question()
+                result, _ = await cancel_on_disconnect(http_request, _qa_flights.run(key, _run_rag_admitted, *args))
+            else:
+                _admit_question()
+                result = await cancel_on_disconnect(http_request, run_cancellable(_run_rag_admitted, *args))
+        except HTTPException:
+            raise
+        except ClientDisconnected:
+            logger.info("Client went away, stopped answering")
+            # nginx's code for "client closed request", nobody receives it but the logs show it
+            raise HTTPException(status_code=499, detail="Client closed request")
         except Exception as e:
-            logger.error(f"RAG pipeline error: {str(e)}")
+            logger.error("RAG pipeline error: %s", e)
             raise HTTPException(
                 status_code=500,
                 detail="Error processing your question. Please try again."
@@ -92,7 +147,7 @@ async def ask_question(request: QARequest):
         
         # if the RAG pipeline returned an error, pass it to the frontend
         if result.get("error"):
-            logger.warning(f"RAG pipeline error: {result.get('answer')}")
+            logger.warning("RAG pipeline error: %s", result.get("answer"))
             raise HTTPException(
                 status_code=400, 
                 detail=result.get("answer", "Error generating response")
@@ -102,14 +157,15 @@ async def ask_question(request: QARequest):
         return QAResponse(
             answer=result.get("answer", ""),
             pages=result.get("pages", []),
-            sources=result.get("sources", [])
+            sources=result.get("sources", []),
+            degradation=result.get("degradation", "full"),
         )
     except HTTPException:
         # re-raise HTTP exceptions as-is
         raise
     except Exception as e:
         # catch any unexpected errors and return a clean error message
-        logger.error(f"Unexpected error in ask_question: {str(e)}")
+        logger.error("Unexpected error in ask_question: %s", e)
         raise HTTPException(
             status_code=500, 
             detail="Internal server error. Please try again later."
@@ -2,10 +2,18 @@
 from pydantic import BaseModel, Field
 from typing import List, Optional
 
-# represents a source reference from a PDF (which page and what text was found)
+# a file and page where a piece of text was found
+class SourceRef(BaseModel):
+    source: str
+    page: int
+
+# represents a source reference from a PDF (which file and page, and what text was found)
 class Source(BaseModel):
+    source: str
     page: int
     text: str
+    # other files the same text was found in (near-duplicate chunks are indexed once)
+    also_in: List[SourceRef] = []
 
 # represents a single message in the chat history (either from user or AI)
 class ChatMessage(BaseModel):
@@ -41,3 +49,6 @@ class QAResponse(BaseModel):
     answer: str           # the AI-generated answer
     pages: List[str]      # list of page numbers where info was found
     sources: List[Source] # detailed source references for verification
+    # how much the pipeline was cut back to answer within REQUEST_TIMEOUT:
+    # full, reduced, minimal or extractive (passages from the documents, no Gemini answer)
+    degradation: str = "full"
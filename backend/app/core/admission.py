@@ -0,0 +1,141 @@
+# keeps bursts of requests from piling up unbounded work behind Gemini and the ingest pool
+#   rate limiting:     token buckets per client IP and for the whole server (-> 429)
+#   admission control: caps on questions in flight and on queued ingestion jobs (-> 503)
+# both answer with a Retry-After header so well-behaved clients back off instead of retrying at once
+# note: the buckets and in-flight counts are per worker process (uvicorn --workers N multiplies them)
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from fastapi import HTTPException
+
+from app.core.config import settings
+from app.core.metrics import counter, gauge_func
+
+REJECTED_REQUESTS_TOTAL = counter(
+    "http_requests_rejected_total", "Requests turned away by rate limiting or admission control", ["reason"]
+)
+
+# how long a client should wait when the server is busy (not a rate limit, so no exact answer)
+BUSY_RETRY_AFTER_SECONDS = {"llm": 5, "ingest": 30}
+# client buckets kept in memory at most (least recently seen clients are forgotten first)
+_MAX_CLIENTS = 10000
+
+
+class TokenBucket:
+    """Allows `rate` requests per second on average and bursts of up to `capacity`"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    # takes one token; returns 0 if allowed, otherwise the seconds until a token is available
+    def take(self, now: float) -> float:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """A token bucket per client plus one shared by all clients"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clients: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._global: Optional[TokenBucket] = None
+
+    # returns None if the request may go ahead, otherwise (reason, retry_after_seconds)
+    def check(self, client_id: str):
+        per_client = settings.RATE_LIMIT_PER_MINUTE
+        global_limit = settings.GLOBAL_RATE_LIMIT_PER_MINUTE
+        if per_client <= 0 and global_limit <= 0:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            if per_client > 0:
+                bucket = self._clients.get(client_id)
+                if bucket is None:
+                    bucket = TokenBucket(per_client / 60, max(1, settings.RATE_LIMIT_BURST))
+                    self._clients[client_id] = bucket
+                    if len(self._clients) > _MAX_CLIENTS:
+                        self._clients.popitem(last=False)
+                else:
+                    self._clients.move_to_end(client_id)
+                wait = bucket.take(now)
+                if wait:
+                    return "client_rate_limit", wait
+            if global_limit > 0:
+                if self._global is None:
+                    self._global = TokenBucket(global_limit / 60, max(1, settings.GLOBAL_RATE_LIMIT_BURST))
+                wait = self._global.take(now)
+                if wait:
+                    # give the client its token back, it was not served
+                    if per_client > 0:
+                        bucket.tokens = min(bucket.capacity, bucket.tokens + 1)
+                    return "global_rate_limit", wait
+        return None
+
+    def reset(self):
+        with self._lock:
+            self._clients.clear()
+            self._global = None
+
+
+class AdmissionController:
+    """Counts questions being answered (each ends in one LLM call) and refuses new ones above the cap"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight_llm = 0
+
+    @property
+    def inflight_llm(self) -> int:
+        return self._inflight_llm
+
+    def try_enter_llm(self) -> bool:
+        with self._lock:
+            limit = settings.MAX_INFLIGHT_LLM_REQUESTS
+            if limit > 0 and self._inflight_llm >= limit:
+                return False
+            self._inflight_llm += 1
+            return True
+
+    def leave_llm(self):
+        with self._lock:
+            self._inflight_llm -= 1
+
+    # new uploads are refused while too many ingestion jobs are waiting or running
+    # (a SQLite query: call it from a worker thread, not the event loop)
+    def ingest_queue_full(self) -> bool:
+        limit = settings.MAX_INGEST_QUEUE
+        if limit <= 0:
+            return False
+        from app.services import job_store
+        return job_store.count_in_progress() >= limit
+
+
+def retry_after_header(seconds: float) -> str:
+    return str(max(1, math.ceil(seconds)))
+
+
+# the error an endpoint raises when a cap is reached
+def busy_error(kind: str, detail: str) -> HTTPException:
+    REJECTED_REQUESTS_TOTAL.labels(reason=f"{kind}_busy").inc()
+    return HTTPException(
+        status_code=503, detail=detail,
+        headers={"Retry-After": retry_after_header(BUSY_RETRY_AFTER_SECONDS[kind])},
+    )
+
+
+# the limiter and controller the whole app uses
+RATE_LIMITER = RateLimiter()
+ADMISSION = AdmissionController()
+
+gauge_func("llm_inflight_requests", "Questions currently being answered", lambda: ADMISSION.inflight_llm)
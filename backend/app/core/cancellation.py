@@ -0,0 +1,93 @@
+# stops work nobody is waiting for any more. a request whose client goes away (tab closed,
+# connection dropped) stops waiting right away; the worker thread running its pipeline cannot be
+# killed, so it gets a cancel event (through a context variable, like the request trace) and
+# checks it between stages and while Gemini streams the answer, then stops with RequestCancelled
+import asyncio
+import contextvars
+import threading
+from typing import Callable, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from app.core.metrics import counter
+
+CLIENT_DISCONNECTS_TOTAL = counter(
+    "client_disconnects_total", "Requests whose client went away before the response was ready", ["path"]
+)
+CANCELLED_WORK_TOTAL = counter(
+    "cancelled_work_total", "Pipelines stopped early because nobody was waiting for their result", ["stage"]
+)
+
+# set when nobody waits for the work of this thread any more (None outside of cancellable work)
+_cancel_event: contextvars.ContextVar = contextvars.ContextVar("cancel_event", default=None)
+
+
+class RequestCancelled(Exception):
+    """Raised in a worker thread that stops because its result is no longer wanted"""
+
+
+class ClientDisconnected(Exception):
+    """The client went away while the request was being answered"""
+
+
+def current_cancel_event() -> Optional[threading.Event]:
+    return _cancel_event.get()
+
+
+# a checkpoint between two stages: raises RequestCancelled (and counts it) if the work was cancelled
+def check_cancelled(stage: str):
+    cancel = _cancel_event.get()
+    if cancel is not None and cancel.is_set():
+        CANCELLED_WORK_TOTAL.labels(stage=stage).inc()
+        raise RequestCancelled(f"cancelled before {stage}")
+
+
+# runs func in the threadpool with the cancel event visible to check_cancelled()
+async def run_in_thread(cancel: threading.Event, func: Callable, *args, **kwargs):
+    # this runs in a task of its own, so the variable is only set for that task (and its thread)
+    _cancel_event.set(cancel)
+    return await run_in_threadpool(func, *args, **kwargs)
+
+
+def _retrieve_error(task: asyncio.Task):
+    # mark the error as seen, there may be no one left to await the task
+    if not task.cancelled():
+        task.exception()
+
+
+# runs func in a worker thread; when the caller is cancelled the thread is told to stop at its next
+# checkpoint (the thread itself always runs, so whatever it holds is released in its finally blocks)
+async def run_cancellable(func: Callable, *args, **kwargs):
+    cancel = threading.Event()
+    task = asyncio.ensure_future(run_in_thread(cancel, func, *args, **kwargs))
+    task.add_done_callback(_retrieve_error)
+    try:
+        return await asyncio.shield(task)
+    except asyncio.CancelledError:
+        cancel.set()
+        raise
+
+
+# returns once the client of this request has disconnected (the body must have been read already)
+async def _client_gone(request):
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+# awaits work, cancelling it and raising ClientDisconnected if the client goes away first
+async def cancel_on_disconnect(request, work):
+    work = asyncio.ensure_future(work)
+    watcher = asyncio.ensure_future(_client_gone(request))
+    try:
+        await asyncio.wait({work, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        watcher.cancel()
+        cancelled = not work.done()
+        if cancelled:
+            work.cancel()
+    if cancelled:
+        CLIENT_DISCONNECTS_TOTAL.labels(path=request.url.path).inc()
+        raise ClientDisconnected()
+    return work.result()
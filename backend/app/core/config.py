@@ -14,6 +14,10 @@ class Settings:
     GEMINI_API_KEY: str = os.getenv("GEMINI_API_KEY")
     # where we store our vector database on disk
     VECTOR_DB_PATH: str = os.getenv("VECTOR_DB_PATH", "app/data/vector_db")
+    # extracted page text and chunks of every ingested file, so re-indexing skips PDF parsing (empty = off)
+    TEXT_STORE_PATH: str = os.getenv("TEXT_STORE_PATH", "app/data/text_store")
+    # small SQLite database with the ingestion status, shared by all worker processes
+    STATE_DB_PATH: str = os.getenv("STATE_DB_PATH", "app/data/state.db")
     
     # warn if API key is missing because nothing will work without it
     if not GEMINI_API_KEY:
@@ -23,8 +27,49 @@ class Settings:
     CHUNK_SIZE: int = int(os.getenv("CHUNK_SIZE", "1000"))
     # how much overlap between chunks so we dont lose context at boundaries
     CHUNK_OVERLAP: int = int(os.getenv("CHUNK_OVERLAP", "200"))
+    # ingestion embeds this many chunks at a time (memory per batch stays the same for any PDF size)
+    INGEST_EMBED_BATCH: int = int(os.getenv("INGEST_EMBED_BATCH", "64"))
+    # how many batches the PDF reader may get ahead of the embedder
+    INGEST_QUEUE_BATCHES: int = int(os.getenv("INGEST_QUEUE_BATCHES", "2"))
+    # a new index version goes live every this many chunks while a document is ingested (0 = only at the end)
+    INGEST_COMMIT_CHUNKS: int = int(os.getenv("INGEST_COMMIT_CHUNKS", "512"))
+    # the index writer waits this long for more uploads to finish before saving, so files
+    # uploaded together go live in one commit instead of one each
+    INDEX_COMMIT_WINDOW_MS: int = int(os.getenv("INDEX_COMMIT_WINDOW_MS", "250"))
+    # link near-duplicate chunks (same notes uploaded twice, slides copied from a book) to one indexed chunk
+    DEDUP_CHUNKS: bool = os.getenv("DEDUP_CHUNKS", "true").lower() == "true"
+    # chunks whose 64-bit SimHash differs in at most this many bits count as near-duplicates
+    DEDUP_MAX_HAMMING: int = int(os.getenv("DEDUP_MAX_HAMMING", "3"))
+    # how many files a reconcile of the uploads folder parses and embeds at the same time
+    RECONCILE_WORKERS: int = int(os.getenv("RECONCILE_WORKERS", "2"))
+    # how text is read from PDFs: pypdf (default), pdfplumber (slower, better layout) or pypdfium2 (fastest)
+    PDF_BACKEND: str = os.getenv("PDF_BACKEND", "pypdf").lower()
+    # the sentence-transformers model used to turn text into vectors
+    EMBEDDING_MODEL: str = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+    # how the embedding model runs: torch (default), torch-int8 (quantized) or onnx (ONNX Runtime)
+    EMBEDDING_BACKEND: str = os.getenv("EMBEDDING_BACKEND", "torch")
+    # how many chunks are embedded together in one forward pass
+    EMBEDDING_BATCH_SIZE: int = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+    # how vectors are stored in the index: flat (exact), sq-fp16, sq-int8 or pq (smallest)
+    VECTOR_INDEX_TYPE: str = os.getenv("VECTOR_INDEX_TYPE", "flat").lower()
+    # bytes per vector for the pq index (must divide the embedding size, 384 for MiniLM)
+    VECTOR_INDEX_PQ_M: int = int(os.getenv("VECTOR_INDEX_PQ_M", "48"))
+    # re-rank the top k * factor compressed results with exact vectors (0 = off, costs float32 memory)
+    VECTOR_INDEX_RERANK_FACTOR: int = int(os.getenv("VECTOR_INDEX_RERANK_FACTOR", "0"))
+    # split the index into this many shards (by document), saved separately and searched in parallel
+    VECTOR_INDEX_SHARDS: int = max(1, int(os.getenv("VECTOR_INDEX_SHARDS", "1")))
+    # memory-map the index file when loading it for search instead of reading it into memory
+    VECTOR_INDEX_MMAP: bool = os.getenv("VECTOR_INDEX_MMAP", "true").lower() == "true"
     # how many search results to return when looking for relevant content
     TOP_K: int = int(os.getenv("TOP_K", "8"))
+    # how the retriever searches: mmr (relevant and diverse) or similarity (most relevant only)
+    RETRIEVER_SEARCH_TYPE: str = os.getenv("RETRIEVER_SEARCH_TYPE", "mmr")
+    # chunks returned by the retriever (TOP_K only trims this list further)
+    RETRIEVER_K: int = int(os.getenv("RETRIEVER_K", "5"))
+    # candidates MMR looks at before picking the best RETRIEVER_K
+    RETRIEVER_FETCH_K: int = int(os.getenv("RETRIEVER_FETCH_K", "15"))
+    # MMR trade-off: 1.0 = only relevance, 0.0 = only diversity
+    RETRIEVER_LAMBDA_MULT: float = float(os.getenv("RETRIEVER_LAMBDA_MULT", "0.9"))
     
     # check if we are in development or production mode
     ENVIRONMENT: str = os.getenv("ENVIRONMENT", "development")
@@ -33,17 +78,62 @@ class Settings:
     
     # max file size for uploads is 50MB
     MAX_FILE_SIZE: int = 50 * 1024 * 1024
+    # a batch upload (several files, or zip archives of them) holds at most this many files
+    MAX_BATCH_FILES: int = int(os.getenv("MAX_BATCH_FILES", "50"))
+    # and at most 200MB of them in total
+    MAX_BATCH_SIZE: int = 200 * 1024 * 1024
     # PDF and DOCX files are allowed for upload (configuration now matches actual implementation)
     ALLOWED_FILE_TYPES: set = {"application/pdf", "application/vnd.openxmlformats-officedocument.wordprocessingml.document"}
     # whitelist for file extensions as additional validation layer
     ALLOWED_FILE_EXTENSIONS: set = {".pdf", ".docx"}
     
-    # request timeout for API calls (in seconds)
+    # time budget of a question (in seconds, 0 = none): when the full pipeline would not finish in
+    # time it does less (fewer MMR candidates, no re-ranking, shorter answers, in the end no Gemini call)
     REQUEST_TIMEOUT: int = int(os.getenv("REQUEST_TIMEOUT", "300"))
+    # first guess of how long a full-length Gemini answer takes, until this worker has timed some
+    LLM_EXPECTED_SECONDS: float = float(os.getenv("LLM_EXPECTED_SECONDS", "15"))
     # maximum chat history messages to keep in context (must be even number)
     MAX_CHAT_HISTORY: int = int(os.getenv("MAX_CHAT_HISTORY", "10"))
     # rate limiting: max requests per minute per IP (0 = disabled)
     RATE_LIMIT_PER_MINUTE: int = int(os.getenv("RATE_LIMIT_PER_MINUTE", "0"))
+    # how many requests one IP may send at once before the per-minute rate applies
+    RATE_LIMIT_BURST: int = int(os.getenv("RATE_LIMIT_BURST", "10"))
+    # max requests per minute for all clients together (0 = disabled)
+    GLOBAL_RATE_LIMIT_PER_MINUTE: int = int(os.getenv("GLOBAL_RATE_LIMIT_PER_MINUTE", "0"))
+    GLOBAL_RATE_LIMIT_BURST: int = int(os.getenv("GLOBAL_RATE_LIMIT_BURST", "50"))
+    # questions answered at the same time per worker, more get 503 + Retry-After (0 = no limit)
+    MAX_INFLIGHT_LLM_REQUESTS: int = int(os.getenv("MAX_INFLIGHT_LLM_REQUESTS", "8"))
+    # uploads are refused while this many files wait for or are being ingested (0 = no limit)
+    MAX_INGEST_QUEUE: int = int(os.getenv("MAX_INGEST_QUEUE", "20"))
+    # identical questions arriving while one is being answered wait for that answer instead of asking Gemini again
+    QA_COALESCE_REQUESTS: bool = os.getenv("QA_COALESCE_REQUESTS", "true").lower() == "true"
+    
+    # token for the /admin endpoints (profiling etc) - admin endpoints are disabled when empty
+    ADMIN_TOKEN: str = os.getenv("ADMIN_TOKEN", "")
+    # where on-demand profiles are written
+    PROFILE_DIR: str = os.getenv("PROFILE_DIR", "app/data/profiles")
+    
+    # memory budget per worker (MB) for the embedding model, the loaded index and its docstore (0 = none);
+    # over it, the least recently used of them is unloaded until a request needs it again
+    MEMORY_BUDGET_MB: int = int(os.getenv("MEMORY_BUDGET_MB", "0"))
+    # how often the budget is checked (also right after the index or the model is loaded)
+    MEMORY_CHECK_SECONDS: int = int(os.getenv("MEMORY_CHECK_SECONDS", "30"))
+    
+    # log records as one JSON object per line ("json") or as plain lines ("text")
+    LOG_FORMAT: str = os.getenv("LOG_FORMAT", "json").lower()
+    # default log level, and levels per module like "app.services.rag_service=WARNING,app.vectorstore=DEBUG"
+    # (the app logs every request itself, so uvicorn's access log is off by default)
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO").upper()
+    LOG_LEVELS: str = os.getenv("LOG_LEVELS", "uvicorn.access=WARNING")
+    # also write the log to this file (next to stderr)
+    LOG_FILE: str = os.getenv("LOG_FILE", "")
+    # records waiting for the log writer thread; when it is this far behind new ones are dropped (0 = no limit)
+    LOG_QUEUE_SIZE: int = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+    # preload the embedding model, vector index and Gemini model when the server starts
+    WARMUP_ON_STARTUP: bool = os.getenv("WARMUP_ON_STARTUP", "true").lower() == "true"
+    # when the server starts, index files added to / removed from the uploads folder while it was down
+    RECONCILE_ON_STARTUP: bool = os.getenv("RECONCILE_ON_STARTUP", "true").lower() == "true"
 
 # creating a single settings instance that the whole app uses
 settings = Settings()
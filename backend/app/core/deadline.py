@@ -0,0 +1,27 @@
+# the time budget of a request (REQUEST_TIMEOUT), handed down the pipeline so that each stage
+# can see how much of it is left and do less when the full version would not finish in time
+import time
+from typing import Optional
+
+
+class Deadline:
+    """The point in time a request has to be answered by"""
+
+    def __init__(self, seconds: float, started: Optional[float] = None):
+        self.expires = (started if started is not None else time.monotonic()) + seconds
+
+    # seconds left (negative once it passed)
+    def remaining(self) -> float:
+        return self.expires - time.monotonic()
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    # the same deadline, the given seconds earlier (to keep time back for what comes after a step)
+    def sooner(self, seconds: float) -> "Deadline":
+        return Deadline(self.expires - seconds - time.monotonic())
+
+
+# REQUEST_TIMEOUT from now, or None when it is switched off (0)
+def request_deadline(seconds: float) -> Optional[Deadline]:
+    return Deadline(seconds) if seconds > 0 else None
@@ -0,0 +1,97 @@
+# a lock that works across threads AND across worker processes (uvicorn --workers N)
+# it locks a small file on disk, so every process on the node sees the same lock
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class InterProcessLock:
+    """Exclusive lock shared by every thread and process that uses the same lock file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        # flock is per open file, so threads of one process also need a normal lock
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._file = None
+
+    def acquire(self):
+        self._thread_lock.acquire()
+        if self._depth == 0:
+            try:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                self._file = open(self.path, "a+")
+                if fcntl:
+                    fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+                else:
+                    self._file.seek(0)
+                    # LK_LOCK retries for ~10s before failing, so keep trying until we get it
+                    while True:
+                        try:
+                            msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)
+                            break
+                        except OSError:
+                            continue
+            except BaseException:
+                if self._file:
+                    self._file.close()
+                    self._file = None
+                self._thread_lock.release()
+                raise
+        self._depth += 1
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0:
+            try:
+                if fcntl:
+                    fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+                else:
+                    self._file.seek(0)
+                    msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+            finally:
+                self._file.close()
+                self._file = None
+        self._thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+
+# opens a lock file with a shared lock (many holders at once) and returns the open file;
+# close the file to let go. used by readers to say "i am using this folder"
+def hold_shared(path: str):
+    f = open(path, "a+")
+    if fcntl:
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_SH)
+        except BaseException:
+            f.close()
+            raise
+    # on Windows the open handle itself stops the folder from being deleted
+    return f
+
+
+# tries to take an exclusive lock on a lock file without waiting
+# returns the open file on success, None if someone holds a shared lock on it
+def try_hold_exclusive(path: str):
+    try:
+        f = open(path, "a+")
+    except OSError:
+        return None
+    if fcntl:
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return None
+    return f
@@ -0,0 +1,170 @@
+# logging for the whole app. request threads only put a record on a queue (stamped with the id of
+# the request that logged it); a background listener thread formats it and writes it, so a slow
+# stdout or log file never holds up a request. with LOG_FORMAT=json every record is one JSON
+# object per line, including the request id and whatever was passed in extra= (stage durations of
+# the request log, for example). when the queue is full new records are dropped and counted on
+# /metrics instead of waiting. levels are set per module with LOG_LEVELS (or /admin/logging)
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from app.core.config import settings
+from app.core.metrics import counter
+
+LOG_RECORDS_DROPPED_TOTAL = counter(
+    "log_records_dropped_total", "Log records dropped because the log writer thread was behind"
+)
+
+# id of the request being handled (None outside of requests, e.g. in background ingestion)
+_request_id: contextvars.ContextVar = contextvars.ContextVar("request_id", default=None)
+
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"
+
+# attributes every LogRecord has, anything else on a record came from extra=
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "request_id"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def set_request_id(request_id: str):
+    return _request_id.set(request_id)
+
+
+def reset_request_id(token):
+    _request_id.reset(token)
+
+
+def current_request_id() -> Optional[str]:
+    return _request_id.get()
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with the request id and the extra= fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            entry["request_id"] = request_id
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    # runs in the thread that logged: only stamps the request id. the message is formatted
+    # by the listener (the stock prepare() would format it here, in the request thread)
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        request_id = _request_id.get()
+        if request_id:
+            record.request_id = request_id
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED_TOTAL.inc()
+
+
+class _QueueListener(logging.handlers.QueueListener):
+    # on shutdown waits for room in a full queue instead of failing, so the last records get written
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+
+# "app.services.rag_service=WARNING,uvicorn.access=WARNING" -> {"app.services.rag_service": "WARNING", ...}
+def parse_levels(spec: str) -> Dict[str, str]:
+    levels = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        name, sep, level = item.partition("=")
+        if not sep or not name.strip():
+            raise ValueError(f"Invalid log level setting '{item.strip()}', expected module=LEVEL")
+        levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+# sets the level of each module's logger (its submodules follow unless they have their own)
+def set_levels(levels: Dict[str, str]):
+    for name, level in levels.items():
+        if not isinstance(logging.getLevelName(level), int):
+            raise ValueError(f"Unknown log level '{level}' for {name}")
+    for name, level in levels.items():
+        logging.getLogger(name).setLevel(level)
+
+
+# the loggers that have their own level, and the default level
+def log_levels() -> Dict[str, str]:
+    levels = {"root": logging.getLevelName(logging.getLogger().level)}
+    for name, logger in sorted(logging.root.manager.loggerDict.items()):
+        if isinstance(logger, logging.Logger) and logger.level != logging.NOTSET:
+            levels[name] = logging.getLevelName(logger.level)
+    return levels
+
+
+def _formatter() -> logging.Formatter:
+    if settings.LOG_FORMAT == "json":
+        return JsonFormatter()
+    return logging.Formatter(TEXT_FORMAT, defaults={"request_id": "-"})
+
+
+# routes every log record of this process through the queue to the writer thread (once per process)
+def setup_logging():
+    global _listener
+    if _listener is not None:
+        return
+    formatter = _formatter()
+    handlers = [logging.StreamHandler(sys.stderr)]
+    if settings.LOG_FILE:
+        # reopens the file when logrotate moves it away
+        handlers.append(logging.handlers.WatchedFileHandler(settings.LOG_FILE, encoding="utf-8"))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.Queue(maxsize=max(0, settings.LOG_QUEUE_SIZE))
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_QueueHandler(log_queue))
+    root.setLevel(settings.LOG_LEVEL)
+    # uvicorn writes its own logs through its own handlers, send them through the queue as well
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        logger = logging.getLogger(name)
+        logger.handlers.clear()
+        logger.propagate = True
+    set_levels(parse_levels(settings.LOG_LEVELS))
+
+    _listener = _QueueListener(log_queue, *handlers)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+# writes out what is still queued and stops the writer thread
+def stop_logging():
+    global _listener
+    if _listener is not None:
+        listener, _listener = _listener, None
+        listener.stop()
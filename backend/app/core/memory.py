@@ -0,0 +1,149 @@
+# keeps track of how much memory the big resident structures of this worker take (embedding
+# model, index vectors, docstore text, the index writer) and keeps their total under
+# MEMORY_BUDGET_MB by unloading what can be loaded again, least recently used first.
+# the modules that own a structure register it with track(); sizes are estimates (tensor and
+# vector bytes are exact, Python objects are sampled), which is enough to decide what to drop
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from app.core.config import settings
+from app.core.metrics import counter, gauge_func
+
+logger = logging.getLogger(__name__)
+
+MEMORY_EVICTIONS_TOTAL = counter(
+    "memory_evictions_total", "Resident structures unloaded to stay under the memory budget", ["structure"]
+)
+
+
+class _Tracked:
+    def __init__(self, size: Callable, unload: Optional[Callable], last_used: Optional[Callable]):
+        self.size = size
+        self.unload = unload
+        self.last_used = last_used
+
+
+# resident set size of this process from /proc (None where there is no /proc)
+def process_rss_bytes() -> Optional[int]:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class MemoryAccountant:
+    """Estimated bytes of each resident structure, and the budget they have to fit in"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tracked: Dict[str, _Tracked] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._wake = threading.Event()
+
+    # size() returns the bytes held right now (0 when not loaded, None when unknown);
+    # structures with unload() can be dropped and are loaded again on their next use
+    def track(self, name: str, size: Callable, unload: Callable = None, last_used: Callable = None):
+        with self._lock:
+            self._tracked[name] = _Tracked(size, unload, last_used)
+
+    def sizes(self) -> Dict[str, Optional[int]]:
+        with self._lock:
+            tracked = dict(self._tracked)
+        sizes = {}
+        for name, entry in tracked.items():
+            try:
+                sizes[name] = entry.size()
+            except Exception as e:
+                logger.warning(f"Could not estimate the memory of {name}: {e}")
+                sizes[name] = None
+        return sizes
+
+    def report(self) -> dict:
+        sizes = self.sizes()
+        now = time.monotonic()
+        structures = {}
+        for name, size in sizes.items():
+            entry = self._tracked[name]
+            last_used = entry.last_used() if entry.last_used else None
+            structures[name] = {
+                "bytes": size,
+                "evictable": entry.unload is not None,
+                "idle_seconds": round(now - last_used, 1) if last_used else None,
+            }
+        return {
+            "budget_bytes": settings.MEMORY_BUDGET_MB * 1024 * 1024,
+            "tracked_bytes": sum(size or 0 for size in sizes.values()),
+            "rss_bytes": process_rss_bytes(),
+            "structures": structures,
+        }
+
+    # unloads the least recently used structures until the tracked total fits the budget;
+    # returns the names that were unloaded
+    def enforce(self) -> list:
+        budget = settings.MEMORY_BUDGET_MB * 1024 * 1024
+        if budget <= 0:
+            return []
+        unloaded = []
+        while True:
+            sizes = self.sizes()
+            total = sum(size or 0 for size in sizes.values())
+            if total <= budget:
+                return unloaded
+            candidates = [
+                (entry.last_used() if entry.last_used else 0, name)
+                for name, entry in self._tracked.items()
+                if entry.unload is not None and sizes.get(name) and name not in unloaded
+            ]
+            if not candidates:
+                logger.warning(
+                    f"Resident memory ~{total / 2**20:.0f}MB is over the {settings.MEMORY_BUDGET_MB}MB budget "
+                    f"and nothing else can be unloaded"
+                )
+                return unloaded
+            _, name = min(candidates)
+            logger.info(
+                f"Resident memory ~{total / 2**20:.0f}MB is over the {settings.MEMORY_BUDGET_MB}MB budget, "
+                f"unloading {name} (~{sizes[name] / 2**20:.0f}MB)"
+            )
+            self._tracked[name].unload()
+            MEMORY_EVICTIONS_TOTAL.labels(structure=name).inc()
+            unloaded.append(name)
+
+    # asks the budget thread to check now (after something big was loaded)
+    def check_soon(self):
+        self._wake.set()
+
+    # checks the budget every MEMORY_CHECK_SECONDS (and when asked to) in a background thread
+    def start(self):
+        if settings.MEMORY_BUDGET_MB <= 0:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._loop, name="memory_budget", daemon=True)
+            self._thread.start()
+        logger.info(f"Keeping resident memory under {settings.MEMORY_BUDGET_MB}MB")
+
+    def _loop(self):
+        while True:
+            self._wake.wait(timeout=max(1, settings.MEMORY_CHECK_SECONDS))
+            self._wake.clear()
+            try:
+                self.enforce()
+            except Exception as e:
+                logger.error(f"Memory budget check failed: {e}")
+
+
+MEMORY = MemoryAccountant()
+
+
+def _sizes_by_structure():
+    return {(name,): size for name, size in MEMORY.sizes().items() if size is not None}
+
+
+gauge_func("memory_resident_bytes", "Estimated bytes of each resident structure", _sizes_by_structure, ["structure"])
+gauge_func("process_resident_bytes", "Resident set size of this worker", process_rss_bytes)
@@ -0,0 +1,282 @@
+# a small in-process metrics registry (counters, gauges, histograms)
+# rendered in the Prometheus text exposition format on /metrics
+# recording is a dict lookup, a bisect and a lock - cheap enough for the request hot path
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+# latency buckets in seconds, from 1ms (cache hits, ranking) up to 60s (slow Gemini answers)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    """Base class: a named metric with optional labels and one child per label combination"""
+
+    type_name = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        # metrics without labels have a single child used directly
+        if not self.labelnames:
+            self._default = self._new_child()
+
+    def labels(self, *values, **kwargs):
+        """Return the child for one combination of label values (created on first use)"""
+        if kwargs:
+            values = tuple(str(kwargs[n]) for n in self.labelnames)
+        else:
+            values = tuple(str(v) for v in values)
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _samples(self):
+        if not self.labelnames:
+            return [((), self._default)]
+        return list(self._children.items())
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type_name}"]
+        for values, child in self._samples():
+            lines.extend(child.render(self.name, self.labelnames, values))
+        return "\n".join(lines)
+
+
+class _CounterChild:
+    def __init__(self):
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+    def render(self, name, labelnames, values):
+        return [f"{name}{_format_labels(labelnames, values)} {_format_value(self._value)}"]
+
+
+class Counter(_Metric):
+    """A value that only goes up (requests served, errors, cache hits)"""
+
+    type_name = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self._default.inc(amount)
+
+
+class _GaugeChild(_CounterChild):
+    def set(self, value: float):
+        with self._lock:
+            self._value = value
+
+    def dec(self, amount: float = 1.0):
+        self.inc(-amount)
+
+
+class Gauge(_Metric):
+    """A value that goes up and down (in-flight requests, queue depth)"""
+
+    type_name = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float):
+        self._default.set(value)
+
+    def inc(self, amount: float = 1.0):
+        self._default.inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self._default.dec(amount)
+
+
+class GaugeFunc(_Metric):
+    """A gauge whose value is read from a callback only when /metrics is scraped
+
+    The callback returns a number, or a dict mapping label value tuples to numbers.
+    """
+
+    type_name = "gauge"
+
+    def __init__(self, name: str, help_text: str, func: Callable, labelnames: Sequence[str] = ()):
+        self._func = func
+        super().__init__(name, help_text, labelnames)
+
+    def _new_child(self):
+        return None
+
+    def _samples(self):
+        try:
+            value = self._func()
+        except Exception:
+            return []
+        if isinstance(value, dict):
+            return [(tuple(str(v) for v in k), val) for k, val in value.items()]
+        return [((), value)] if value is not None else []
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type_name}"]
+        for values, value in self._samples():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self._buckets = buckets
+        self._counts = [0] * (len(buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self._buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    @contextmanager
+    def time(self):
+        """Observe how long the with-block took, in seconds"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+    @property
+    def count(self) -> int:
+        return sum(self._counts)
+
+    @property
+    def sum(self) -> float:
+        return self._sum
+
+    def render(self, name, labelnames, values):
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip(list(self._buckets) + [float("inf")], counts):
+            cumulative += count
+            le = f'le="{_format_value(bound)}"'
+            lines.append(f"{name}_bucket{_format_labels(labelnames, values, le)} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(labelnames, values)} {_format_value(total)}")
+        lines.append(f"{name}_count{_format_labels(labelnames, values)} {cumulative}")
+        return lines
+
+
+class Histogram(_Metric):
+    """Counts observations (usually latencies in seconds) into fixed buckets"""
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self._buckets = tuple(sorted(buckets))
+        super().__init__(name, help_text, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self._buckets)
+
+    def observe(self, value: float):
+        self._default.observe(value)
+
+    def time(self):
+        return self._default.time()
+
+
+class Registry:
+    """Holds every metric so /metrics can render them all"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            # registering the same name twice returns the first one (safe on module reloads)
+            return self._metrics.setdefault(metric.name, metric)
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(m.render() for m in metrics) + "\n"
+
+
+# the registry the whole app uses
+REGISTRY = Registry()
+
+
+def counter(name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, help_text, labelnames))
+
+
+def gauge(name: str, help_text: str, labelnames: Sequence[str] = ()) -> Gauge:
+    return REGISTRY.register(Gauge(name, help_text, labelnames))
+
+
+def gauge_func(name: str, help_text: str, func: Callable, labelnames: Sequence[str] = ()) -> GaugeFunc:
+    return REGISTRY.register(GaugeFunc(name, help_text, func, labelnames))
+
+
+def histogram(name: str, help_text: str, labelnames: Sequence[str] = (),
+              buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, help_text, labelnames, buckets))
+
+
+# metrics shared by several modules are defined here so each has one owner
+RAG_STAGE_SECONDS = histogram(
+    "rag_stage_seconds", "Time spent in each stage of the RAG pipeline", ["stage"]
+)
+INGEST_STAGE_SECONDS = histogram(
+    "ingest_stage_seconds", "Time spent in each stage of document ingestion", ["stage"]
+)
+INGEST_DOCUMENTS_TOTAL = counter(
+    "ingest_documents_total", "Documents processed by ingestion", ["outcome"]
+)
+LLM_REQUESTS_TOTAL = counter(
+    "llm_requests_total", "Calls to the Gemini model", ["outcome"]
+)
+CACHE_REQUESTS_TOTAL = counter(
+    "cache_requests_total", "Lookups in in-memory caches", ["cache", "result"]
+)
@@ -0,0 +1,114 @@
+# an on-demand sampling profiler for a live worker
+# when started, a background thread snapshots every thread's Python stack every few milliseconds
+# until N more requests have finished, then writes the aggregated stacks to disk in "folded"
+# format (one "frame;frame;frame count" line per stack) that flamegraph.pl or speedscope can read
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+# turns a frame into "function (file.py:first_line)" so samples group per function
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """Samples all thread stacks while profiling is switched on"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._samples: Counter = Counter()
+        self._sample_count = 0
+        self._remaining = 0
+        self._interval = 0.005
+        self._output_dir = ""
+        self._started_at = 0.0
+        self.last_profile: Optional[str] = None
+
+    @property
+    def active(self) -> bool:
+        return self._thread is not None
+
+    def start(self, requests: int, interval_ms: float, output_dir: str) -> bool:
+        """Start profiling the next `requests` requests; returns False if already running"""
+        with self._lock:
+            if self._thread is not None:
+                return False
+            self._samples = Counter()
+            self._sample_count = 0
+            self._remaining = requests
+            self._interval = interval_ms / 1000
+            self._output_dir = output_dir
+            self._started_at = time.time()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._sample_loop, name="profiler", daemon=True)
+            self._thread.start()
+        logger.info(f"Profiling the next {requests} requests every {interval_ms}ms")
+        return True
+
+    def request_finished(self):
+        """Called by the middleware after every request; stops once enough were profiled"""
+        if self._thread is None:
+            return
+        with self._lock:
+            self._remaining -= 1
+            if self._remaining <= 0:
+                # the sampler thread writes the file itself so no request waits for the disk
+                self._stop.set()
+
+    def stop(self):
+        """Stop sampling early; the profile is written in the background"""
+        self._stop.set()
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                "active": self._thread is not None,
+                "remaining_requests": max(self._remaining, 0) if self._thread is not None else 0,
+                "samples": self._sample_count,
+                "last_profile": self.last_profile,
+            }
+
+    def _sample_loop(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self._interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                # folded stacks go from the outermost call to the innermost
+                self._samples[";".join(reversed(stack))] += 1
+                self._sample_count += 1
+        try:
+            self.last_profile = self._dump()
+        except Exception as e:
+            logger.error(f"Failed to write profile: {e}")
+        finally:
+            with self._lock:
+                self._thread = None
+
+    def _dump(self) -> str:
+        os.makedirs(self._output_dir, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(self._started_at))
+        path = os.path.join(self._output_dir, f"profile-{stamp}-{os.getpid()}.folded")
+        with open(path, "w") as f:
+            for stack, count in self._samples.most_common():
+                f.write(f"{stack} {count}\n")
+        logger.info(f"Wrote profile with {self._sample_count} samples to {path}")
+        return path
+
+
+# the profiler the whole process shares
+PROFILER = SamplingProfiler()
@@ -0,0 +1,76 @@
+# single-flight: when several requests need the exact same result at the same time,
+# only the first one computes it and the others wait for that computation and share it
+# (e.g. a whole class asking the same question within a few seconds -> one Gemini call)
+import asyncio
+import threading
+from typing import Callable, Dict, Tuple
+
+from app.core.cancellation import run_in_thread
+from app.core.metrics import counter, gauge_func
+
+SINGLE_FLIGHT_REQUESTS_TOTAL = counter(
+    "single_flight_requests_total",
+    "Requests that started a computation (leader) or joined one already running (follower)",
+    ["group", "role"],
+)
+
+
+class _Flight:
+    def __init__(self):
+        # set once every caller went away: the computation stops at its next checkpoint
+        self.cancel = threading.Event()
+        self.waiters = 0
+        self.task = None
+
+
+class SingleFlight:
+    """Runs a blocking function once per key among concurrent callers on the event loop"""
+
+    def __init__(self, group: str):
+        self.group = group
+        self._flights: Dict[str, _Flight] = {}
+        self._leaders = SINGLE_FLIGHT_REQUESTS_TOTAL.labels(group=group, role="leader")
+        self._followers = SINGLE_FLIGHT_REQUESTS_TOTAL.labels(group=group, role="follower")
+        gauge_func(
+            f"single_flight_{group}_in_progress", f"Distinct {group} computations running right now",
+            lambda: len(self._flights),
+        )
+
+    # is a computation for this key running right now (that a new caller would join)
+    def is_running(self, key: str) -> bool:
+        flight = self._flights.get(key)
+        return (
+            flight is not None
+            and not flight.cancel.is_set()
+            and flight.task.get_loop() is asyncio.get_running_loop()
+        )
+
+    # returns (result, shared) - shared is True when this caller joined another one's computation.
+    # the computation is cancelled (see app.core.cancellation) once none of its callers waits for it
+    async def run(self, key: str, func: Callable, *args, **kwargs) -> Tuple[object, bool]:
+        shared = self.is_running(key)
+        if shared:
+            flight = self._flights[key]
+            self._followers.inc()
+        else:
+            flight = _Flight()
+            # a task of its own, so a leader that gets cancelled doesnt cancel it for the followers
+            flight.task = asyncio.ensure_future(run_in_thread(flight.cancel, func, *args, **kwargs))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda done: self._finished(key, flight))
+            self._leaders.inc()
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task), shared
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # nobody will read the result
+                flight.cancel.set()
+
+    def _finished(self, key: str, flight: _Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        # mark the error as seen even if every waiter went away
+        if not flight.task.cancelled():
+            flight.task.exception()
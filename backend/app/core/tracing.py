@@ -0,0 +1,85 @@
+# request-scoped tracing: records how long each step of one request took
+# every request is traced (the stage durations go into its log record); the spans are only sent
+# back to the client when it asks for them (X-Debug-Trace: 1). outside a request span() is a no-op
+import contextvars
+import time
+import uuid
+from contextlib import contextmanager
+from typing import List, Optional
+
+# the trace of the request currently being handled (None when tracing is off)
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("current_trace", default=None)
+# name of the innermost open span, used to build nested names like "run_rag.retrieve"
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default="")
+
+
+class Trace:
+    """All spans recorded while handling one request"""
+
+    def __init__(self, trace_id: Optional[str] = None):
+        self.trace_id = trace_id or uuid.uuid4().hex[:16]
+        self.started = time.perf_counter()
+        self.spans: List[dict] = []
+
+    def add_span(self, name: str, started: float, ended: float):
+        """Record a finished span (times are time.perf_counter() values)"""
+        self.spans.append({
+            "name": name,
+            "start_ms": round((started - self.started) * 1000, 3),
+            "duration_ms": round((ended - started) * 1000, 3),
+        })
+
+    def server_timing(self) -> str:
+        """The spans as a Server-Timing header value (shown in browser dev tools)"""
+        return ", ".join(f"{s['name']};dur={s['duration_ms']}" for s in self.spans)
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "total_ms": round((time.perf_counter() - self.started) * 1000, 3),
+            "spans": list(self.spans),
+        }
+
+
+# starts tracing the current request and returns the trace plus a token to stop it again
+def start_trace(trace_id: Optional[str] = None):
+    trace = Trace(trace_id)
+    return trace, _current_trace.set(trace)
+
+
+def end_trace(token):
+    _current_trace.reset(token)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+# full name of a span opened now, nested under the span that is currently open
+def _qualified(name: str) -> str:
+    parent = _current_span.get()
+    return f"{parent}.{name}" if parent else name
+
+
+# times the with-block as a span of the current trace (does nothing if the request isnt traced)
+@contextmanager
+def span(name: str):
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    full_name = _qualified(name)
+    token = _current_span.set(full_name)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add_span(full_name, started, time.perf_counter())
+        _current_span.reset(token)
+
+
+# records an already-timed step (for code that measures with time.perf_counter itself)
+def record_span(name: str, started: float, ended: Optional[float] = None):
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_span(_qualified(name), started, ended if ended is not None else time.perf_counter())
@@ -3,12 +3,83 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.exceptions import RequestValidationError
 from fastapi.responses import JSONResponse
+from contextlib import asynccontextmanager
+from starlette.concurrency import run_in_threadpool
 # importing our API route handlers
-from app.api.routes import ingest, qa, syllabus
+from app.api.routes import admin, health, ingest, metrics, qa, syllabus
+from app.core.admission import (
+    ADMISSION, BUSY_RETRY_AFTER_SECONDS, RATE_LIMITER, REJECTED_REQUESTS_TOTAL, retry_after_header
+)
+from app.core.config import settings
+from app.core.logging import new_request_id, reset_request_id, set_request_id, setup_logging
+from app.core.memory import MEMORY
+from app.core.profiler import PROFILER
+from app.core.tracing import end_trace, start_trace
+from app.services.ingestion_service import start_reconcile
+from app.services.warmup_service import start_warmup
+import logging
 import os
+import time
+
+# all logging goes through the background writer thread from here on
+setup_logging()
+request_logger = logging.getLogger("app.requests")
+
+
+# runs when the server starts: warms up the slow components in the background
+# so the first questions after a deploy dont hit a cold model and index,
+# catches the index up with the uploads folder and starts the memory budget check
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if settings.WARMUP_ON_STARTUP:
+        start_warmup()
+    if settings.RECONCILE_ON_STARTUP:
+        start_reconcile()
+    MEMORY.start()
+    yield
+
 
 # creating the main FastAPI app with a title and version
-app = FastAPI(title="PDF RAG API", version="1.0.0")
+app = FastAPI(title="PDF RAG API", version="1.0.0", lifespan=lifespan)
+
+# requests that make the server do real work (reads, polling and preflights are never limited)
+_RATE_LIMITED_METHODS = ("POST", "DELETE")
+# the endpoints that queue an ingestion job
+# (questions are admitted in the qa route, where identical ones can share a slot)
+_INGEST_PATHS = ("/ingest/", "/ingest", "/ingest/batch")
+
+
+def _rejection(status_code: int, reason: str, detail: str, retry_after: float):
+    REJECTED_REQUESTS_TOTAL.labels(reason=reason).inc()
+    return JSONResponse(
+        status_code=status_code,
+        content={"detail": detail},
+        headers={"Retry-After": retry_after_header(retry_after)},
+    )
+
+
+# rate limiting (429) and load shedding (503) before any work is done
+# registered before CORS so that CORS (the later one) wraps it and rejections keep their CORS headers
+@app.middleware("http")
+async def admission_control(request, call_next):
+    path = request.url.path
+    if request.method not in _RATE_LIMITED_METHODS or path.startswith("/admin"):
+        return await call_next(request)
+
+    client_id = request.client.host if request.client else "unknown"
+    limited = RATE_LIMITER.check(client_id)
+    if limited:
+        reason, wait = limited
+        return _rejection(429, reason, "Too many requests. Please slow down.", wait)
+
+    if path in _INGEST_PATHS and request.method == "POST" and await run_in_threadpool(ADMISSION.ingest_queue_full):
+        return _rejection(
+            503, "ingest_queue_full", "Too many documents are being processed. Try again shortly.",
+            BUSY_RETRY_AFTER_SECONDS["ingest"],
+        )
+
+    return await call_next(request)
+
 
 # getting allowed origins from environment variable, defaults to localhost for development
 ALLOWED_ORIGINS = os.getenv("ALLOWED_ORIGINS", "http://localhost:5173").split(",")
@@ -21,11 +92,65 @@ app.add_middleware(
     # only allowing the HTTP methods we actually use
     allow_methods=["GET", "POST", "OPTIONS", "DELETE"],
     # only allowing headers our frontend sends
-    allow_headers=["Content-Type", "Authorization"],
+    allow_headers=["Content-Type", "Authorization", "X-Debug-Trace", "X-Request-ID"],
+    # let the browser read the request id, the trace headers and when to retry after a 429/503
+    expose_headers=["Server-Timing", "X-Trace-Id", "X-Request-ID", "Retry-After"],
     # browser caches preflight check for 10 minutes so it doesnt keep asking
     max_age=600,
 )
 
+# paths that dont count towards an on-demand profile (monitoring and admin calls)
+_UNPROFILED_PATHS = ("/metrics", "/ready", "/admin")
+# polled all the time by monitoring, so their request records are only logged at DEBUG
+_QUIET_PATHS = ("/metrics", "/ready")
+
+
+# logs one record per finished request with its status, duration and the duration of each stage
+def _log_request(request, status: int, trace):
+    level = logging.DEBUG if request.url.path.startswith(_QUIET_PATHS) else logging.INFO
+    if not request_logger.isEnabledFor(level):
+        return
+    stages = {}
+    for recorded in trace.spans:
+        stages[recorded["name"]] = round(stages.get(recorded["name"], 0) + recorded["duration_ms"], 3)
+    duration_ms = round((time.perf_counter() - trace.started) * 1000, 3)
+    request_logger.log(
+        level, "%s %s %s %.0fms", request.method, request.url.path, status, duration_ms,
+        extra={
+            "method": request.method, "path": request.url.path, "status": status,
+            "duration_ms": duration_ms, "stages": stages,
+        },
+    )
+
+
+# gives the request an id (the client's X-Request-ID or a new one) that its log records carry and
+# that goes back in X-Request-ID, traces it (the spans go back in a Server-Timing header when the
+# client sends X-Debug-Trace: 1), logs it, and lets the profiler count finished requests
+@app.middleware("http")
+async def trace_requests(request, call_next):
+    request_id = request.headers.get("x-request-id", "")[:64] or new_request_id()
+    request_token = set_request_id(request_id)
+    trace, token = start_trace(request_id)
+    try:
+        try:
+            response = await call_next(request)
+        except Exception:
+            _log_request(request, 500, trace)
+            raise
+        finally:
+            end_trace(token)
+        _log_request(request, response.status_code, trace)
+    finally:
+        reset_request_id(request_token)
+    response.headers["X-Request-ID"] = request_id
+    if request.headers.get("x-debug-trace") == "1":
+        response.headers["Server-Timing"] = trace.server_timing()
+        response.headers["X-Trace-Id"] = trace.trace_id
+    if PROFILER.active and not request.url.path.startswith(_UNPROFILED_PATHS):
+        PROFILER.request_finished()
+    return response
+
+
 # this handles bad request data and sends back a clean error message
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request, exc):
@@ -37,4 +162,7 @@ async def validation_exception_handler(request, exc):
 # registering all our API routes with the main app
 app.include_router(ingest.router)   # handles PDF upload and processing
 app.include_router(qa.router)       # handles question answering
-app.include_router(syllabus.router) # handles syllabus upload and parsing
\ No newline at end of file
+app.include_router(syllabus.router) # handles syllabus upload and parsing
+app.include_router(health.router)   # readiness check for the load balancer
+app.include_router(metrics.router)  # latency histograms and counters for monitoring
+app.include_router(admin.router)    # admin-only tools like the on-demand profiler
\ No newline at end of file
@@ -1,14 +1,25 @@
 # this splits big PDF text into smaller pieces that the AI can understand
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 from app.core.config import settings
 
-# takes in loaded PDF documents and splits them into smaller chunks
-def chunk_documents(documents):
+def _make_splitter():
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
     # the splitter breaks text at natural boundaries like paragraphs, sentences, etc
-    splitter = RecursiveCharacterTextSplitter(
+    return RecursiveCharacterTextSplitter(
         chunk_size=settings.CHUNK_SIZE,      # max size of each chunk (default 1000 chars)
         chunk_overlap=settings.CHUNK_OVERLAP, # overlap between chunks so context isnt lost
         separators=["\n\n", "\n", ".", " "]  # try splitting at paragraphs first, then lines, then sentences
     )
+
+
+# takes in loaded PDF documents and splits them into smaller chunks
+def chunk_documents(documents):
     # returns a list of smaller text chunks ready for embedding
-    return splitter.split_documents(documents)
+    return _make_splitter().split_documents(documents)
+
+
+# same chunks as chunk_documents, but yielded one document (page) at a time
+# so a big PDF never has to be held in memory as a whole
+def iter_chunks(documents):
+    splitter = _make_splitter()
+    for document in documents:
+        yield from splitter.split_documents([document])
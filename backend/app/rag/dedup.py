@@ -0,0 +1,80 @@
+# finds near-duplicate chunks (the same lecture notes uploaded twice, slides copied from a
+# textbook chapter) with SimHash: every chunk gets a 64-bit fingerprint, and chunks whose
+# fingerprints differ in at most DEDUP_MAX_HAMMING bits are treated as the same text.
+# lookups use banding: the fingerprint is cut into DEDUP_MAX_HAMMING + 1 bands, and two
+# fingerprints within that distance must agree on at least one band (pigeonhole)
+import hashlib
+import re
+from collections import defaultdict
+from typing import Dict, Optional, Set
+
+import numpy as np
+
+_BITS = 64
+_WORD = re.compile(r"\w+")
+# words per shingle (single words would make unrelated texts on one topic look alike)
+_SHINGLE = 3
+
+
+def _hash64(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+# 64-bit SimHash of a text over its lowercased 3-word shingles
+def simhash(text: str) -> int:
+    words = _WORD.findall(text.lower())
+    if len(words) < _SHINGLE:
+        shingles = [" ".join(words)]
+    else:
+        shingles = [" ".join(words[i:i + _SHINGLE]) for i in range(len(words) - _SHINGLE + 1)]
+    hashes = np.fromiter((_hash64(s) for s in shingles), dtype="<u8", count=len(shingles))
+    # one row of 64 bits per shingle (bit 0 first), then a majority vote per bit
+    bits = np.unpackbits(hashes.view(np.uint8).reshape(-1, 8), axis=1, bitorder="little")
+    votes = bits.sum(axis=0, dtype=np.int64) * 2 > len(shingles)
+    return int(np.packbits(votes, bitorder="little").view("<u8")[0])
+
+
+class NearDuplicateIndex:
+    """Fingerprints of the chunks in the index, searchable by Hamming distance"""
+
+    def __init__(self, max_distance: int):
+        self.max_distance = max(0, min(max_distance, 15))
+        bands = self.max_distance + 1
+        width = -(-_BITS // bands)
+        self._bands = [(start, (1 << min(width, _BITS - start)) - 1) for start in range(0, _BITS, width)]
+        self._buckets = [defaultdict(set) for _ in self._bands]
+        self._fingerprints: Dict[str, int] = {}
+
+    def __len__(self):
+        return len(self._fingerprints)
+
+    def _keys(self, fingerprint: int):
+        return [fingerprint >> start & mask for start, mask in self._bands]
+
+    # the id of an indexed chunk within max_distance bits of this fingerprint, or None
+    def find(self, fingerprint: int) -> Optional[str]:
+        candidates: Set[str] = set()
+        for buckets, key in zip(self._buckets, self._keys(fingerprint)):
+            candidates |= buckets.get(key, set())
+        best, best_distance = None, self.max_distance + 1
+        for chunk_id in candidates:
+            distance = (self._fingerprints[chunk_id] ^ fingerprint).bit_count()
+            if distance < best_distance or (distance == best_distance and best is not None and chunk_id < best):
+                best, best_distance = chunk_id, distance
+        return best
+
+    def add(self, chunk_id: str, fingerprint: int):
+        self._fingerprints[chunk_id] = fingerprint
+        for buckets, key in zip(self._buckets, self._keys(fingerprint)):
+            buckets[key].add(chunk_id)
+
+    def remove(self, chunk_id: str):
+        fingerprint = self._fingerprints.pop(chunk_id, None)
+        if fingerprint is None:
+            return
+        for buckets, key in zip(self._buckets, self._keys(fingerprint)):
+            bucket = buckets.get(key)
+            if bucket is not None:
+                bucket.discard(chunk_id)
+                if not bucket:
+                    del buckets[key]
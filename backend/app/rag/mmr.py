@@ -0,0 +1,100 @@
+# fast MMR (Maximal Marginal Relevance) search directly on the FAISS index
+# langchain's version reconstructs every candidate vector one by one and picks results in a
+# python loop, one query at a time. here FAISS returns the candidates and their vectors in one
+# call, and the selection is done with numpy for a whole batch of queries at once
+from typing import Any, List
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+
+# picks k candidates per query that are relevant to the query but not similar to each other
+#   query_vectors:     (batch, dim)
+#   candidate_vectors: (batch, fetch_k, dim)
+#   valid:             (batch, fetch_k) False for padding where FAISS found fewer candidates
+# returns (batch, k) positions into the candidate axis, -1 where there were not enough candidates
+def mmr_select(query_vectors: np.ndarray, candidate_vectors: np.ndarray, k: int,
+               lambda_mult: float = 0.5, valid: np.ndarray = None) -> np.ndarray:
+    batch, fetch_k, _ = candidate_vectors.shape
+    k = min(k, fetch_k)
+    queries = _normalize(query_vectors.astype(np.float32, copy=False))
+    candidates = _normalize(candidate_vectors.astype(np.float32, copy=False))
+
+    # query-candidate similarity is computed once (one batched matmul) and reused by every step
+    relevance = np.matmul(candidates, queries[:, :, None])[:, :, 0]
+
+    if valid is None:
+        valid = np.ones((batch, fetch_k), dtype=bool)
+    available = valid.copy()
+    rows = np.arange(batch)
+    selected = np.full((batch, k), -1, dtype=np.int64)
+    # highest similarity of each candidate to anything already selected
+    redundancy = np.full((batch, fetch_k), -np.inf, dtype=np.float32)
+
+    for step in range(k):
+        if step == 0:
+            scores = relevance.copy()
+        else:
+            scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[~available] = -np.inf
+        best = np.argmax(scores, axis=1)
+        has_pick = available[rows, best]
+        selected[has_pick, step] = best[has_pick]
+        available[rows[has_pick], best[has_pick]] = False
+        # only the similarity to the newly picked candidate is needed (k * fetch_k, not fetch_k^2)
+        picked = candidates[rows, best]
+        similarity = np.matmul(candidates, picked[:, :, None])[:, :, 0]
+        redundancy = np.where(has_pick[:, None], np.maximum(redundancy, similarity), redundancy)
+    return selected
+
+
+# runs MMR for a batch of already-embedded queries and returns the documents for each query
+def mmr_search_by_vectors(vectorstore, query_vectors, k: int = 5, fetch_k: int = 15,
+                          lambda_mult: float = 0.5) -> List[List[Document]]:
+    index = vectorstore.index
+    if index.ntotal == 0:
+        return [[] for _ in range(len(query_vectors))]
+    queries = np.ascontiguousarray(query_vectors, dtype=np.float32)
+    fetch_k = min(fetch_k, index.ntotal)
+
+    # one FAISS call returns the candidate ids and their vectors for every query
+    _, ids, vectors = index.search_and_reconstruct(queries, fetch_k)
+    picks = mmr_select(queries, vectors, k, lambda_mult, valid=ids >= 0)
+
+    results = []
+    for row_ids, row_picks in zip(ids, picks):
+        docs = []
+        for pick in row_picks:
+            if pick < 0:
+                break
+            doc_id = vectorstore.index_to_docstore_id[int(row_ids[pick])]
+            doc = vectorstore.docstore.search(doc_id)
+            if isinstance(doc, Document):
+                docs.append(doc)
+        results.append(docs)
+    return results
+
+
+class MMRRetriever(BaseRetriever):
+    """LangChain retriever that runs the vectorized MMR search above"""
+
+    vectorstore: Any
+    k: int = 5
+    fetch_k: int = 15
+    lambda_mult: float = 0.5
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        vector = self.vectorstore.embeddings.embed_query(query)
+        return mmr_search_by_vectors(self.vectorstore, [vector], self.k, self.fetch_k, self.lambda_mult)[0]
+
+    def search_batch(self, queries: List[str]) -> List[List[Document]]:
+        """Embed all queries in one forward pass and run MMR for all of them together"""
+        vectors = self.vectorstore.embeddings.embed_documents(queries)
+        return mmr_search_by_vectors(self.vectorstore, vectors, self.k, self.fetch_k, self.lambda_mult)
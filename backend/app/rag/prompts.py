@@ -1,20 +1,17 @@
-# importing the prompt template class from langchain
-from langchain_core.prompts import PromptTemplate
+# the prompt text sent to Gemini and a cached langchain template built from it
+from functools import lru_cache
 
-# this is the main prompt template that tells the AI how to answer questions
-# it gets filled in with the actual question, context from PDFs, chat history etc
-# Created once at module load time to avoid repeated instantiation
-RAG_PROMPT = PromptTemplate(
-    # these are the placeholders that get replaced with actual values
-    input_variables=[
-        "syllabus_context",  # what syllabus topics the student is studying
-        "context",           # relevant text extracted from uploaded PDFs
-        "question",          # the students actual question
-        "marks",             # how long the answer should be (3, 5, or 12 marks)
-        "chat_history"       # previous messages so AI remembers the conversation
-    ],
-    # the actual prompt text sent to Gemini AI
-    template="""You are an expert academic tutor. Answer ONLY from the provided study material.
+# these are the placeholders that get replaced with actual values
+RAG_INPUT_VARIABLES = [
+    "syllabus_context",  # what syllabus topics the student is studying
+    "context",           # relevant text extracted from uploaded PDFs
+    "question",          # the students actual question
+    "marks",             # how long the answer should be (3, 5, or 12 marks)
+    "chat_history"       # previous messages so AI remembers the conversation
+]
+
+# the actual prompt text sent to Gemini AI
+RAG_TEMPLATE = """You are an expert academic tutor. Answer ONLY from the provided study material.
 
 GUIDELINES:
 - Use information from the PDF content ONLY
@@ -40,4 +37,12 @@ PDF CONTENT:
 QUESTION: {question}
 ---
 ANSWER ({marks} MARKS):"""
-)
\ No newline at end of file
+
+
+# this is the main prompt template that tells the AI how to answer questions
+# it gets filled in with the actual question, context from PDFs, chat history etc
+# Created once on first use (langchain is slow to import, so not at module load)
+@lru_cache(maxsize=1)
+def get_rag_prompt():
+    from langchain_core.prompts import PromptTemplate
+    return PromptTemplate(input_variables=RAG_INPUT_VARIABLES, template=RAG_TEMPLATE)
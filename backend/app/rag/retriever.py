@@ -1,12 +1,25 @@
+from app.core.config import settings
+
+
 # this function creates a search tool that finds relevant content from our PDFs
-def get_retriever(vectorstore):
-    # using MMR (Maximal Marginal Relevance) search which gives us
-    # results that are both relevant AND diverse (not all saying the same thing)
-    return vectorstore.as_retriever(
-        search_type="mmr",
-        search_kwargs={
-            "k": 5,           # return top 5 most relevant chunks
-            "fetch_k": 15,    # look at 15 candidates before picking the best 5
-            "lambda_mult": 0.9  # 0.9 means we care more about relevance than diversity
-        }
-    )
+# any setting can be overridden per call (the retrieval evaluation sweeps them)
+def get_retriever(vectorstore, search_type=None, k=None, fetch_k=None, lambda_mult=None):
+    search_type = search_type or settings.RETRIEVER_SEARCH_TYPE
+    search_kwargs = {
+        # how many chunks to return
+        "k": k or settings.RETRIEVER_K,
+    }
+    if search_type == "mmr":
+        # using MMR (Maximal Marginal Relevance) search which gives us
+        # results that are both relevant AND diverse (not all saying the same thing)
+        # our numpy version works straight on the FAISS vectors (imported lazily, it needs langchain)
+        from app.rag.mmr import MMRRetriever
+        return MMRRetriever(
+            vectorstore=vectorstore,
+            k=search_kwargs["k"],
+            # how many candidates to look at before picking the best k
+            fetch_k=fetch_k or settings.RETRIEVER_FETCH_K,
+            # closer to 1 means we care more about relevance than diversity
+            lambda_mult=lambda_mult if lambda_mult is not None else settings.RETRIEVER_LAMBDA_MULT,
+        )
+    return vectorstore.as_retriever(search_type=search_type, search_kwargs=search_kwargs)
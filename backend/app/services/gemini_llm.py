@@ -1,10 +1,12 @@
 # this file handles all communication with Google's Gemini AI
-import google.generativeai as genai
 import warnings
 # Suppress the deprecation warning for google.generativeai
 warnings.filterwarnings("ignore", category=FutureWarning, module="google.generativeai")
 from functools import lru_cache
+from app.core.cancellation import RequestCancelled, check_cancelled, current_cancel_event
 from app.core.config import settings
+from app.core.metrics import LLM_REQUESTS_TOTAL
+from app.core.tracing import span
 import logging
 
 logger = logging.getLogger(__name__)
@@ -18,6 +20,8 @@ def get_working_model():
         raise RuntimeError("GEMINI_API_KEY is not configured")
     
     try:
+        # imported here because the Gemini SDK (grpc, protobuf) is slow to import
+        import google.generativeai as genai
         # connect to Gemini with our API key (don't log the actual key!)
         genai.configure(api_key=settings.GEMINI_API_KEY)
         logger.info("Gemini API configured")
@@ -36,7 +40,8 @@ def get_working_model():
 
 
 # this sends a prompt to Gemini and gets back the AI's response
-def generate_text(prompt: str, temperature: float = 0.3, max_tokens: int = 4096) -> str:
+# (timeout: seconds Gemini gets before the call fails, None = the SDK's default)
+def generate_text(prompt: str, temperature: float = 0.3, max_tokens: int = 4096, timeout: float = None) -> str:
     # make sure we got a valid prompt
     if not prompt or not isinstance(prompt, str):
         raise ValueError("Prompt must be a non-empty string")
@@ -46,7 +51,8 @@ def generate_text(prompt: str, temperature: float = 0.3, max_tokens: int = 4096)
     
     try:
         # get our cached Gemini model
-        model = get_working_model()
+        with span("get_model"):
+            model = get_working_model()
         
         # safety settings to filter harmful content (set to only block high-severity stuff)
         safety_settings = [
@@ -56,16 +62,27 @@ def generate_text(prompt: str, temperature: float = 0.3, max_tokens: int = 4096)
             {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_ONLY_HIGH"},
         ]
         
+        # when the answer may stop being wanted (the student went away), stream it so that
+        # generation can be stopped between chunks instead of running to the end
+        cancellable = current_cancel_event() is not None
+
         # send the prompt to Gemini and get the response
-        response = model.generate_content(
-            prompt,
-            safety_settings=safety_settings,
-            generation_config={
-                "temperature": temperature,      # lower = more focused and faster
-                "max_output_tokens": max_tokens,  # max length of the response
-                "candidate_count": 1,             # only generate one response for speed
-            }
-        )
+        with span("generate_content"):
+            response = model.generate_content(
+                prompt,
+                safety_settings=safety_settings,
+                generation_config={
+                    "temperature": temperature,      # lower = more focused and faster
+                    "max_output_tokens": max_tokens,  # max length of the response
+                    "candidate_count": 1,             # only generate one response for speed
+                },
+                stream=cancellable,
+                request_options={"timeout": timeout} if timeout is not None else None,
+            )
+            if cancellable:
+                # the chunks add up in response; leaving the loop early drops the stream
+                for _ in response:
+                    check_cancelled("llm_stream")
         
         # if the response is empty, something went wrong
         if not response or not response.text:
@@ -79,8 +96,13 @@ def generate_text(prompt: str, temperature: float = 0.3, max_tokens: int = 4096)
                 logger.warning(f"Response may be incomplete. Finish reason: {finish_reason}")
         
         # return the clean response text
+        LLM_REQUESTS_TOTAL.labels(outcome="success").inc()
         return response.text.strip()
     
+    except RequestCancelled:
+        LLM_REQUESTS_TOTAL.labels(outcome="cancelled").inc()
+        raise
     except Exception as e:
+        LLM_REQUESTS_TOTAL.labels(outcome="error").inc()
         logger.error(f"Error generating text: {str(e)}")
         raise
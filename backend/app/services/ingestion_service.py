@@ -1,16 +1,27 @@
 # this file handles loading and processing PDFs into searchable chunks
 import logging
 import os, shutil
-from langchain_community.document_loaders import PyPDFLoader
-from app.rag.chunking import chunk_documents
-from app.vectorstore.faiss_store import save_vectorstore
+from app.core.config import settings
+from app.rag.chunking import iter_chunks
+from app.services import text_store
+from app.services.pdf_extraction import extract_pages
+from app.vectorstore.faiss_store import (
+    VectorstoreWriter, active_vectorstore_path, clear_vectorstore, document_chunk_ids, embed_chunks,
+    index_settings, next_chunk_ids, read_manifest, vectorstore_write_lock,
+)
+from app.vectorstore.group_commit import INDEX_WRITER
+from app.core.metrics import INGEST_STAGE_SECONDS, counter
 from fastapi import UploadFile
+from concurrent.futures import Future
+import hashlib
 import threading
-
-# lock to prevent concurrent vectorstore modifications during ingestion
-_ingestion_lock = threading.Lock()
+import time
+import uuid
 
 logger = logging.getLogger(__name__)
+RECONCILE_FILES_TOTAL = counter(
+    "reconcile_files_total", "Upload files handled by reconcile, by what was done", ["action"]
+)
 # folder where all uploaded PDFs are stored
 UPLOAD_DIR = "app/data/uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
@@ -35,111 +46,360 @@ def ingest_pdf(input_source):
         raise TypeError("ingest_pdf expects UploadFile or file path")
 
     try:
-        logger.info(f"Loading PDF: {filename}")
-
-        # load the PDF based on its file type
-        if persistent_path.lower().endswith(".pdf"):
-            # use PyPDF to extract text from each page
-            loader = PyPDFLoader(persistent_path)
-            documents = loader.load()
-        elif persistent_path.lower().endswith(".docx"):
-            # for DOCX files, read all paragraphs and combine them
-            from docx import Document as DocxDocument
-            from langchain_core.documents import Document
-            doc = DocxDocument(persistent_path)
-            full_text = []
-            for para in doc.paragraphs:
-                if para.text.strip():
-                    full_text.append(para.text)
-            documents = [Document(page_content="\n".join(full_text), metadata={"source": persistent_path})]
-        else:
-            raise ValueError("Unsupported file format")
+        # waits until the index commit holding the file is live
+        entry = submit_document(persistent_path).result()
+    except Exception as e:
+        logger.error(f"Error processing PDF {filename}: {str(e)}")
+        raise
+    logger.info(f"Successfully ingested {filename}: {entry['pages']} pages, {entry['chunks']} chunks")
+
+    # return info about what we processed
+    return {
+        "status": "success",
+        "filename": filename,
+        "pages": entry["pages"],
+        "chunks": entry["chunks"],
+    }
 
+
+# reads, splits and embeds a file and hands it to the index writer, which saves it together with
+# the other files being ingested at the same time. returns a future that gets the file's manifest
+# entry (with "pages" and "chunks") once it is searchable
+def submit_document(path: str) -> Future:
+    filename = os.path.basename(path)
+    logger.info(f"Loading PDF: {filename}")
+    fingerprint = file_fingerprint(path)
+    entry = (read_manifest(active_vectorstore_path()) or {"documents": {}})["documents"].get(filename)
+    if entry and _same_file(entry, fingerprint):
+        # already indexed (e.g. by the startup reconcile), nothing to do
+        logger.info(f"{filename} is already indexed, skipping")
+        done = Future()
+        done.set_result(entry)
+        return done
+
+    # pages are read, split and embedded a batch at a time (a thread reads ahead into a
+    # small queue), so memory stays flat no matter how big the PDF is
+    stats = {"pages": 0, "chunks": 0}
+    document = INDEX_WRITER.begin(filename, fingerprint)
+    try:
+        batches = _chunk_batches(path, stats, fingerprint["sha256"])
+        for batch in _prefetch(batches, settings.INGEST_QUEUE_BATCHES):
+            document.add(batch, embed_chunks(batch))
         # make sure we actually got some text from the file
-        if not documents:
+        if not stats["pages"]:
             raise ValueError(f"PDF file '{filename}' is empty or unreadable - no text could be extracted")
+        if not stats["chunks"]:
+            raise ValueError("No chunks created from document")
+    except BaseException as e:
+        document.abort(e)
+        raise
+    return document.finish(stats["pages"])
 
-        total_pages = len(documents)
-        logger.info(f"Loaded {total_pages} pages from {filename}")
 
-        # split the documents into smaller chunks for better search results
-        chunks = chunk_documents(documents)
-        if not chunks:
-            raise ValueError("No chunks created from document")
-        logger.info(f"Created {len(chunks)} chunks")
+# size, modification time and content hash of a file (to notice when it changed)
+def file_fingerprint(path: str) -> dict:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest.hexdigest()}
 
-        # save the chunks to our vector database so they can be searched later (with thread safety)
-        save_vectorstore(chunks)
-        logger.info(f"Successfully ingested {filename}")
 
-        # return info about what we processed
-        return {
-            "status": "success",
-            "filename": filename,
-            "pages": total_pages,
-            "chunks": len(chunks),
-        }
+# is this file (path or fingerprint) the one a manifest entry describes
+# size + mtime are checked first, so unchanged files are never read
+def _same_file(entry: dict, path_or_fingerprint) -> bool:
+    if entry.get("partial"):
+        return False
+    if isinstance(path_or_fingerprint, str):
+        stat = os.stat(path_or_fingerprint)
+        if stat.st_size != entry["size"]:
+            return False
+        if stat.st_mtime_ns == entry["mtime_ns"]:
+            return True
+        path_or_fingerprint = file_fingerprint(path_or_fingerprint)
+    return path_or_fingerprint["sha256"] == entry["sha256"]
 
-    except Exception as e:
-        logger.error(f"Error processing PDF {filename}: {str(e)}")
-        raise
 
-# rebuilds the entire vector database from all remaining PDFs
-# this is called after deleting a PDF to keep the database accurate
-def rebuild_vectorstore_from_uploads():
-    from app.vectorstore.faiss_store import replace_vectorstore
-    from app.rag.chunking import chunk_documents
-    from app.core.config import settings
-    from langchain_community.document_loaders import PyPDFLoader
-    import os
-    import shutil
+# yields the pages of a PDF one at a time (a DOCX file is one document)
+def _iter_pages(path: str):
+    if path.lower().endswith(".pdf"):
+        # the text of each page comes from the PDF_BACKEND extractor
+        from langchain_core.documents import Document
+        for number, text in enumerate(extract_pages(path)):
+            yield Document(page_content=text, metadata={"source": path, "page": number})
+    elif path.lower().endswith(".docx"):
+        # for DOCX files, read all paragraphs and combine them
+        from docx import Document as DocxDocument
+        from langchain_core.documents import Document
+        doc = DocxDocument(path)
+        text = "\n".join(p.text for p in doc.paragraphs if p.text.strip())
+        yield Document(page_content=text, metadata={"source": path})
+    else:
+        raise ValueError("Unsupported file format")
+
 
-    uploads_dir = "app/data/uploads"
+# splits the pages into chunks and groups them into batches of INGEST_EMBED_BATCH
+# counts pages and chunks into stats, and times loading and chunking like before.
+# with the file's sha256 the text store is used: stored chunks are read back as they are,
+# stored pages are only split again, and a file parsed for the first time is stored
+def _chunk_batches(path: str, stats: dict, sha256: str = None):
+    batch_size = max(1, settings.INGEST_EMBED_BATCH)
+    load_seconds = 0.0
+    chunk_seconds = 0.0
+    batch = []
+    stored_chunks = text_store.read_chunks(sha256, path) if sha256 else None
+    if stored_chunks is not None:
+        stats["pages"] = text_store.page_count(sha256)
+        pages = iter(())
+    else:
+        pages = text_store.read_pages(sha256, path) if sha256 else None
+    pages_writer = chunks_writer = None
+    if pages is None:
+        pages = _iter_pages(path)
+        pages_writer = text_store.pages_writer(sha256) if sha256 else None
+    if stored_chunks is None and sha256:
+        chunks_writer = text_store.chunks_writer(sha256)
+    writers = [w for w in (pages_writer, chunks_writer) if w is not None]
+    try:
+        while True:
+            started = time.perf_counter()
+            page = next(pages, None)
+            load_seconds += time.perf_counter() - started
+            if page is None:
+                break
+            stats["pages"] += 1
+            if pages_writer:
+                pages_writer.write(page)
+            started = time.perf_counter()
+            chunks = list(iter_chunks([page]))
+            chunk_seconds += time.perf_counter() - started
+            if chunks_writer:
+                for chunk in chunks:
+                    chunks_writer.write(chunk)
+            stats["chunks"] += len(chunks)
+            batch.extend(chunks)
+            while len(batch) >= batch_size:
+                yield batch[:batch_size]
+                batch = batch[batch_size:]
+        if stored_chunks is not None:
+            while True:
+                started = time.perf_counter()
+                chunk = next(stored_chunks, None)
+                load_seconds += time.perf_counter() - started
+                if chunk is None:
+                    break
+                stats["chunks"] += 1
+                batch.append(chunk)
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+        # only a fully read file is stored (nothing is kept for an empty one)
+        if stats["pages"]:
+            while writers:
+                writers.pop(0).finish()
+    finally:
+        for writer in writers:
+            writer.abort()
+    INGEST_STAGE_SECONDS.labels(stage="load").observe(load_seconds)
+    INGEST_STAGE_SECONDS.labels(stage="chunk").observe(chunk_seconds)
+    if batch:
+        yield batch
 
-    # if no uploads folder exists, nothing to rebuild
-    if not os.path.exists(uploads_dir):
-        return
 
-    # find all PDF and DOCX files in the uploads folder
-    pdf_files = [
-        f for f in os.listdir(uploads_dir)
-        if f.lower().endswith(".pdf") or f.lower().endswith(".docx")
-    ]
-
-    # if all PDFs are deleted, clear the database and stop
-    if not pdf_files:
-        if os.path.exists(settings.VECTOR_DB_PATH):
-            shutil.rmtree(settings.VECTOR_DB_PATH)
-        logger.info("No PDFs remaining, vectorstore cleared")
+# runs a generator in a background thread and hands its items over through a queue of at most
+# maxsize items, so the producer can work ahead of the consumer but never by more than that
+def _prefetch(iterable, maxsize: int):
+    import queue
+    items = queue.Queue(maxsize=max(1, maxsize))
+    stop = threading.Event()
+    done = object()
+
+    def produce():
+        try:
+            for item in iterable:
+                while not stop.is_set():
+                    try:
+                        items.put(("item", item), timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if stop.is_set():
+                    return
+            items.put(("done", done))
+        except BaseException as e:
+            items.put(("error", e))
+
+    thread = threading.Thread(target=produce, name="ingest_reader", daemon=True)
+    thread.start()
+    try:
+        while True:
+            kind, value = items.get()
+            if kind == "done":
+                return
+            if kind == "error":
+                raise value
+            yield value
+    finally:
+        # the consumer stopped early (error or close), let the producer finish
+        stop.set()
+        while thread.is_alive():
+            try:
+                items.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        thread.join()
+
+
+# the PDF and DOCX files in the uploads folder: {filename: path}
+def _upload_files() -> dict:
+    if not os.path.exists(UPLOAD_DIR):
+        return {}
+    return {
+        name: os.path.join(UPLOAD_DIR, name)
+        for name in sorted(os.listdir(UPLOAD_DIR))
+        if name.lower().endswith((".pdf", ".docx")) and os.path.isfile(os.path.join(UPLOAD_DIR, name))
+    }
+
+
+# makes the vector database match the uploads folder: new and changed files are ingested
+# (several at once), files that are gone are dropped, unchanged files are not touched.
+# the index manifest remembers which chunks came from which file; without one (an index
+# from before manifests), or after a chunking / embedding model change, everything is rebuilt
+# (from the stored text, so PDFs are not parsed again). the result goes live in one commit
+def reconcile_uploads() -> dict:
+    summary = {"added": [], "updated": [], "removed": [], "unchanged": 0, "failed": {}}
+    started = time.perf_counter()
+    with vectorstore_write_lock():
+        files = _upload_files()
+        manifest = read_manifest(active_vectorstore_path())
+        rebuild = manifest is None or not manifest["complete"] or manifest.get("settings") != index_settings()
+        if rebuild and not files:
+            text_store.prune(())
+            if active_vectorstore_path() is not None:
+                clear_vectorstore()
+                logger.info("No PDFs remaining, vectorstore cleared")
+            return summary
+        if rebuild:
+            logger.info("Index has no complete manifest or other settings, rebuilding it from the uploads folder")
+
+        with VectorstoreWriter(replace=rebuild) as writer:
+            for filename in list(writer.documents):
+                if filename not in files:
+                    writer.remove_document(filename)
+                    summary["removed"].append(filename)
+            todo = []
+            for filename, path in files.items():
+                entry = writer.documents.get(filename)
+                if entry and _same_file(entry, path):
+                    summary["unchanged"] += 1
+                    continue
+                if entry:
+                    # the old version's chunks go first, or they stay in the index as orphans
+                    # (and the new chunks would be linked to them as near-duplicates)
+                    writer.remove_document(filename)
+                summary["updated" if entry else "added"].append(filename)
+                todo.append((filename, path))
+            _ingest_files_parallel(writer, todo, summary)
+            documents = dict(writer.documents)
+        # the stored text of files that are gone is not needed anymore
+        text_store.prune(entry["sha256"] for entry in documents.values())
+
+    _sync_job_statuses(summary, documents)
+    for action in ("added", "updated", "removed", "failed"):
+        RECONCILE_FILES_TOTAL.labels(action=action).inc(len(summary[action]))
+    RECONCILE_FILES_TOTAL.labels(action="unchanged").inc(summary["unchanged"])
+    logger.info(
+        f"Reconciled uploads in {time.perf_counter() - started:.1f}s: {len(summary['added'])} added, "
+        f"{len(summary['updated'])} updated, {len(summary['removed'])} removed, "
+        f"{summary['unchanged']} unchanged, {len(summary['failed'])} failed"
+    )
+    return summary
+
+
+# parses and embeds several files at once (RECONCILE_WORKERS threads) while this thread adds
+# the finished batches to the index; a file that fails is taken out again
+def _ingest_files_parallel(writer, todo: list, summary: dict):
+    import queue
+    from concurrent.futures import ThreadPoolExecutor
+    if not todo:
         return
+    workers = max(1, min(settings.RECONCILE_WORKERS, len(todo)))
+    results = queue.Queue(maxsize=max(1, settings.INGEST_QUEUE_BATCHES) * workers)
+    stop = threading.Event()
 
-    documents = []
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                results.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
 
-    # reload every remaining PDF
-    for filename in pdf_files:
+    def work(filename, path):
         try:
-            if filename.lower().endswith(".pdf"):
-                loader = PyPDFLoader(os.path.join(uploads_dir, filename))
-                documents.extend(loader.load())
-            elif filename.lower().endswith(".docx"):
-                # handle DOCX files during rebuild too
-                from docx import Document as DocxDocument
-                from langchain_core.documents import Document
-                path = os.path.join(uploads_dir, filename)
-                doc = DocxDocument(path)
-                text = "\n".join([p.text for p in doc.paragraphs if p.text.strip()])
-                documents.append(Document(page_content=text, metadata={"source": path}))
-            logger.info(f"Loaded {filename} for rebuild")
+            fingerprint = file_fingerprint(path)
+            stats = {"pages": 0, "chunks": 0}
+            for batch in _chunk_batches(path, stats, fingerprint["sha256"]):
+                if not put(("batch", filename, batch, writer.embed(batch))):
+                    return
+            if not stats["chunks"]:
+                raise ValueError(f"'{filename}' is empty or unreadable - no text could be extracted")
+            put(("done", filename, stats, fingerprint))
         except Exception as e:
-            logger.warning(f"Failed to load {filename}: {e}")
+            put(("error", filename, e, None))
 
-    # if nothing could be loaded, clear the database
-    if not documents:
-        if os.path.exists(settings.VECTOR_DB_PATH):
-            shutil.rmtree(settings.VECTOR_DB_PATH)
-        return
+    entries = {}
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="reconcile_") as pool:
+        for filename, path in todo:
+            pool.submit(work, filename, path)
+        try:
+            remaining = len(todo)
+            while remaining:
+                kind, filename, payload, extra = results.get()
+                if kind == "batch":
+                    entry = entries.setdefault(filename, {"doc_id": uuid.uuid4().hex, "chunks": 0})
+                    writer.add_embedded(payload, extra, next_chunk_ids(entry, len(payload)))
+                    continue
+                remaining -= 1
+                entry = entries.pop(filename, None)
+                if kind == "done":
+                    writer.record_document(filename, {**extra, **entry, "pages": payload["pages"]})
+                    logger.info(f"Reconciled {filename}: {payload['pages']} pages, {entry['chunks']} chunks")
+                else:
+                    if entry:
+                        writer.delete_ids(document_chunk_ids(entry))
+                    summary["failed"][filename] = str(payload)
+                    logger.warning(f"Failed to ingest {filename}: {payload}")
+        finally:
+            # lets workers blocked on a full queue give up if we stopped early
+            stop.set()
+    for action in ("added", "updated"):
+        summary[action] = [name for name in summary[action] if name not in summary["failed"]]
+
+
+# shows the result in the ingestion status the frontend polls
+def _sync_job_statuses(summary: dict, documents: dict):
+    from app.services import job_store
+    for filename in summary["removed"]:
+        job_store.remove(filename)
+    for filename, error in summary["failed"].items():
+        job_store.set_status(filename, "failed", error=error)
+    known = job_store.all_statuses()
+    for filename, entry in documents.items():
+        if filename in summary["added"] or filename in summary["updated"] or filename not in known:
+            job_store.set_status(filename, "completed", pages=entry["pages"], chunks=entry["chunks"])
+
+
+# runs reconcile_uploads once in the background (at startup), so the server starts right away
+def start_reconcile() -> threading.Thread:
+    def run():
+        try:
+            reconcile_uploads()
+        except Exception as e:
+            logger.error(f"Startup reconcile failed: {e}")
 
-    # split all documents into chunks and create a fresh database
-    chunks = chunk_documents(documents)
-    replace_vectorstore(chunks)
-    logger.info(f"Rebuilt vectorstore with {len(chunks)} chunks from {len(pdf_files)} PDFs")
+    thread = threading.Thread(target=run, name="reconcile", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,155 @@
+# this file keeps the ingestion status of every uploaded file in a small SQLite database
+# so all worker processes (uvicorn --workers N) see the same status, not just their own
+import os
+import sqlite3
+import time
+from typing import Dict, Optional
+from app.core.config import settings
+
+# the fields every status entry has (same shape the frontend always got)
+_FIELDS = ("status", "pages", "chunks", "error")
+# a pending/processing entry this old belongs to a worker that died, so it can be taken over
+# (longer than the 5 minute ingestion timeout)
+STALE_AFTER_SECONDS = 900
+
+
+# opens a short-lived connection (SQLite handles locking between processes itself)
+def _connect() -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(settings.STATE_DB_PATH) or ".", exist_ok=True)
+    conn = sqlite3.connect(settings.STATE_DB_PATH, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS ingestion_status ("
+        " filename TEXT PRIMARY KEY, status TEXT NOT NULL, pages INTEGER NOT NULL DEFAULT 0,"
+        " chunks INTEGER NOT NULL DEFAULT 0, error TEXT, updated_at REAL NOT NULL)"
+    )
+    return conn
+
+
+def _row_to_dict(row) -> Dict:
+    return dict(zip(_FIELDS, row))
+
+
+# returns the status of one file, or None if we never saw it
+def get_status(filename: str) -> Optional[Dict]:
+    conn = _connect()
+    try:
+        row = conn.execute(
+            "SELECT status, pages, chunks, error FROM ingestion_status WHERE filename = ?", (filename,)
+        ).fetchone()
+    finally:
+        conn.close()
+    return _row_to_dict(row) if row else None
+
+
+# returns {filename: status} for every file
+def all_statuses() -> Dict[str, Dict]:
+    conn = _connect()
+    try:
+        rows = conn.execute(
+            "SELECT filename, status, pages, chunks, error FROM ingestion_status ORDER BY updated_at"
+        ).fetchall()
+    finally:
+        conn.close()
+    return {row[0]: _row_to_dict(row[1:]) for row in rows}
+
+
+# creates or overwrites the status of a file
+def set_status(filename: str, status: str, pages: int = 0, chunks: int = 0, error: Optional[str] = None):
+    conn = _connect()
+    try:
+        conn.execute(
+            "INSERT INTO ingestion_status (filename, status, pages, chunks, error, updated_at)"
+            " VALUES (?, ?, ?, ?, ?, ?)"
+            " ON CONFLICT(filename) DO UPDATE SET status = excluded.status, pages = excluded.pages,"
+            " chunks = excluded.chunks, error = excluded.error, updated_at = excluded.updated_at",
+            (filename, status, pages, chunks, error, time.time()),
+        )
+    finally:
+        conn.close()
+
+
+# updates some fields of an existing status (does nothing if the file was deleted meanwhile)
+def update_status(filename: str, **fields):
+    fields = {k: v for k, v in fields.items() if k in _FIELDS}
+    if not fields:
+        return
+    assignments = ", ".join(f"{name} = ?" for name in fields)
+    conn = _connect()
+    try:
+        conn.execute(
+            f"UPDATE ingestion_status SET {assignments}, updated_at = ? WHERE filename = ?",
+            (*fields.values(), time.time(), filename),
+        )
+    finally:
+        conn.close()
+
+
+# sets a file to "pending" unless some worker already queued or is processing it
+def mark_pending(filename: str):
+    conn = _connect()
+    try:
+        conn.execute(
+            "INSERT INTO ingestion_status (filename, status, updated_at) VALUES (?, 'pending', ?)"
+            " ON CONFLICT(filename) DO UPDATE SET status = 'pending', pages = 0, chunks = 0, error = NULL,"
+            " updated_at = excluded.updated_at"
+            " WHERE status NOT IN ('pending', 'processing') OR updated_at < ?",
+            (filename, time.time(), time.time() - STALE_AFTER_SECONDS),
+        )
+    finally:
+        conn.close()
+
+
+# atomically marks a file as "processing"; returns False if another worker already is
+def claim(filename: str) -> bool:
+    conn = _connect()
+    try:
+        cursor = conn.execute(
+            "INSERT INTO ingestion_status (filename, status, updated_at) VALUES (?, 'processing', ?)"
+            " ON CONFLICT(filename) DO UPDATE SET status = 'processing', pages = 0, chunks = 0, error = NULL,"
+            " updated_at = excluded.updated_at WHERE status != 'processing' OR updated_at < ?",
+            (filename, time.time(), time.time() - STALE_AFTER_SECONDS),
+        )
+        return cursor.rowcount == 1
+    finally:
+        conn.close()
+
+
+def remove(filename: str):
+    conn = _connect()
+    try:
+        conn.execute("DELETE FROM ingestion_status WHERE filename = ?", (filename,))
+    finally:
+        conn.close()
+
+
+def clear():
+    conn = _connect()
+    try:
+        conn.execute("DELETE FROM ingestion_status")
+    finally:
+        conn.close()
+
+
+# how many files are in each status (for the metrics endpoint)
+def count_by_status() -> Dict[str, int]:
+    conn = _connect()
+    try:
+        rows = conn.execute("SELECT status, COUNT(*) FROM ingestion_status GROUP BY status").fetchall()
+    finally:
+        conn.close()
+    return dict(rows)
+
+
+# how many files are waiting for or being ingested right now; entries left behind by a worker
+# that died (older than STALE_AFTER_SECONDS) never finish, so they do not count
+def count_in_progress() -> int:
+    conn = _connect()
+    try:
+        (count,) = conn.execute(
+            "SELECT COUNT(*) FROM ingestion_status WHERE status IN ('pending', 'processing') AND updated_at >= ?",
+            (time.time() - STALE_AFTER_SECONDS,),
+        ).fetchone()
+    finally:
+        conn.close()
+    return count
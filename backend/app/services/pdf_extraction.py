@@ -0,0 +1,69 @@
+# turns the pages of a PDF into text. there are a few backends with different speed and quality,
+# picked with PDF_BACKEND (python -m benchmarks.pdf_extract compares them on your own files):
+#   pypdf      - pure Python, what ingestion always used (through PyPDFLoader), the default
+#   pdfplumber - pdfminer.six layout analysis: slowest, keeps columns and table cells apart best
+#   pypdfium2  - Chrome's PDFium (C++): several times faster than pypdf
+# ingestion and syllabus parsing both read PDFs through extract_pages()
+import logging
+import threading
+from typing import Iterator
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+PDF_BACKENDS = ("pypdf", "pdfplumber", "pypdfium2")
+
+# PDFium is not thread-safe, so only one thread at a time may call into it
+_pdfium_lock = threading.Lock()
+
+
+def _pypdf_pages(path: str) -> Iterator[str]:
+    from pypdf import PdfReader
+    reader = PdfReader(path)
+    for page in reader.pages:
+        yield (page.extract_text() or "").strip()
+
+
+def _pdfplumber_pages(path: str) -> Iterator[str]:
+    import pdfplumber
+    with pdfplumber.open(path) as pdf:
+        for page in pdf.pages:
+            text = (page.extract_text() or "").strip()
+            # drops the parsed layout of the page, so memory stays flat on long PDFs
+            page.close()
+            yield text
+
+
+def _pypdfium2_pages(path: str) -> Iterator[str]:
+    import pypdfium2
+    with _pdfium_lock:
+        pdf = pypdfium2.PdfDocument(path)
+        count = len(pdf)
+    try:
+        for number in range(count):
+            with _pdfium_lock:
+                page = pdf[number]
+                textpage = page.get_textpage()
+                text = textpage.get_text_range()
+                textpage.close()
+                page.close()
+            yield text.replace("\r\n", "\n").replace("\r", "\n").strip()
+    finally:
+        with _pdfium_lock:
+            pdf.close()
+
+
+_EXTRACTORS = {
+    "pypdf": _pypdf_pages,
+    "pdfplumber": _pdfplumber_pages,
+    "pypdfium2": _pypdfium2_pages,
+}
+
+
+# the text of each page of a PDF (stripped), one page at a time; PDF_BACKEND unless a backend is given
+def extract_pages(path: str, backend: str = None) -> Iterator[str]:
+    backend = (backend or settings.PDF_BACKEND or "pypdf").lower()
+    if backend not in _EXTRACTORS:
+        raise ValueError(f"Unknown PDF backend '{backend}'. Choose one of: {', '.join(PDF_BACKENDS)}")
+    return _EXTRACTORS[backend](path)
@@ -1,14 +1,83 @@
 # this is the main RAG (Retrieval Augmented Generation) pipeline
 # it finds relevant content from PDFs and uses AI to answer questions
-from app.rag.prompts import RAG_PROMPT
+from app.rag.prompts import get_rag_prompt
 from app.rag.retriever import get_retriever
 from app.services.gemini_llm import generate_text
+from app.core.cancellation import RequestCancelled, check_cancelled
 from app.core.config import settings
+from app.core.deadline import Deadline
+from app.core.metrics import RAG_STAGE_SECONDS, counter
+from app.core.tracing import record_span, span
 import re
+import time
 import logging
 
 logger = logging.getLogger(__name__)
 
+# one latency histogram per pipeline stage (looked up once here, not on every request)
+_STAGE_TIMERS = {
+    stage: RAG_STAGE_SECONDS.labels(stage=stage)
+    for stage in ("retrieve", "rank", "context", "history", "prompt", "llm")
+}
+
+
+# records a finished stage in its latency histogram and in the request trace (if any)
+def _finish_stage(stage: str, started: float):
+    ended = time.perf_counter()
+    _STAGE_TIMERS[stage].observe(ended - started)
+    record_span(stage, started, ended)
+
+
+RAG_ANSWERS_TOTAL = counter("rag_answers_total", "Answers by how much the pipeline was cut back to meet the deadline", ["degradation"])
+
+# what the pipeline does at each level, from everything down to answering without Gemini.
+# a question gets the first level whose expected time fits in what is left of its deadline:
+#   fetch_k - MMR candidates (None = RETRIEVER_FETCH_K, 0 = only the k it returns)
+#   rerank  - re-rank the retrieved chunks by keyword overlap
+#   max_tokens - cap on the length of Gemini's answer (long answers are what make a call slow)
+DEGRADATION_LEVELS = {
+    "full": {"fetch_k": None, "rerank": True, "max_tokens": 4096},
+    "reduced": {"fetch_k": settings.RETRIEVER_FETCH_K // 2, "rerank": True, "max_tokens": 2048},
+    "minimal": {"fetch_k": 0, "rerank": False, "max_tokens": 1024},
+    # the most relevant sentences of the retrieved chunks, no Gemini call
+    "extractive": {"fetch_k": 0, "rerank": False, "max_tokens": 0},
+}
+# kept back from the deadline for building the response (and the extractive answer if Gemini times out)
+_RESPONSE_SECONDS = 0.5
+
+
+class _Estimate:
+    """Moving average of how long a step takes, starting from a guess until it has been timed"""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+
+    def observe(self, seconds: float):
+        self.seconds += 0.2 * (seconds - self.seconds)
+
+
+# retrieval, ranking and building the prompt together; and a Gemini call at each level
+_RETRIEVAL_ESTIMATE = _Estimate(0.5)
+_LLM_ESTIMATES = {
+    level: _Estimate(settings.LLM_EXPECTED_SECONDS * plan["max_tokens"] / 4096)
+    for level, plan in DEGRADATION_LEVELS.items()
+    if plan["max_tokens"]
+}
+
+
+# the least degraded level (never less degraded than `at_least`) expected to finish before the deadline
+def choose_degradation(deadline: Deadline, retrieval_done: bool, at_least: str = "full") -> str:
+    levels = list(DEGRADATION_LEVELS)
+    if deadline is None:
+        return at_least
+    remaining = deadline.remaining() - _RESPONSE_SECONDS
+    if not retrieval_done:
+        remaining -= _RETRIEVAL_ESTIMATE.seconds
+    for level in levels[levels.index(at_least):]:
+        if level == "extractive" or _LLM_ESTIMATES[level].seconds <= remaining:
+            return level
+    return "extractive"
+
 
 # pulls out important words from a piece of text
 def extract_keywords(text: str) -> set:
@@ -52,10 +121,66 @@ def rank_documents(docs: list, question: str) -> list:
     return [doc for doc, _ in scored_docs]
 
 
+# (file name, page) of a chunk, then of every near-duplicate linked to it at ingest
+def _citations(doc) -> list:
+    citations = []
+    for metadata in [doc.metadata] + [ref["metadata"] for ref in doc.metadata.get("duplicates", ())]:
+        source_file = metadata.get("source", "Unknown")
+        # get just the filename, not the full path
+        if isinstance(source_file, str):
+            source_file = source_file.split("/")[-1].split("\\")[-1]
+        citations.append((source_file, metadata.get("page", "N/A")))
+    return citations
+
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+_LEADING_SYMBOLS = re.compile(r"^[^\w(\"']+")
+
+
+# an answer made of the sentences of the chunks that share the most words with the question,
+# in the order of the sources, for when there is no time left to ask Gemini
+def extractive_answer(question: str, docs: list, marks: int) -> str:
+    question_keywords = extract_keywords(question)
+    sentences = []
+    for number, doc in enumerate(docs, 1):
+        for sentence in _SENTENCE_END.split(doc.page_content):
+            # one line, without the bullet glyphs slides start lines with
+            sentence = _LEADING_SYMBOLS.sub("", " ".join(sentence.split()))
+            if len(sentence) >= 20:
+                sentences.append((len(sentences), number, sentence))
+    # roughly one sentence per mark, between 3 and 10
+    picked = sorted(
+        sentences, key=lambda s: (-semantic_similarity_score(s[2], question_keywords), s[0])
+    )[:max(3, min(marks, 10))]
+    lines = [f"- {sentence} [Source {number}]" for _, number, sentence in sorted(picked)]
+    return (
+        "There was not enough time to write a full answer, so here are the most relevant "
+        "passages from your documents:\n\n" + "\n".join(lines)
+    )
+
+
 # this is the main function that answers a student's question using their uploaded PDFs
-def run_rag(question: str, vectorstore, syllabus_context: str = "", marks: int = 3, chat_history: list = None):
-    # create a search tool from our vector database
-    retriever = get_retriever(vectorstore)
+# with a deadline, stages are cut back when the full pipeline would not finish in time
+# (the level used is returned as "degradation")
+def run_rag(question: str, vectorstore, syllabus_context: str = "", marks: int = 3, chat_history: list = None,
+            deadline: Deadline = None):
+    # every stage below shows up as run_rag.<stage> in the request trace
+    with span("run_rag"):
+        result = _run_rag(question, vectorstore, syllabus_context, marks, chat_history, deadline)
+    if not result.get("error"):
+        RAG_ANSWERS_TOTAL.labels(degradation=result["degradation"]).inc()
+    return result
+
+
+def _run_rag(question: str, vectorstore, syllabus_context: str, marks: int, chat_history: list,
+             deadline: Deadline):
+    level = choose_degradation(deadline, retrieval_done=False)
+    plan = DEGRADATION_LEVELS[level]
+    retrieval_started = time.perf_counter()
+
+    # create a search tool from our vector database (fewer MMR candidates when short on time)
+    fetch_k = plan["fetch_k"]
+    retriever = get_retriever(vectorstore, fetch_k=None if fetch_k is None else max(fetch_k, settings.RETRIEVER_K))
 
     # STEP 1: search for relevant content in the uploaded PDFs
     # if syllabus is provided, add a hint from it to improve search results
@@ -63,8 +188,11 @@ def run_rag(question: str, vectorstore, syllabus_context: str = "", marks: int =
     if syllabus_context and len(syllabus_context) > 20:
         search_query = f"{syllabus_context[:100]} {question}"
     
-    # run the actual search
+    # run the actual search (unless the student went away while the request waited for a thread)
+    check_cancelled("retrieve")
+    started = time.perf_counter()
     docs = retriever.invoke(search_query)
+    _finish_stage("retrieve", started)
 
     # if nothing was found, tell the student
     if not docs:
@@ -75,8 +203,11 @@ def run_rag(question: str, vectorstore, syllabus_context: str = "", marks: int =
             "error": True
         }
 
-    # STEP 2: re-rank the results so the best matches come first
-    ranked_docs = rank_documents(docs, question)
+    # STEP 2: re-rank the results so the best matches come first (MMR order when short on time)
+    check_cancelled("rank")
+    started = time.perf_counter()
+    ranked_docs = rank_documents(docs, question) if plan["rerank"] else docs
+    _finish_stage("rank", started)
     if not ranked_docs:
         return {
             "answer": f"I couldn't find relevant information about '{question}' in the uploaded documents after ranking.",
@@ -86,24 +217,24 @@ def run_rag(question: str, vectorstore, syllabus_context: str = "", marks: int =
         }
 
     # STEP 3: take only the top documents to keep things fast (use TOP_K from settings)
+    started = time.perf_counter()
     top_docs = ranked_docs[:settings.TOP_K]
     
     # build the context string that will be sent to the AI
     context_parts = []
     for i, doc in enumerate(top_docs, 1):
-        page_info = doc.metadata.get("page", "N/A")
-        source_file = doc.metadata.get("source", "Unknown")
-        # get just the filename, not the full path
-        if isinstance(source_file, str):
-            source_file = source_file.split("/")[-1].split("\\")[-1]
+        (source_file, page_info), *copies = _citations(doc)
+        also = "".join(f"; also {file}, Page {page}" for file, page in copies)
         # limit each document to 800 characters to prevent super long prompts
         content = doc.page_content[:800] if len(doc.page_content) > 800 else doc.page_content
-        context_parts.append(f"[Source {i} - {source_file}, Page {page_info}]\n{content}")
+        context_parts.append(f"[Source {i} - {source_file}, Page {page_info}{also}]\n{content}")
     
     # join all document chunks with separators
     context = "\n\n---\n\n".join(context_parts)
+    _finish_stage("context", started)
 
     # STEP 4: format the chat history so the AI remembers previous messages
+    started = time.perf_counter()
     formatted_chat_history = "No previous conversation."
     if chat_history and len(chat_history) > 0:
         # only keep the last MAX_CHAT_HISTORY messages to save processing time
@@ -115,48 +246,93 @@ def run_rag(question: str, vectorstore, syllabus_context: str = "", marks: int =
             content = msg["content"][:300] + "..." if len(msg["content"]) > 300 else msg["content"]
             history_parts.append(f"{role}: {content}")
         formatted_chat_history = "\n".join(history_parts)
+    _finish_stage("history", started)
 
     # STEP 5: put everything together into the final prompt and send to AI
+    started = time.perf_counter()
     formatted_syllabus = syllabus_context.strip() if syllabus_context else "No syllabus provided."
     
     # fill in the prompt template with all our data
-    prompt = RAG_PROMPT.format(
+    prompt = get_rag_prompt().format(
         syllabus_context=formatted_syllabus,
         marks=marks,
         context=context,
         question=question,
         chat_history=formatted_chat_history
     )
+    _finish_stage("prompt", started)
+    _RETRIEVAL_ESTIMATE.observe(time.perf_counter() - retrieval_started)
 
-    # send to Gemini AI and get the answer
-    try:
-        logger.info(f"Sending RAG request with {len(context)} chars context and marks={marks}")
-        response = generate_text(prompt)
-        if not response:
-            raise ValueError("Empty response from Gemini")
-    except Exception as e:
-        logger.error(f"Error generating response: {str(e)}")
-        return {
-            "answer": f"Error generating response. Please try again: {str(e)[:100]}",
-            "pages": [],
-            "sources": [],
-            "error": True
-        }
+    # send to Gemini AI and get the answer (the most expensive step, so check once more)
+    check_cancelled("llm")
+    # retrieval may have taken longer than expected, so cut back further if needed
+    level = choose_degradation(deadline, retrieval_done=True, at_least=level)
+    if level != "extractive":
+        # Gemini has to be done a bit before the deadline, so there is time left to respond
+        llm_deadline = deadline.sooner(_RESPONSE_SECONDS) if deadline is not None else None
+        try:
+            logger.info("Sending RAG request with %d chars context and marks=%s", len(context), marks)
+            response = _ask_gemini(prompt, level, llm_deadline)
+        except RequestCancelled:
+            raise
+        except Exception as e:
+            if llm_deadline is None or not llm_deadline.expired():
+                logger.error("Error generating response: %s", e)
+                return {
+                    "answer": f"Error generating response. Please try again: {str(e)[:100]}",
+                    "pages": [],
+                    "sources": [],
+                    "error": True
+                }
+            logger.warning("Gemini did not answer before the deadline (%s), answering from the passages", e)
+            level = "extractive"
+    if level == "extractive":
+        response = extractive_answer(question, top_docs, marks)
 
     # STEP 6: collect page numbers and source info for the student to verify
-    pages = sorted({str(doc.metadata.get("page", "N/A")) for doc in top_docs})
-    sources = [
-        {
-            "page": doc.metadata.get("page", "N/A"),
-            "text": doc.page_content[:200]  # short preview of what was found
-        }
-        for doc in top_docs
-    ]
+    pages = sorted({str(page) for doc in top_docs for _, page in _citations(doc)})
+    sources = []
+    for doc in top_docs:
+        (source_file, page), *copies = _citations(doc)
+        sources.append({
+            "source": source_file,
+            "page": page,
+            "text": doc.page_content[:200],  # short preview of what was found
+            # the same text was also found in these files (near-duplicate chunks are indexed once)
+            "also_in": [{"source": file, "page": copy_page} for file, copy_page in copies],
+        })
 
     # return the complete answer with sources
     return {
         "answer": response,
         "pages": pages,
         "sources": sources,
+        "degradation": level,
         "error": False
     }
+
+
+# one Gemini call with the answer length of the level, given up when the deadline passes
+def _ask_gemini(prompt: str, level: str, deadline: Deadline) -> str:
+    started = time.perf_counter()
+    try:
+        # a real span (not _finish_stage) so the Gemini calls nest under run_rag.llm
+        with span("llm"):
+            response = generate_text(
+                prompt,
+                max_tokens=DEGRADATION_LEVELS[level]["max_tokens"],
+                timeout=max(0.1, deadline.remaining()) if deadline is not None else None,
+            )
+        if not response:
+            raise ValueError("Empty response from Gemini")
+    except RequestCancelled:
+        raise
+    except Exception:
+        if deadline is not None and deadline.expired():
+            # timed out: the next questions should expect a call at this level to take at least this long
+            _LLM_ESTIMATES[level].observe(time.perf_counter() - started)
+        raise
+    finally:
+        _STAGE_TIMERS["llm"].observe(time.perf_counter() - started)
+    _LLM_ESTIMATES[level].observe(time.perf_counter() - started)
+    return response
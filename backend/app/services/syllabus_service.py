@@ -4,19 +4,17 @@
 import tempfile
 import re
 from typing import List, Dict, Optional, Tuple
-from pypdf import PdfReader
-from docx import Document
 
 
 # reads a PDF file and pulls out the text and any table-like structures
 def extract_text_from_pdf(path: str) -> Tuple[str, List[List[List[str]]]]:
-    reader = PdfReader(path)
+    # imported here so the parser libraries only load when a syllabus is uploaded
+    from app.services.pdf_extraction import extract_pages
     text_parts = []
     tables = []
     
-    # go through each page of the PDF
-    for page in reader.pages:
-        page_text = page.extract_text() or ""
+    # go through each page of the PDF (read with the same PDF_BACKEND as ingestion)
+    for page_text in extract_pages(path):
         text_parts.append(page_text)
         
         # try to find tables by looking for pipe or tab separated content
@@ -45,6 +43,7 @@ def extract_text_from_pdf(path: str) -> Tuple[str, List[List[List[str]]]]:
 
 # reads a DOCX file and extracts text paragraphs and actual tables
 def extract_tables_from_docx(path: str) -> Tuple[str, List[List[List[str]]]]:
+    from docx import Document
     doc = Document(path)
     text_parts = []
     tables = []
@@ -0,0 +1,159 @@
+# keeps the extracted text and the chunks of every ingested file on disk, so re-indexing
+# (a rebuild, a new chunk size, a new embedding model) never has to parse a PDF again
+#   <TEXT_STORE_PATH>/<sha256 of the file>/pages.jsonl.gz                  one line per page
+#                                         /pages.json                      how many pages
+#                                         /chunks-<size>-<overlap>.jsonl.gz one line per chunk
+# (pages read with another PDF_BACKEND than pypdf get its name in theirs: pages-pypdfium2.jsonl.gz)
+# changing CHUNK_SIZE / CHUNK_OVERLAP only re-splits the stored pages; the files of other
+# settings are dropped by prune(). files are written under a temp name and renamed when complete,
+# so a crash never leaves half a file behind
+import gzip
+import json
+import logging
+import os
+import shutil
+import threading
+from typing import Iterator, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+
+def enabled() -> bool:
+    return bool(settings.TEXT_STORE_PATH)
+
+
+def _folder(sha256: str) -> str:
+    return os.path.join(settings.TEXT_STORE_PATH, sha256)
+
+
+# "" for pypdf, so stores from before PDF backends stay valid
+def _backend_tag() -> str:
+    return "" if settings.PDF_BACKEND == "pypdf" else f"-{settings.PDF_BACKEND}"
+
+
+def _pages_file() -> str:
+    return f"pages{_backend_tag()}.jsonl.gz"
+
+
+def _page_count_file() -> str:
+    return f"pages{_backend_tag()}.json"
+
+
+def _chunks_file() -> str:
+    return f"chunks{_backend_tag()}-{settings.CHUNK_SIZE}-{settings.CHUNK_OVERLAP}.jsonl.gz"
+
+
+# a unique temp name per thread (two copies of one file can be ingested at the same time)
+def _temp_path(path: str) -> str:
+    return f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+
+
+def _read(path: str, source: str) -> Iterator:
+    from langchain_core.documents import Document
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            # the same content can come from another upload path than the one it was stored for
+            metadata = {**record["metadata"], "source": source}
+            yield Document(page_content=record["text"], metadata=metadata)
+
+
+# the stored pages of a file, or None if it was never parsed
+def read_pages(sha256: str, source: str) -> Optional[Iterator]:
+    path = os.path.join(_folder(sha256), _pages_file())
+    if not enabled() or not os.path.exists(path):
+        return None
+    return _read(path, source)
+
+
+# the stored chunks of a file for the current chunk settings, or None
+def read_chunks(sha256: str, source: str) -> Optional[Iterator]:
+    path = os.path.join(_folder(sha256), _chunks_file())
+    if not enabled() or page_count(sha256) is None or not os.path.exists(path):
+        return None
+    return _read(path, source)
+
+
+def page_count(sha256: str) -> Optional[int]:
+    try:
+        with open(os.path.join(_folder(sha256), _page_count_file())) as f:
+            return json.load(f)["pages"]
+    except (FileNotFoundError, ValueError, KeyError):
+        return None
+
+
+class StoreWriter:
+    """Writes documents one at a time to a temp file that becomes visible on finish()"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._temp = _temp_path(path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # level 1: text compresses well already and ingestion should not wait on gzip
+        self._file = gzip.open(self._temp, "wt", encoding="utf-8", compresslevel=1)
+        self.count = 0
+
+    def write(self, document):
+        record = {"text": document.page_content, "metadata": document.metadata}
+        self._file.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        self.count += 1
+
+    def finish(self):
+        self._file.close()
+        os.replace(self._temp, self.path)
+
+    # throws the partial file away (the document failed or the reader stopped early)
+    def abort(self):
+        self._file.close()
+        try:
+            os.remove(self._temp)
+        except FileNotFoundError:
+            pass
+
+
+class PagesWriter(StoreWriter):
+    def __init__(self, sha256: str):
+        super().__init__(os.path.join(_folder(sha256), _pages_file()))
+        self.sha256 = sha256
+
+    def finish(self):
+        super().finish()
+        count_path = os.path.join(_folder(self.sha256), _page_count_file())
+        with open(_temp_path(count_path), "w") as f:
+            json.dump({"pages": self.count}, f)
+        os.replace(_temp_path(count_path), count_path)
+
+
+def pages_writer(sha256: str) -> Optional[PagesWriter]:
+    return PagesWriter(sha256) if enabled() else None
+
+
+def chunks_writer(sha256: str) -> Optional[StoreWriter]:
+    return StoreWriter(os.path.join(_folder(sha256), _chunks_file())) if enabled() else None
+
+
+# deletes the text of files that are no longer indexed, and pages / chunks made with other settings
+def prune(keep):
+    if not enabled() or not os.path.isdir(settings.TEXT_STORE_PATH):
+        return
+    keep = set(keep)
+    current = {_pages_file(), _page_count_file(), _chunks_file()}
+    for name in os.listdir(settings.TEXT_STORE_PATH):
+        folder = os.path.join(settings.TEXT_STORE_PATH, name)
+        if name not in keep:
+            shutil.rmtree(folder, ignore_errors=True)
+            continue
+        for entry in os.listdir(folder):
+            if entry.startswith(("pages", "chunks-")) and entry.endswith((".jsonl.gz", ".json")) and entry not in current:
+                try:
+                    os.remove(os.path.join(folder, entry))
+                except FileNotFoundError:
+                    pass
+
+
+def clear():
+    if enabled():
+        shutil.rmtree(settings.TEXT_STORE_PATH, ignore_errors=True)
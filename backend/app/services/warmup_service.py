@@ -0,0 +1,112 @@
+# this file preloads the slow parts of the app (embedding model, vector index, Gemini model)
+# so the first question after a deploy doesnt have to wait for them to load
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# lock to prevent race conditions when reading/updating WARMUP_STATUS
+_warmup_lock = threading.Lock()
+# the background thread doing the warm-up (only one per process)
+_warmup_thread = None
+
+# keeps track of each component: pending -> loading -> ready / empty / failed
+# (a failed component is tried again, see warm_up)
+WARMUP_STATUS = {
+    name: {"status": "pending", "seconds": None, "error": None, "attempts": 0}
+    for name in ("embeddings", "vectorstore", "llm")
+}
+
+# wait before trying failed components again, doubling after every round up to the cap
+_RETRY_FIRST_SECONDS = 1.0
+_RETRY_MAX_SECONDS = 60.0
+
+# states that mean a component wont slow down the next request
+READY_STATES = ("ready", "empty")
+
+
+# loads the embedding model and runs one dummy query so the first real one is fast
+def _warm_embeddings():
+    from app.vectorstore.faiss_store import get_embeddings
+    get_embeddings().embed_query("warm-up")
+    return "ready"
+
+
+# loads the FAISS index into the shared in-memory cache
+def _warm_vectorstore():
+    from app.vectorstore.faiss_store import get_vectorstore
+    # no PDFs uploaded yet is fine - there is just nothing to load
+    return "ready" if get_vectorstore() is not None else "empty"
+
+
+# finds a working Gemini model so generate_text doesnt have to probe for one
+def _warm_llm():
+    from app.services.gemini_llm import get_working_model
+    get_working_model()
+    return "ready"
+
+
+# runs one warm-up step and records how long it took and whether it worked
+def _run_step(name: str, step):
+    with _warmup_lock:
+        WARMUP_STATUS[name].update({"status": "loading", "error": None})
+        WARMUP_STATUS[name]["attempts"] += 1
+    started = time.perf_counter()
+    try:
+        status = step()
+        error = None
+    except Exception as e:
+        status = "failed"
+        error = str(e)
+        logger.error(f"Warm-up of {name} failed: {e}")
+    elapsed = round(time.perf_counter() - started, 3)
+    with _warmup_lock:
+        WARMUP_STATUS[name].update({"status": status, "seconds": elapsed, "error": error})
+    logger.info(f"Warm-up of {name} finished in {elapsed}s ({status})")
+
+
+# the warm-up steps in order (the vectorstore needs the embeddings)
+_STEPS = (
+    ("embeddings", _warm_embeddings),
+    ("vectorstore", _warm_vectorstore),
+    ("llm", _warm_llm),
+)
+
+
+def _failed() -> list:
+    with _warmup_lock:
+        return [name for name, _ in _STEPS if WARMUP_STATUS[name]["status"] == "failed"]
+
+
+# warms up every component one after another, then keeps trying the ones that failed
+# (Gemini or the model hub unreachable for a moment at boot) so /ready does not stay 503 for good
+def warm_up():
+    for name, step in _STEPS:
+        _run_step(name, step)
+    delay = _RETRY_FIRST_SECONDS
+    while _failed():
+        time.sleep(delay)
+        failed = _failed()
+        for name, step in _STEPS:
+            if name in failed:
+                _run_step(name, step)
+        delay = min(delay * 2, _RETRY_MAX_SECONDS)
+
+
+# starts warming up in a background thread so the server can answer /ready meanwhile
+def start_warmup():
+    global _warmup_thread
+    with _warmup_lock:
+        if _warmup_thread is not None and _warmup_thread.is_alive():
+            return
+        _warmup_thread = threading.Thread(target=warm_up, name="warmup", daemon=True)
+        _warmup_thread.start()
+
+
+# returns whether every component is warm, plus a copy of each components state
+def get_readiness():
+    with _warmup_lock:
+        components = {name: dict(state) for name, state in WARMUP_STATUS.items()}
+    ready = all(state["status"] in READY_STATES for state in components.values())
+    return ready, components
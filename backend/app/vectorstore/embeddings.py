@@ -0,0 +1,83 @@
+# this file builds the embedding model that turns text into vectors
+# there are a few backends for the same model so CPU-only servers can pick a faster one:
+#   torch      - plain PyTorch through HuggingFaceEmbeddings (the original setup)
+#   torch-int8 - same model with its Linear layers quantized to int8 (needs only torch)
+#   onnx       - the model exported to ONNX Runtime (needs `pip install optimum[onnxruntime]`)
+import logging
+from typing import List
+
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_BACKENDS = ("torch", "torch-int8", "onnx")
+
+
+# wraps a sentence-transformers model so FAISS/langchain can use it like any other embeddings
+class SentenceTransformerEmbeddings(Embeddings):
+    """LangChain embeddings backed by an already-built SentenceTransformer model"""
+
+    def __init__(self, model, model_name: str, backend: str, batch_size: int = 32):
+        self.model = model
+        self.model_name = model_name
+        self.backend = backend
+        self.batch_size = batch_size
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        texts = [t.replace("\n", " ") for t in texts]
+        vectors = self.model.encode(texts, batch_size=self.batch_size, show_progress_bar=False)
+        return vectors.tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    def __repr__(self) -> str:
+        return f"SentenceTransformerEmbeddings(model={self.model_name}, backend={self.backend})"
+
+
+# the original PyTorch path, kept exactly as before so existing indexes match it
+def _build_torch(model_name: str, batch_size: int):
+    from langchain_huggingface import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(model_name=model_name, encode_kwargs={"batch_size": batch_size})
+
+
+# int8 dynamic quantization: weights stored as int8, activations quantized on the fly
+def _build_torch_int8(model_name: str, batch_size: int):
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(model_name, device="cpu")
+    model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return SentenceTransformerEmbeddings(model, model_name, "torch-int8", batch_size)
+
+
+# ONNX Runtime export of the same model (sentence-transformers exports it on first load)
+def _build_onnx(model_name: str, batch_size: int):
+    from sentence_transformers import SentenceTransformer
+
+    try:
+        model = SentenceTransformer(model_name, device="cpu", backend="onnx")
+    except ImportError as e:
+        raise RuntimeError(
+            "The onnx embedding backend needs ONNX Runtime. "
+            "Install it with: pip install optimum[onnxruntime]"
+        ) from e
+    return SentenceTransformerEmbeddings(model, model_name, "onnx", batch_size)
+
+
+_BUILDERS = {
+    "torch": _build_torch,
+    "torch-int8": _build_torch_int8,
+    "onnx": _build_onnx,
+}
+
+
+# creates the embedding model for the chosen backend
+def create_embeddings(backend: str, model_name: str, batch_size: int = 32):
+    backend = (backend or "torch").lower()
+    if backend not in _BUILDERS:
+        raise ValueError(
+            f"Unknown embedding backend '{backend}'. Choose one of: {', '.join(EMBEDDING_BACKENDS)}"
+        )
+    logger.info(f"Loading embeddings model {model_name} with the {backend} backend")
+    return _BUILDERS[backend](model_name, batch_size)
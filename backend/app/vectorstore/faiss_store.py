@@ -3,21 +3,58 @@
 
 import os
 import logging
-from langchain_community.vectorstores import FAISS
-from langchain_huggingface import HuggingFaceEmbeddings
+import time
+import uuid
+import weakref
 from app.core.config import settings
+from app.core.locks import InterProcessLock, hold_shared, try_hold_exclusive
+from app.vectorstore.shards import (
+    ShardedIndex, combine as combine_shards, extract as extract_shard, link_shard, shard_count, shard_folder, shard_of
+)
+from app.core.memory import MEMORY
+from app.core.metrics import CACHE_REQUESTS_TOTAL, INGEST_STAGE_SECONDS, counter, gauge_func
 
 logger = logging.getLogger(__name__)
 
+INGEST_CHUNKS_TOTAL = counter(
+    "ingest_chunks_total", "Chunks added to the index, or linked to a near-duplicate already in it", ["result"]
+)
+
+# the kinds of search index we can build (flat = exact float32, the rest are compressed)
+#   sq-fp16 - every number stored as float16 (half the memory, almost no recall loss)
+#   sq-int8 - every number stored as one byte (a quarter of the memory)
+#   pq      - product quantization, VECTOR_INDEX_PQ_M bytes per vector (smallest)
+INDEX_TYPES = ("flat", "sq-fp16", "sq-int8", "pq")
+# when the index is compressed, the full-precision vectors are kept in this file next to it
+# it is never loaded for searching, only when the index is rebuilt or merged
+RAW_VECTORS_FILE = "vectors.npy"
+
+# the database folder holds one sub-folder per version (v000001, v000002, ...) and a CURRENT
+# file that names the live one. a write builds a complete new version next to the old one and
+# then switches CURRENT with an atomic rename, so readers never load a half-written or deleted
+# index. old versions are deleted once no process is reading them any more
+CURRENT_FILE = "CURRENT"
+# readers hold a shared lock on this file inside the version they are loading or using
+READERS_LOCK_FILE = ".readers"
+_VERSION_PREFIX = "v"
+# which uploaded file each chunk came from (filename -> document id, fingerprint, chunk count)
+# saved inside every version, so it always matches the index next to it
+MANIFEST_FILE = "manifest.json"
+# files of the old layout (index saved straight into VECTOR_DB_PATH), still readable
+_LEGACY_FILES = ("index.faiss", "index.pkl", RAW_VECTORS_FILE)
+
 # we cache the embeddings model so it only loads once (it takes time to load)
 _embeddings_cache = None
+# when it was last asked for (time.monotonic), so the memory budget can tell if it is cold
+_embeddings_last_used = 0.0
 import threading
 _embeddings_lock = threading.Lock()
 
 
 # loads the embedding model that converts text into numbers the AI can search
 def get_embeddings():
-    global _embeddings_cache
+    global _embeddings_cache, _embeddings_last_used
+    _embeddings_last_used = time.monotonic()
     # only load the model if we havent loaded it before (with thread safety)
     if _embeddings_cache is None:
         with _embeddings_lock:
@@ -25,74 +62,691 @@ def get_embeddings():
             if _embeddings_cache is None:
                 logger.info("Loading embeddings model...")
                 try:
+                    # imported here because it pulls in torch (seconds of import time)
+                    from app.vectorstore.embeddings import create_embeddings
                     # using a lightweight but good model that runs locally (no API calls needed)
-                    _embeddings_cache = HuggingFaceEmbeddings(
-                        model_name="sentence-transformers/all-MiniLM-L6-v2"
+                    # the backend (torch, torch-int8, onnx) is picked in settings
+                    _embeddings_cache = create_embeddings(
+                        settings.EMBEDDING_BACKEND,
+                        settings.EMBEDDING_MODEL,
+                        settings.EMBEDDING_BATCH_SIZE
                     )
                     logger.info("Embeddings model loaded successfully")
+                    MEMORY.check_soon()
                 except Exception as e:
                     logger.error(f"Failed to load embeddings model: {e}")
                     raise
     return _embeddings_cache
 
 
+_EMBED_TIMER = INGEST_STAGE_SECONDS.labels(stage="embed")
+_SAVE_TIMER = INGEST_STAGE_SECONDS.labels(stage="save")
+
+
+# turns chunks into vectors (safe to call from several threads at once, no write lock needed)
+def embed_chunks(chunks):
+    with _EMBED_TIMER.time():
+        return get_embeddings().embed_documents([chunk.page_content for chunk in chunks])
+
+
+# every write to the database (from any thread or worker process) holds this lock
+_write_locks = {}
+_write_locks_guard = threading.Lock()
+
+
+def vectorstore_write_lock() -> InterProcessLock:
+    path = settings.VECTOR_DB_PATH.rstrip("/\\") + ".lock"
+    with _write_locks_guard:
+        if path not in _write_locks:
+            _write_locks[path] = InterProcessLock(path)
+        return _write_locks[path]
+
+
+# name of the live version: None if CURRENT does not exist, "" if the database was cleared
+def current_version():
+    try:
+        with open(os.path.join(settings.VECTOR_DB_PATH, CURRENT_FILE)) as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+# folder of the version readers should load right now (None when there is no database)
+def active_vectorstore_path():
+    version = current_version()
+    if version:
+        return os.path.join(settings.VECTOR_DB_PATH, version)
+    if version is None and os.path.exists(os.path.join(settings.VECTOR_DB_PATH, "index.faiss")):
+        return settings.VECTOR_DB_PATH
+    return None
+
+
+def _version_number(name: str) -> int:
+    if name.startswith(_VERSION_PREFIX) and name[len(_VERSION_PREFIX):].isdigit():
+        return int(name[len(_VERSION_PREFIX):])
+    return -1
+
+
+# a fresh folder for the next version (numbers are never reused, even after a crash)
+def _next_version_path() -> str:
+    os.makedirs(settings.VECTOR_DB_PATH, exist_ok=True)
+    newest = max((_version_number(name) for name in os.listdir(settings.VECTOR_DB_PATH)), default=-1)
+    return os.path.join(settings.VECTOR_DB_PATH, f"{_VERSION_PREFIX}{max(newest, 0) + 1:06d}")
+
+
+# flushes the files of a folder to disk, so a crash right after publishing cant lose them
+def _fsync_folder(path: str):
+    for name in os.listdir(path):
+        file_path = os.path.join(path, name)
+        if os.path.isfile(file_path):
+            with open(file_path, "rb+") as f:
+                os.fsync(f.fileno())
+        elif os.path.isdir(file_path):
+            # shard folders
+            _fsync_folder(file_path)
+    if hasattr(os, "O_DIRECTORY"):
+        fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+# makes a version live (or "" for an empty database); must be called holding the write lock
+def _publish(version: str):
+    current_path = os.path.join(settings.VECTOR_DB_PATH, CURRENT_FILE)
+    tmp_path = f"{current_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    # os.replace is atomic, so readers see either the old or the new version, never a mix
+    os.replace(tmp_path, current_path)
+    _collect_old_versions()
+
+
+# deletes versions that are not live and that no process is reading
+# (also left-over folders of writes that crashed); must be called holding the write lock
+def _collect_old_versions():
+    import shutil
+    live = current_version()
+    root = settings.VECTOR_DB_PATH
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if name == live or _version_number(name) < 0 or not os.path.isdir(path):
+            continue
+        lease = try_hold_exclusive(os.path.join(path, READERS_LOCK_FILE))
+        if lease is None:
+            logger.info(f"Vectorstore version {name} is still being read, keeping it for now")
+            continue
+        try:
+            shutil.rmtree(path)
+            logger.info(f"Deleted old vectorstore version {name}")
+        except OSError as e:
+            logger.warning(f"Could not delete old vectorstore version {name}: {e}")
+        finally:
+            lease.close()
+    # the old single-folder layout is dropped once a versioned copy is live
+    if live is not None and any(os.path.exists(os.path.join(root, f)) for f in _LEGACY_FILES):
+        lease = try_hold_exclusive(os.path.join(root, READERS_LOCK_FILE))
+        if lease is not None:
+            try:
+                for name in _LEGACY_FILES:
+                    if os.path.exists(os.path.join(root, name)):
+                        os.remove(os.path.join(root, name))
+            finally:
+                lease.close()
+
+
+# reads the manifest of a version folder: {"complete": bool, "documents": {filename: entry}}
+# returns None if the version has none (written before manifests existed)
+def read_manifest(path):
+    import json
+    if path is None:
+        return None
+    try:
+        with open(os.path.join(path, MANIFEST_FILE)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _write_manifest(path: str, manifest: dict):
+    import json
+    with open(os.path.join(path, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+
+
+# the settings the chunks and vectors of an index depend on; an index made with other
+# settings is rebuilt by the next reconcile (from the stored text, see text_store)
+def index_settings() -> dict:
+    index = {
+        "chunk_size": settings.CHUNK_SIZE,
+        "chunk_overlap": settings.CHUNK_OVERLAP,
+        "embedding_model": settings.EMBEDDING_MODEL,
+    }
+    # only when sharded, so single-index databases from before shards dont need a rebuild
+    if settings.VECTOR_INDEX_SHARDS > 1:
+        index["shards"] = settings.VECTOR_INDEX_SHARDS
+    # the same for the PDF backend: only set when it is not pypdf
+    if settings.PDF_BACKEND != "pypdf":
+        index["pdf_backend"] = settings.PDF_BACKEND
+    return index
+
+
+# the docstore ids of a document's chunks
+def document_chunk_ids(entry: dict) -> list:
+    return [f"{entry['doc_id']}-{n}" for n in range(entry["chunks"])]
+
+
+# hands out the docstore ids for the next chunks of a document
+def next_chunk_ids(entry: dict, count: int) -> list:
+    start = entry["chunks"]
+    entry["chunks"] += count
+    return [f"{entry['doc_id']}-{n}" for n in range(start, start + count)]
+
+
+# writers that are open right now (each holds its own in-memory copy of the database)
+_open_writers = weakref.WeakSet()
+
+
+# adds chunks to the database in batches and publishes a new version on every commit()
+# the write lock is held from start to end, so there is one writer at a time (across processes).
+# if anything fails, the version that was live before is published again, so a half-ingested
+# document never stays in the database
+class VectorstoreWriter:
+    def __init__(self, replace=False):
+        self.replace = replace
+        self.db = None
+        self.embeddings = None
+        # filename -> {"doc_id", "size", "mtime_ns", "sha256", "pages", "chunks"}
+        self.documents = {}
+        # False when the database holds chunks that are not in the manifest (older versions)
+        # or that were made with other settings
+        self.complete = True
+        # chunks added since the last commit, and in total
+        self.pending = 0
+        self.added = 0
+        # chunks that were linked to a near-duplicate instead of being added
+        self.duplicates = 0
+        # shards changed since the last commit, and the version the unchanged ones can be linked from
+        self._dirty_shards = set()
+        self._shard_source = None
+        # SimHash fingerprints of the indexed chunks, and duplicate id -> canonical chunk id
+        # (both built from the docstore when first needed)
+        self._near_duplicates = None
+        self._duplicate_of = None
+        self._dirty = False
+        self._committed = False
+        self._lock = vectorstore_write_lock()
+        # the version that was live when we started, kept on disk (and restorable) while we run
+        self._previous_version = None
+        self._previous_lease = None
+
+    def __enter__(self):
+        self._lock.acquire()
+        _open_writers.add(self)
+        try:
+            self.embeddings = get_embeddings()
+            self._previous_version = current_version()
+            source = active_vectorstore_path()
+            if source is not None:
+                self._previous_lease = hold_shared(os.path.join(source, READERS_LOCK_FILE))
+            # if we already have a database and we're not replacing it, merge new data in
+            if not self.replace and source is not None:
+                manifest = read_manifest(source)
+                if manifest is None:
+                    self.complete = False
+                else:
+                    self.documents = manifest["documents"]
+                    self.complete = manifest["complete"] and manifest.get("settings") == index_settings()
+                try:
+                    # load the existing database
+                    logger.info("Loading existing vectorstore to merge new documents...")
+                    self.db = _load_writable(source, self.embeddings)
+                    if settings.VECTOR_INDEX_SHARDS > 1 and shard_count(source) == settings.VECTOR_INDEX_SHARDS:
+                        self._shard_source = source
+                except Exception as e:
+                    # if loading fails, log it and create a fresh database
+                    logger.error(f"Failed to load existing vectorstore: {e}. Creating fresh database...")
+                    self.db = None
+        except BaseException:
+            self._release()
+            raise
+        return self
+
+    # remembers which shards these chunks are in, so the next commit re-saves them
+    def _touch(self, chunk_ids):
+        if settings.VECTOR_INDEX_SHARDS > 1:
+            self._dirty_shards.update(shard_of(chunk_id, settings.VECTOR_INDEX_SHARDS) for chunk_id in chunk_ids)
+
+    # turns chunks into vectors (safe to call from several threads at once)
+    def embed(self, chunks):
+        return embed_chunks(chunks)
+
+    # embeds one batch of chunks and adds it to the in-memory index
+    def add(self, chunks, ids=None):
+        if chunks:
+            self.add_embedded(chunks, self.embed(chunks), ids)
+
+    # adds chunks that were already embedded
+    def add_embedded(self, chunks, vectors, ids=None):
+        from langchain_community.vectorstores import FAISS
+        if not chunks:
+            return
+        if ids is None:
+            ids = [uuid.uuid4().hex for _ in chunks]
+        if settings.DEDUP_CHUNKS:
+            chunks, vectors, ids = self._link_near_duplicates(chunks, vectors, ids)
+            if not chunks:
+                return
+        pairs = list(zip([chunk.page_content for chunk in chunks], vectors))
+        metadatas = [chunk.metadata for chunk in chunks]
+        if self.db is None:
+            self.db = FAISS.from_embeddings(pairs, self.embeddings, metadatas=metadatas, ids=ids)
+        else:
+            self.db.add_embeddings(pairs, metadatas=metadatas, ids=ids)
+        self._touch(ids)
+        INGEST_CHUNKS_TOTAL.labels(result="indexed").inc(len(chunks))
+        self.pending += len(chunks)
+        self.added += len(chunks)
+        self._dirty = True
+
+    # a chunk that is nearly the same as one already indexed (or earlier in this batch) is not
+    # added; its id and metadata are kept on that canonical chunk instead, so answers can still
+    # cite every file and page the text appears in. returns the chunks that are left to add
+    def _link_near_duplicates(self, chunks, vectors, ids):
+        from app.rag.dedup import simhash
+        near_duplicates = self._near_duplicate_index()
+        duplicate_of = self._duplicate_map()
+        kept_chunks, kept_vectors, kept_ids = [], [], []
+        batch = {}
+        for chunk, vector, chunk_id in zip(chunks, vectors, ids):
+            fingerprint = simhash(chunk.page_content)
+            canonical_id = near_duplicates.find(fingerprint)
+            if canonical_id is None:
+                # a copy, the caller's chunk (e.g. in the text store) must not change
+                chunk = type(chunk)(page_content=chunk.page_content, metadata={**chunk.metadata, "simhash": fingerprint})
+                near_duplicates.add(chunk_id, fingerprint)
+                batch[chunk_id] = chunk
+                kept_chunks.append(chunk)
+                kept_vectors.append(vector)
+                kept_ids.append(chunk_id)
+                continue
+            canonical = batch.get(canonical_id) or self.db.docstore.search(canonical_id)
+            canonical.metadata.setdefault("duplicates", []).append({"id": chunk_id, "metadata": dict(chunk.metadata)})
+            duplicate_of[chunk_id] = canonical_id
+            self._touch([canonical_id])
+            self.duplicates += 1
+            self._dirty = True
+        INGEST_CHUNKS_TOTAL.labels(result="duplicate").inc(len(chunks) - len(kept_chunks))
+        return kept_chunks, kept_vectors, kept_ids
+
+    def _near_duplicate_index(self):
+        from app.rag.dedup import NearDuplicateIndex, simhash
+        if self._near_duplicates is None:
+            self._near_duplicates = NearDuplicateIndex(settings.DEDUP_MAX_HAMMING)
+            for chunk_id, doc in self._stored_documents():
+                if "simhash" not in doc.metadata:
+                    # indexed before dedup existed
+                    doc.metadata["simhash"] = simhash(doc.page_content)
+                    self._touch([chunk_id])
+                    self._dirty = True
+                self._near_duplicates.add(chunk_id, doc.metadata["simhash"])
+        return self._near_duplicates
+
+    def _duplicate_map(self):
+        if self._duplicate_of is None:
+            self._duplicate_of = {
+                ref["id"]: chunk_id
+                for chunk_id, doc in self._stored_documents()
+                for ref in doc.metadata.get("duplicates", ())
+            }
+        return self._duplicate_of
+
+    def _stored_documents(self):
+        if self.db is None:
+            return
+        for chunk_id in self.db.index_to_docstore_id.values():
+            yield chunk_id, self.db.docstore.search(chunk_id)
+
+    # removes chunks by id (ids that are not in the index are ignored)
+    # a removed chunk that has near-duplicates in other files is not lost: the first of them
+    # takes over its vector and text, so the content stays searchable while any copy remains
+    def delete_ids(self, ids):
+        if self.db is None or not ids:
+            return
+        ids = set(ids)
+        duplicate_of = self._duplicate_map()
+        # removed duplicates: drop their references from the canonical chunk
+        for chunk_id in ids:
+            canonical_id = duplicate_of.pop(chunk_id, None)
+            if canonical_id is not None and canonical_id not in ids:
+                canonical = self.db.docstore.search(canonical_id)
+                canonical.metadata["duplicates"] = [
+                    ref for ref in canonical.metadata["duplicates"] if ref["id"] != chunk_id
+                ]
+                self._touch([canonical_id])
+                self._dirty = True
+        positions = {chunk_id: position for position, chunk_id in self.db.index_to_docstore_id.items()}
+        removed = [chunk_id for chunk_id in ids if chunk_id in positions]
+        if not removed:
+            return
+        heirs = []
+        for chunk_id in removed:
+            doc = self.db.docstore.search(chunk_id)
+            refs = [ref for ref in doc.metadata.get("duplicates", ()) if ref["id"] not in ids]
+            if not refs:
+                continue
+            metadata = {**refs[0]["metadata"], "duplicates": refs[1:]}
+            if "simhash" in doc.metadata:
+                metadata["simhash"] = doc.metadata["simhash"]
+            vector = self.db.index.reconstruct(positions[chunk_id])
+            heirs.append((refs[0]["id"], doc.page_content, vector, metadata))
+            for ref in refs:
+                duplicate_of.pop(ref["id"], None)
+            for ref in refs[1:]:
+                duplicate_of[ref["id"]] = refs[0]["id"]
+        self.db.delete(removed)
+        self._touch(removed)
+        self._touch([heir[0] for heir in heirs])
+        if self._near_duplicates is not None:
+            for chunk_id in removed:
+                self._near_duplicates.remove(chunk_id)
+        for heir_id, text, vector, metadata in heirs:
+            self.db.add_embeddings([(text, vector)], metadatas=[metadata], ids=[heir_id])
+            if self._near_duplicates is not None and "simhash" in metadata:
+                self._near_duplicates.add(heir_id, metadata["simhash"])
+        self._dirty = True
+
+    # swaps in a whole database built elsewhere (a snapshot), with the files it holds
+    def set_database(self, db, documents: dict, complete: bool):
+        self.db = db
+        self.documents = dict(documents)
+        self.complete = complete
+        self._near_duplicates = None
+        self._duplicate_of = None
+        self._shard_source = None
+        self._dirty = True
+
+    # notes that a file is in the database (its chunks must have been added with its ids)
+    def record_document(self, filename: str, entry: dict):
+        self.documents[filename] = entry
+        self._dirty = True
+
+    # removes a file's chunks and its manifest entry
+    def remove_document(self, filename: str):
+        entry = self.documents.pop(filename, None)
+        if entry is not None:
+            self.delete_ids(document_chunk_ids(entry))
+            self._dirty = True
+
+    # writes everything added so far as a new version and makes it live
+    def commit(self):
+        import shutil
+        if not self._dirty:
+            return
+        if self.db is None or self.db.index.ntotal == 0:
+            # nothing left, publish an empty database instead of an empty index
+            os.makedirs(settings.VECTOR_DB_PATH, exist_ok=True)
+            _publish("")
+            self._committed = True
+            self._dirty = False
+            self.pending = 0
+            return
+        target = _next_version_path()
+        try:
+            with _SAVE_TIMER.time():
+                if settings.VECTOR_INDEX_SHARDS > 1:
+                    self._write_shards(target)
+                else:
+                    _write_vectorstore(self.db, target)
+            _write_manifest(target, {
+                "complete": self.complete, "settings": index_settings(), "documents": self.documents,
+            })
+            _fsync_folder(target)
+        except Exception:
+            # readers never saw this version, so it can simply go away
+            shutil.rmtree(target, ignore_errors=True)
+            raise
+        _publish(os.path.basename(target))
+        self._committed = True
+        self._dirty = False
+        self._dirty_shards.clear()
+        self._shard_source = target if settings.VECTOR_INDEX_SHARDS > 1 else None
+        self.pending = 0
+        logger.info(f"Committed vectorstore version {os.path.basename(target)} with {self.db.index.ntotal} vectors")
+        if self.duplicates:
+            seen = self.added + self.duplicates
+            logger.info(
+                f"Near-duplicate chunks so far: {self.duplicates} of {seen} ({self.duplicates / seen:.0%}) linked "
+                f"instead of indexed, ~{self.duplicates * self.db.index.d * 4 / 1024:.0f} KB of vectors saved"
+            )
+
+    # saves each shard that changed and links the others from the version they were last saved in
+    def _write_shards(self, target: str):
+        shards = settings.VECTOR_INDEX_SHARDS
+        written = 0
+        for shard in range(shards):
+            folder = shard_folder(target, shard)
+            if self._shard_source is not None and shard not in self._dirty_shards:
+                link_shard(shard_folder(self._shard_source, shard), folder)
+            else:
+                _write_vectorstore(extract_shard(self.db, shard, shards), folder)
+                written += 1
+        logger.info(f"Saved {written} of {shards} shards, linked the rest")
+
+    # makes the commits so far final: if this writer fails later, they are not rolled back
+    def keep_commits(self):
+        self._committed = False
+
+    # puts the version from before this writer started back in place
+    def _rollback(self):
+        if not self._committed:
+            return
+        logger.warning("Rolling the vectorstore back to the version before this write")
+        if self._previous_version is None:
+            # it was the old single-folder layout, which is live again once CURRENT is gone
+            os.remove(os.path.join(settings.VECTOR_DB_PATH, CURRENT_FILE))
+        else:
+            _publish(self._previous_version)
+
+    def _release(self):
+        _open_writers.discard(self)
+        if self._previous_lease is not None:
+            self._previous_lease.close()
+            self._previous_lease = None
+        self._lock.release()
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                self.commit()
+            else:
+                self._rollback()
+        finally:
+            self._release()
+
+
 # saves new text chunks into our vector database
 def save_vectorstore(chunks, replace=False):
     # validate input
     if not chunks:
         logger.warning("Cannot save empty chunk list")
         return
-    
-    embeddings = get_embeddings()
-    
-    # validate vectorstore path is set
-    if not settings.VECTOR_DB_PATH:
-        raise ValueError("VECTOR_DB_PATH not configured")
-    
-    # ensure directory exists
-    os.makedirs(os.path.dirname(settings.VECTOR_DB_PATH) or ".", exist_ok=True)
-    
-    # if we already have a database and we're not replacing it, merge new data in
-    if not replace and os.path.exists(settings.VECTOR_DB_PATH):
-        try:
-            # load the existing database
-            logger.info("Loading existing vectorstore to merge new documents...")
-            existing_db = FAISS.load_local(
-                settings.VECTOR_DB_PATH,
-                embeddings,
-                allow_dangerous_deserialization=True  # needed for loading saved FAISS files
-            )
-            
-            # create a new database from the new chunks
-            new_db = FAISS.from_documents(chunks, embeddings)
-            
-            # combine old and new data together
-            existing_db.merge_from(new_db)
-            
-            # save the combined database back to disk
-            existing_db.save_local(settings.VECTOR_DB_PATH)
-            logger.info(f"Merged {len(chunks)} new chunks into existing vectorstore")
-            
-        except Exception as e:
-            # if merging fails, log warning and create fresh database
-            logger.error(f"Failed to merge vectorstore: {e}. Creating fresh database...")
-            try:
-                db = FAISS.from_documents(chunks, embeddings)
-                db.save_local(settings.VECTOR_DB_PATH)
-                logger.info(f"Successfully created fresh vectorstore with {len(chunks)} chunks")
-            except Exception as e2:
-                logger.error(f"Failed to create vectorstore: {e2}")
-                raise
+    batch_size = max(1, settings.INGEST_EMBED_BATCH)
+    with VectorstoreWriter(replace=replace) as writer:
+        # these chunks dont belong to a tracked upload, so the next reconcile rebuilds from the files
+        writer.complete = False
+        for start in range(0, len(chunks), batch_size):
+            writer.add(chunks[start:start + batch_size])
+    logger.info(f"Saved {len(chunks)} chunks to the vectorstore")
+
+
+# empties the database (reset, or the last PDF was removed)
+# readers that already loaded a version keep using it until they notice the change
+def clear_vectorstore():
+    with vectorstore_write_lock():
+        os.makedirs(settings.VECTOR_DB_PATH, exist_ok=True)
+        _publish("")
+
+
+# picks the faiss index_factory description for an index type
+def _factory_key(index_type: str, n_vectors: int, dim: int, rerank_factor: int) -> str:
+    if index_type == "flat":
+        return "Flat"
+    if index_type == "sq-fp16":
+        key = "SQfp16"
+    elif index_type == "sq-int8":
+        key = "SQ8"
+    elif index_type == "pq":
+        m = settings.VECTOR_INDEX_PQ_M
+        if dim % m != 0:
+            raise ValueError(f"VECTOR_INDEX_PQ_M={m} must divide the embedding size {dim}")
+        # k-means wants ~39 training points per centroid, so small collections get fewer bits
+        nbits = 8
+        while nbits > 4 and n_vectors < 39 * (1 << nbits):
+            nbits -= 1
+        if n_vectors < 39 * (1 << nbits):
+            logger.info(f"Only {n_vectors} vectors, too few to train PQ - using sq-int8 instead")
+            key = "SQ8"
+        else:
+            key = f"PQ{m}x{nbits}"
     else:
-        # first time upload or explicit replace - create a brand new database
-        try:
-            logger.info(f"Creating new vectorstore with {len(chunks)} chunks...")
-            db = FAISS.from_documents(chunks, embeddings)
-            db.save_local(settings.VECTOR_DB_PATH)
-            logger.info("Vectorstore created and saved successfully")
-        except Exception as e:
-            logger.error(f"Failed to create vectorstore: {e}")
-            raise
+        raise ValueError(f"Unknown VECTOR_INDEX_TYPE '{index_type}'. Choose one of: {', '.join(INDEX_TYPES)}")
+    # RFlat keeps exact vectors too and re-ranks the top k * rerank_factor candidates with them
+    if rerank_factor > 0:
+        key += ",RFlat"
+    return key
+
+
+# builds a search index of the given type from full-precision vectors
+def build_index(vectors, index_type: str, rerank_factor: int = None):
+    import faiss
+    if rerank_factor is None:
+        rerank_factor = settings.VECTOR_INDEX_RERANK_FACTOR
+    n_vectors, dim = vectors.shape
+    if index_type == "flat":
+        # same class langchain creates, so it can be merged with freshly built databases
+        index = faiss.IndexFlatL2(dim)
+        index.add(vectors)
+        return index
+    index = faiss.index_factory(dim, _factory_key(index_type, n_vectors, dim, rerank_factor), faiss.METRIC_L2)
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    if rerank_factor > 0:
+        faiss.downcast_index(index).k_factor = float(rerank_factor)
+    return index
+
+
+# returns every vector stored in the database as a float32 numpy array
+# (exact from a flat index or the raw vectors file, approximate if only a compressed index exists)
+def _full_precision_vectors(index, path: str):
+    import faiss
+    import numpy as np
+    if isinstance(index, ShardedIndex):
+        parts = [_full_precision_vectors(shard, folder) for shard, folder in zip(index.shards, index.paths)]
+        return np.vstack(parts) if parts else np.zeros((0, index.d), dtype="float32")
+    if isinstance(index, faiss.IndexFlat):
+        return index.reconstruct_n(0, index.ntotal)
+    raw_path = os.path.join(path, RAW_VECTORS_FILE)
+    if os.path.exists(raw_path):
+        vectors = np.load(raw_path)
+        if len(vectors) == index.ntotal:
+            return vectors
+    logger.warning("Full-precision vectors missing, reconstructing them from the compressed index")
+    return index.reconstruct_n(0, index.ntotal)
+
+
+# swaps a loaded compressed index for an exact flat one so it can be merged and re-saved
+def _restore_full_precision(db, path: str):
+    import faiss
+    if isinstance(db.index, faiss.IndexFlat):
+        return
+    vectors = _full_precision_vectors(db.index, path)
+    db.index = build_index(vectors, "flat", rerank_factor=0)
+
+
+# saves the database, compressing the search index if VECTOR_INDEX_TYPE asks for it
+# (db itself keeps its exact index, so more vectors can still be added to it)
+def _write_vectorstore(db, path: str):
+    import copy
+    import numpy as np
+    os.makedirs(path, exist_ok=True)
+    raw_path = os.path.join(path, RAW_VECTORS_FILE)
+    if settings.VECTOR_INDEX_TYPE == "flat" or db.index.ntotal == 0:
+        # a flat index already holds the exact vectors, so no extra file is needed
+        # (an empty shard stays flat, there is nothing to train a compressed index on)
+        if os.path.exists(raw_path):
+            os.remove(raw_path)
+    else:
+        vectors = _full_precision_vectors(db.index, path)
+        np.save(raw_path, vectors)
+        db = copy.copy(db)
+        db.index = build_index(vectors, settings.VECTOR_INDEX_TYPE)
+        logger.info(f"Compressed {len(vectors)} vectors into a {settings.VECTOR_INDEX_TYPE} index")
+    db.save_local(path)
+
+
+# returns a copy of a loaded database that searches with a different index type
+# (used to compare index types on the same data without touching the one on disk)
+def with_index_type(db, index_type: str, rerank_factor: int = 0):
+    import copy
+    vectors = _full_precision_vectors(db.index, active_vectorstore_path() or "")
+    clone = copy.copy(db)
+    clone.index = build_index(vectors, index_type, rerank_factor=rerank_factor)
+    return clone
+
+
+# measures how well each compressed index finds the same top-k results as the exact one
+# queries are midpoints between two random stored chunks (somewhere a real question could land)
+def compare_index_recall(vectors=None, k: int = 5, index_types=INDEX_TYPES, n_queries: int = 200,
+                         rerank_factor: int = 0, seed: int = 0):
+    import time
+    import faiss
+    import numpy as np
+
+    if vectors is None:
+        db = load_vectorstore()
+        if db is None:
+            raise ValueError("No vectorstore to evaluate. Upload PDFs first.")
+        vectors = _full_precision_vectors(db.index, active_vectorstore_path() or "")
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    if len(vectors) < 2:
+        raise ValueError("Need at least 2 vectors to measure recall")
+
+    rng = np.random.default_rng(seed)
+    a = vectors[rng.integers(0, len(vectors), n_queries)]
+    b = vectors[rng.integers(0, len(vectors), n_queries)]
+    queries = np.ascontiguousarray((a + b) / 2, dtype="float32")
+    k = min(k, len(vectors))
+
+    exact = build_index(vectors, "flat", rerank_factor=0)
+    _, truth = exact.search(queries, k)
+
+    results = []
+    for index_type in index_types:
+        started = time.perf_counter()
+        index = build_index(vectors, index_type, rerank_factor=rerank_factor)
+        build_s = time.perf_counter() - started
+
+        started = time.perf_counter()
+        _, found = index.search(queries, k)
+        search_ms = (time.perf_counter() - started) * 1000 / len(queries)
+
+        hits = sum(len(set(f) & set(t)) for f, t in zip(found.tolist(), truth.tolist()))
+        index_bytes = len(faiss.serialize_index(index))
+        results.append({
+            "index_type": index_type,
+            "rerank_factor": rerank_factor if index_type != "flat" else 0,
+            f"recall@{k}": round(hits / (len(queries) * k), 4),
+            "index_bytes": index_bytes,
+            "bytes_per_vector": round(index_bytes / len(vectors), 1),
+            "build_s": round(build_s, 3),
+            "search_ms_per_query": round(search_ms, 4),
+        })
+    return results
 
 
 # completely replaces the database (used after deleting a PDF to rebuild from scratch)
@@ -100,23 +754,289 @@ def replace_vectorstore(chunks):
     save_vectorstore(chunks, replace=True)
 
 
-# loads the vector database from disk so we can search it
-def load_vectorstore():
+# loads one database folder for searching (memory-mapped when VECTOR_INDEX_MMAP is on)
+def _load_folder(path: str):
+    from langchain_community.vectorstores import FAISS
+    if settings.VECTOR_INDEX_MMAP:
+        # versions never change once published and we hold a lease on this one, so the
+        # index can be mapped instead of read: loading is instant and workers share the memory
+        import faiss
+        try:
+            return FAISS.load_local(
+                path,
+                get_embeddings(),
+                allow_dangerous_deserialization=True,
+                io_flags=getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY,
+            )
+        except Exception as e:
+            logger.info(f"Index cannot be memory-mapped ({e}), reading it instead")
+    return FAISS.load_local(
+        path,
+        get_embeddings(),
+        allow_dangerous_deserialization=True
+    )
+
+
+# loads a database so it can be added to: one flat index, with the shards put back together
+def _load_writable(path: str, embeddings):
+    from langchain_community.vectorstores import FAISS
+    folders = [shard_folder(path, shard) for shard in range(shard_count(path))] or [path]
+    db = None
+    for folder in folders:
+        part = FAISS.load_local(
+            folder,
+            embeddings,
+            allow_dangerous_deserialization=True  # needed for loading saved FAISS files
+        )
+        # compressed indexes cant be added to, so go back to the full-precision vectors first
+        _restore_full_precision(part, folder)
+        if db is None:
+            db = part
+        else:
+            db.merge_from(part)
+    return db
+
+
+# loads the vector database from disk so we can search it (the live version unless a path is given)
+def load_vectorstore(path=None):
+    path = path or active_vectorstore_path()
     # if no database exists yet, return nothing
-    if not os.path.exists(settings.VECTOR_DB_PATH):
-        logger.warning(f"Vectorstore not found at {settings.VECTOR_DB_PATH}")
+    if path is None:
+        logger.warning("Vectorstore not found at %s", settings.VECTOR_DB_PATH)
         return None
     
     try:
         # load and return the database
-        logger.info(f"Loading vectorstore from {settings.VECTOR_DB_PATH}")
-        db = FAISS.load_local(
-            settings.VECTOR_DB_PATH,
-            get_embeddings(),
-            allow_dangerous_deserialization=True
-        )
+        logger.info("Loading vectorstore from %s", path)
+        shards = shard_count(path)
+        if shards:
+            # one logical database: searches go to every shard in parallel
+            folders = [shard_folder(path, shard) for shard in range(shards)]
+            db = combine_shards([_load_folder(folder) for folder in folders], folders)
+        else:
+            db = _load_folder(path)
         logger.info("Vectorstore loaded successfully")
         return db
     except Exception as e:
-        logger.error(f"Failed to load vectorstore: {e}")
+        logger.error("Failed to load vectorstore: %s", e)
         raise
+
+
+# the loaded database is kept in memory and shared by all requests of this process
+# it gets reloaded automatically (once) when any process publishes a new version
+_vectorstore_cache = None
+_vectorstore_signature = None
+# shared lock on the loaded version, so no writer deletes it while we use it
+_vectorstore_lease = None
+_vectorstore_cache_lock = threading.Lock()
+_vectorstore_last_used = 0.0
+
+
+# returns something that changes whenever a new version goes live (or None if there is none)
+def index_signature():
+    version = current_version()
+    if version is not None:
+        return ("version", version) if version else None
+    # the old layout without versions (copied in by hand, or written by an older release)
+    try:
+        stat = os.stat(os.path.join(settings.VECTOR_DB_PATH, "index.faiss"))
+    except OSError:
+        return None
+    return ("legacy", stat.st_mtime_ns, stat.st_size)
+
+
+def _release_lease():
+    global _vectorstore_lease
+    if _vectorstore_lease is not None:
+        _vectorstore_lease.close()
+        _vectorstore_lease = None
+
+
+# returns the cached vector database, loading it from disk only when a new version is live
+def get_vectorstore():
+    global _vectorstore_cache, _vectorstore_signature, _vectorstore_lease, _vectorstore_last_used
+    _vectorstore_last_used = time.monotonic()
+    signature = index_signature()
+    with _vectorstore_cache_lock:
+        if _vectorstore_cache is not None and signature == _vectorstore_signature:
+            _CACHE_HIT.inc()
+            return _vectorstore_cache
+        # a few tries, in case a writer publishes another version while we load this one
+        for _ in range(3):
+            # the database was deleted (reset or last PDF removed)
+            if signature is None:
+                _vectorstore_cache = None
+                _vectorstore_signature = None
+                _release_lease()
+                return None
+            path = active_vectorstore_path()
+            try:
+                lease = hold_shared(os.path.join(path, READERS_LOCK_FILE))
+            except OSError:
+                # the version was replaced and deleted between reading CURRENT and locking it
+                signature = index_signature()
+                continue
+            # old versions are only deleted when they are not live, so if CURRENT still
+            # names this one, it is complete and stays on disk while we hold the lease
+            if index_signature() != signature:
+                lease.close()
+                signature = index_signature()
+                continue
+            _CACHE_MISS.inc()
+            try:
+                db = load_vectorstore(path)
+            except Exception:
+                lease.close()
+                raise
+            _release_lease()
+            _vectorstore_cache, _vectorstore_signature, _vectorstore_lease = db, signature, lease
+            MEMORY.check_soon()
+            return db
+        raise RuntimeError("Vectorstore kept changing while loading it, try again")
+
+
+# drops the loaded database to free its memory (the next question loads it again)
+def unload_vectorstore():
+    global _vectorstore_cache, _vectorstore_signature
+    with _vectorstore_cache_lock:
+        _vectorstore_cache = None
+        _vectorstore_signature = None
+        _release_lease()
+
+
+# drops the embedding model; the loaded database holds on to it, so that is dropped too
+def unload_embeddings():
+    global _embeddings_cache
+    unload_vectorstore()
+    with _embeddings_lock:
+        _embeddings_cache = None
+
+
+_CACHE_HIT = CACHE_REQUESTS_TOTAL.labels(cache="vectorstore", result="hit")
+_CACHE_MISS = CACHE_REQUESTS_TOTAL.labels(cache="vectorstore", result="miss")
+
+
+# how many vectors the loaded index holds (nothing until the first load)
+def _loaded_index_size():
+    db = _vectorstore_cache
+    return db.index.ntotal if db is not None else None
+
+
+# size of the live version's files on disk
+def _index_disk_bytes():
+    path = active_vectorstore_path()
+    if path is None or not os.path.isdir(path):
+        return 0
+    return sum(
+        os.path.getsize(os.path.join(path, name))
+        for name in os.listdir(path)
+        if os.path.isfile(os.path.join(path, name))
+    )
+
+
+gauge_func("vector_index_vectors", "Vectors in the loaded search index", _loaded_index_size)
+gauge_func("vector_index_disk_bytes", "Bytes of the vector database on disk", _index_disk_bytes)
+
+
+# bytes of the vectors (codes) a FAISS index keeps in memory
+def _index_bytes(index) -> int:
+    import faiss
+    if isinstance(index, ShardedIndex):
+        return sum(_index_bytes(shard) for shard in index.shards)
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexRefine):
+        return _index_bytes(index.base_index) + _index_bytes(index.refine_index)
+    code_size = getattr(index, "code_size", None) or index.d * 4
+    return index.ntotal * code_size
+
+
+# rough size of a Python value with everything it contains (strings, dicts, lists)
+def _object_bytes(value) -> int:
+    import sys
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(_object_bytes(k) + _object_bytes(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(_object_bytes(item) for item in value)
+    return size
+
+
+# the chunk texts and metadata of a database, estimated from up to 1000 evenly spread chunks
+def _docstore_bytes(db) -> int:
+    import sys
+    ids = list(db.index_to_docstore_id.values())
+    if not ids:
+        return 0
+    sample = ids[::max(1, len(ids) // 1000)]
+    per_chunk = sum(
+        sys.getsizeof(doc) + _object_bytes(doc.page_content) + _object_bytes(doc.metadata) + 2 * sys.getsizeof(chunk_id)
+        for chunk_id, doc in ((chunk_id, db.docstore.search(chunk_id)) for chunk_id in sample)
+    ) / len(sample)
+    # plus the position -> id and id -> document dicts
+    return int(per_chunk * len(ids)) + 2 * sys.getsizeof(db.index_to_docstore_id)
+
+
+# bytes of the embedding model's weights (None for backends that do not expose them, like onnx)
+def _model_bytes(embeddings):
+    model = getattr(embeddings, "model", None) or getattr(embeddings, "_client", None)
+    if not hasattr(model, "state_dict"):
+        return None
+    total = 0
+    for value in model.state_dict().values():
+        # int8 layers keep their weight and bias together in one tuple
+        for tensor in value if isinstance(value, tuple) else (value,):
+            if hasattr(tensor, "element_size"):
+                total += tensor.numel() * tensor.element_size()
+    return total
+
+
+# the sizes only change when another database or model is loaded, so they are kept per object.
+# held by weak reference: a strong one would keep an unloaded object alive, and an id() can be
+# reused by the next object loaded after it
+_size_memo = {}
+
+
+def _memoized(key: str, obj, estimate):
+    if obj is None:
+        _size_memo.pop(key, None)
+        return 0
+    memo = _size_memo.get(key)
+    if memo is not None and memo[0]() is obj:
+        return memo[1]
+    size = estimate(obj)
+    try:
+        _size_memo[key] = (weakref.ref(obj), size)
+    except TypeError:
+        # cannot be weakly referenced, estimated on every call then
+        _size_memo.pop(key, None)
+    return size
+
+
+def _writer_bytes() -> int:
+    return sum(
+        _index_bytes(writer.db.index) + _docstore_bytes(writer.db)
+        for writer in list(_open_writers) if writer.db is not None
+    )
+
+
+MEMORY.track(
+    "embedding_model",
+    lambda: _memoized("embedding_model", _embeddings_cache, _model_bytes),
+    unload=unload_embeddings,
+    # questions embed through the loaded database, so that counts as using the model too
+    last_used=lambda: max(_embeddings_last_used, _vectorstore_last_used),
+)
+MEMORY.track(
+    "index_vectors",
+    lambda: _memoized("index_vectors", _vectorstore_cache, lambda db: _index_bytes(db.index)),
+    unload=unload_vectorstore,
+    last_used=lambda: _vectorstore_last_used,
+)
+MEMORY.track(
+    "docstore",
+    lambda: _memoized("docstore", _vectorstore_cache, _docstore_bytes),
+    unload=unload_vectorstore,
+    last_used=lambda: _vectorstore_last_used,
+)
+# a writer's copy is only held while it writes, so it cannot be unloaded
+MEMORY.track("index_writer", _writer_bytes)
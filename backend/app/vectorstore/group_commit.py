@@ -0,0 +1,168 @@
+# one index writer per process that saves the files of concurrent ingests together.
+# ingest threads read, split and embed their file themselves and hand the embedded batches to
+# the writer thread, which adds them to one open VectorstoreWriter. it commits once no file is in
+# progress and INDEX_COMMIT_WINDOW_MS went by without a new one (and every INGEST_COMMIT_CHUNKS
+# chunks while files are in progress), so a 15-file course pack costs one index load and a few
+# saves instead of 15 of each. a file only counts as ingested when the commit holding it is live
+import logging
+import queue
+import threading
+import uuid
+from concurrent.futures import Future
+
+from app.core.config import settings
+from app.core.metrics import histogram
+from app.vectorstore.faiss_store import VectorstoreWriter, document_chunk_ids, next_chunk_ids
+
+logger = logging.getLogger(__name__)
+
+GROUP_COMMIT_DOCUMENTS = histogram(
+    "index_group_commit_documents", "Documents made searchable by one index commit",
+    buckets=(1, 2, 4, 8, 16, 32, 64),
+)
+
+
+class PendingDocument:
+    """A file on its way into the index through the group writer"""
+
+    def __init__(self, writer, filename: str, fingerprint: dict):
+        self._writer = writer
+        self.filename = filename
+        # the manifest entry; only the writer thread changes it
+        self.entry = {**fingerprint, "doc_id": uuid.uuid4().hex, "pages": 0, "chunks": 0}
+        # gets the manifest entry once a commit holding the whole file is live
+        self.committed = Future()
+
+    # queues one embedded batch (blocks while the writer is that far behind)
+    def add(self, chunks, vectors):
+        self._writer._submit(("batch", self, chunks, vectors))
+
+    # the whole file was added; returns the future of the commit that will hold it
+    def finish(self, pages: int) -> Future:
+        self._writer._submit(("done", self, pages))
+        return self.committed
+
+    # the file failed, whatever was added of it is taken out again
+    def abort(self, error: BaseException):
+        self._writer._submit(("error", self, error))
+
+
+class _Group:
+    def __init__(self):
+        # filename -> document still being added, and documents waiting for the next commit
+        self.open = {}
+        self.finished = []
+
+    def fail(self, error: BaseException):
+        for document in list(self.open.values()) + self.finished:
+            if not document.committed.done():
+                document.committed.set_exception(error)
+        self.open.clear()
+        self.finished.clear()
+
+
+class GroupCommitWriter:
+    """Collects the files of concurrent ingests and commits them to the index together"""
+
+    def __init__(self):
+        # bounded, so ingest threads cannot get far ahead of the writer (memory stays flat)
+        self._ops = queue.Queue(maxsize=max(2, 2 * settings.INGEST_QUEUE_BATCHES))
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+    # starts a file; uploading a file again under the same name replaces its old chunks
+    def begin(self, filename: str, fingerprint: dict) -> PendingDocument:
+        document = PendingDocument(self, filename, fingerprint)
+        self._submit(("begin", document))
+        return document
+
+    def _submit(self, op):
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="index_writer", daemon=True)
+                self._thread.start()
+        self._ops.put(op)
+
+    def _run(self):
+        while True:
+            op = self._ops.get()
+            if op[1].committed.done():
+                # left over from a file whose group failed
+                continue
+            group = _Group()
+            group.open[op[1].filename] = op[1]
+            try:
+                # holds the write lock (and the loaded index) until the group is committed
+                with VectorstoreWriter() as writer:
+                    self._write_group(writer, group, op)
+            except Exception as e:
+                logger.error(f"Index group commit failed: {e}")
+                group.fail(e)
+
+    def _write_group(self, writer, group: _Group, op):
+        window = max(0, settings.INDEX_COMMIT_WINDOW_MS) / 1000
+        while True:
+            if not op[1].committed.done():
+                self._apply(writer, group, op)
+            if 0 < settings.INGEST_COMMIT_CHUNKS <= writer.pending:
+                self._commit(writer, group)
+            try:
+                # while a file is in progress wait for it, after that only for the window
+                op = self._ops.get(timeout=None if group.open else window)
+            except queue.Empty:
+                self._commit(writer, group)
+                return
+
+    def _apply(self, writer, group: _Group, op):
+        kind, document = op[0], op[1]
+        try:
+            if kind == "begin":
+                earlier = group.open.pop(document.filename, None)
+                if earlier is not None and earlier is not document:
+                    self._drop(writer, earlier, RuntimeError(f"{document.filename} was uploaded again"))
+                writer.remove_document(document.filename)
+                group.open[document.filename] = document
+            elif kind == "batch":
+                chunks, vectors = op[2], op[3]
+                writer.add_embedded(chunks, vectors, next_chunk_ids(document.entry, len(chunks)))
+            elif kind == "done":
+                document.entry["pages"] = op[2]
+                writer.record_document(document.filename, dict(document.entry))
+                group.open.pop(document.filename, None)
+                group.finished.append(document)
+            else:
+                group.open.pop(document.filename, None)
+                self._drop(writer, document, op[2])
+        except Exception as e:
+            # only this file fails, the others in the group go on
+            logger.error(f"Could not add {document.filename} to the index: {e}")
+            group.open.pop(document.filename, None)
+            self._drop(writer, document, e)
+
+    # takes a file's chunks out again and fails its future
+    def _drop(self, writer, document: PendingDocument, error: BaseException):
+        writer.delete_ids(document_chunk_ids(document.entry))
+        recorded = writer.documents.get(document.filename)
+        if recorded is not None and recorded.get("doc_id") == document.entry["doc_id"]:
+            # an earlier commit holds part of it (marked partial), take out its manifest entry too
+            writer.remove_document(document.filename)
+        if not document.committed.done():
+            document.committed.set_exception(error)
+
+    def _commit(self, writer, group: _Group):
+        # files still in progress go in as partial, so a reconcile after a crash ingests them again
+        for document in group.open.values():
+            if document.entry["chunks"]:
+                writer.record_document(document.filename, {**document.entry, "partial": True})
+        writer.commit()
+        # a later failure of this writer must not take back files that were reported as ingested
+        writer.keep_commits()
+        if group.finished:
+            GROUP_COMMIT_DOCUMENTS.observe(len(group.finished))
+            logger.info(f"Committed {len(group.finished)} documents to the index together")
+        for document in group.finished:
+            document.committed.set_result(dict(document.entry))
+        group.finished.clear()
+
+
+INDEX_WRITER = GroupCommitWriter()
@@ -0,0 +1,170 @@
+# splits the vector database into VECTOR_INDEX_SHARDS independent indexes
+# every document lives in one shard (picked from a hash of its id), and each shard is a normal
+# database folder inside the version:  v000007/shard-00/index.faiss, v000007/shard-01/...
+# a write only re-saves the shards it changed; the others are hard-linked from the previous version.
+# for searching, ShardedIndex puts the loaded shards behind one index: every shard is searched
+# at the same time (FAISS lets go of the GIL while it searches) and the top-k lists are merged
+import hashlib
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+SHARD_PREFIX = "shard-"
+
+# threads that search the shards (grown when there are more shards than threads)
+_pool = None
+_pool_size = 0
+_pool_lock = threading.Lock()
+
+
+def shard_folder(path: str, shard: int) -> str:
+    return os.path.join(path, f"{SHARD_PREFIX}{shard:02d}")
+
+
+# how many shard folders a version has (0 when it is a single database)
+def shard_count(path: str) -> int:
+    count = 0
+    while os.path.isdir(shard_folder(path, count)):
+        count += 1
+    return count
+
+
+# the shard of a chunk: chunk ids are "<document id>-<n>", so a document always stays together
+def shard_of(chunk_id: str, shards: int) -> int:
+    if shards <= 1:
+        return 0
+    document_id = chunk_id.rsplit("-", 1)[0]
+    return int.from_bytes(hashlib.blake2b(document_id.encode("utf-8"), digest_size=8).digest(), "big") % shards
+
+
+def _search_pool(shards: int) -> ThreadPoolExecutor:
+    global _pool, _pool_size
+    with _pool_lock:
+        if _pool is None or _pool_size < shards:
+            # searches already running on the old pool finish there, then its threads exit
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ThreadPoolExecutor(max_workers=shards, thread_name_prefix="shard_search")
+            _pool_size = shards
+        return _pool
+
+
+class ShardedIndex:
+    """Searches several FAISS indexes in parallel as if they were one (positions run shard after shard)"""
+
+    def __init__(self, shards: list, paths: list):
+        import numpy as np
+        self.shards = shards
+        self.paths = paths
+        self.d = shards[0].d
+        self.metric_type = shards[0].metric_type
+        self.is_trained = True
+        self.offsets = np.cumsum([0] + [shard.ntotal for shard in shards])
+        self.ntotal = int(self.offsets[-1])
+
+    def _locate(self, position: int):
+        import numpy as np
+        shard = int(np.searchsorted(self.offsets, position, side="right")) - 1
+        return shard, position - int(self.offsets[shard])
+
+    # searches every shard at once and keeps the k best results per query
+    def _gather(self, x, k: int, with_vectors: bool):
+        import faiss
+        import numpy as np
+        x = np.ascontiguousarray(x, dtype=np.float32)
+
+        def search(shard):
+            if shard.ntotal == 0:
+                return None
+            if with_vectors:
+                return shard.search_and_reconstruct(x, min(k, shard.ntotal))
+            return shard.search(x, min(k, shard.ntotal))
+
+        found = list(_search_pool(len(self.shards)).map(search, self.shards))
+        distances, labels, vectors = [], [], []
+        for offset, result in zip(self.offsets, found):
+            if result is None:
+                continue
+            distances.append(result[0])
+            labels.append(np.where(result[1] >= 0, result[1] + offset, -1))
+            if with_vectors:
+                vectors.append(result[2])
+        n = len(x)
+        if not distances:
+            empty = (np.full((n, k), np.inf, dtype=np.float32), np.full((n, k), -1, dtype=np.int64))
+            return empty + ((np.zeros((n, k, self.d), dtype=np.float32),) if with_vectors else ())
+        distances = np.concatenate(distances, axis=1)
+        labels = np.concatenate(labels, axis=1)
+        # missing results (-1) must sort last whichever way the metric goes
+        larger_is_better = self.metric_type == faiss.METRIC_INNER_PRODUCT
+        keys = np.where(labels >= 0, -distances if larger_is_better else distances, np.inf)
+        order = np.argsort(keys, axis=1, kind="stable")[:, :k]
+        rows = np.arange(n)[:, None]
+        merged = [distances[rows, order], labels[rows, order]]
+        if with_vectors:
+            merged.append(np.concatenate(vectors, axis=1)[rows, order])
+        if order.shape[1] < k:
+            # fewer vectors than k in total: pad like FAISS does
+            pad = k - order.shape[1]
+            merged[0] = np.pad(merged[0], ((0, 0), (0, pad)), constant_values=np.inf)
+            merged[1] = np.pad(merged[1], ((0, 0), (0, pad)), constant_values=-1)
+            if with_vectors:
+                merged[2] = np.pad(merged[2], ((0, 0), (0, pad), (0, 0)))
+        return tuple(merged)
+
+    def search(self, x, k: int):
+        return self._gather(x, k, with_vectors=False)
+
+    def search_and_reconstruct(self, x, k: int):
+        return self._gather(x, k, with_vectors=True)
+
+    def reconstruct(self, position: int):
+        shard, local = self._locate(int(position))
+        return self.shards[shard].reconstruct(local)
+
+    def reconstruct_n(self, start: int, n: int):
+        import numpy as np
+        return np.vstack([self.reconstruct(position) for position in range(start, start + n)]) if n else \
+            np.zeros((0, self.d), dtype=np.float32)
+
+
+# puts loaded shard databases together into one database that reads like a single one
+def combine(databases: list, paths: list):
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    from langchain_community.vectorstores import FAISS
+    docs = {}
+    index_to_docstore_id = {}
+    offset = 0
+    for db in databases:
+        for position, chunk_id in db.index_to_docstore_id.items():
+            index_to_docstore_id[offset + position] = chunk_id
+            docs[chunk_id] = db.docstore.search(chunk_id)
+        offset += db.index.ntotal
+    index = ShardedIndex([db.index for db in databases], paths)
+    return FAISS(databases[0].embeddings, index, InMemoryDocstore(docs), index_to_docstore_id)
+
+
+# a database with only the chunks of one shard, cut out of the writer's full (flat) database
+def extract(db, shard: int, shards: int):
+    import faiss
+    import numpy as np
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    from langchain_community.vectorstores import FAISS
+    positions = [p for p, chunk_id in sorted(db.index_to_docstore_id.items()) if shard_of(chunk_id, shards) == shard]
+    index = faiss.IndexFlatL2(db.index.d)
+    if positions:
+        index.add(db.index.reconstruct_batch(np.array(positions, dtype=np.int64)))
+    ids = [db.index_to_docstore_id[p] for p in positions]
+    docs = {chunk_id: db.docstore.search(chunk_id) for chunk_id in ids}
+    return FAISS(db.embeddings, index, InMemoryDocstore(docs), dict(enumerate(ids)))
+
+
+# copies an unchanged shard from the previous version (hard links, so no bytes are written)
+def link_shard(source: str, target: str):
+    os.makedirs(target)
+    for name in os.listdir(source):
+        try:
+            os.link(os.path.join(source, name), os.path.join(target, name))
+        except OSError:
+            shutil.copy2(os.path.join(source, name), os.path.join(target, name))
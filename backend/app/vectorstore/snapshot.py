@@ -0,0 +1,199 @@
+# portable snapshots of the vector database, to bring up a new node without re-ingesting every PDF
+#   manifest.json  format, embedding model, dimensions, vector count, size + sha256 of every file,
+#                  and the index manifest (which chunks came from which upload)
+#   vectors.npy    float32 [count, dimensions] in index order (np.load(mmap_mode="r") maps it, no copy)
+#   chunks.jsonl   one {"id", "text", "metadata"} per line, in the same order as the vectors
+#   uploads/       the uploaded files, so the new node reconciles exactly like the old one
+# nothing in a snapshot is pickled: importing one only parses JSON and a numpy array, and every
+# file is checked against its checksum before the data goes live, so snapshots can be shared
+#
+# usage (from the backend folder):
+#   python -m app.vectorstore.snapshot export /backups/snapshot-1
+#   python -m app.vectorstore.snapshot import /backups/snapshot-1
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sys
+import time
+
+from app.core.config import settings
+from app.vectorstore.faiss_store import (
+    VectorstoreWriter, _full_precision_vectors, active_vectorstore_path, build_index, get_embeddings,
+    index_settings, load_vectorstore, read_manifest, vectorstore_write_lock,
+)
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FORMAT = 1
+MANIFEST_FILE = "manifest.json"
+VECTORS_FILE = "vectors.npy"
+CHUNKS_FILE = "chunks.jsonl"
+UPLOADS_FOLDER = "uploads"
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _upload_dir() -> str:
+    from app.services.ingestion_service import UPLOAD_DIR
+    return UPLOAD_DIR
+
+
+# writes the live database (and the uploads it was built from) into a new folder
+def export_snapshot(dest: str) -> dict:
+    import numpy as np
+    if os.path.exists(dest):
+        raise FileExistsError(f"'{dest}' already exists")
+    temp = f"{dest}.tmp-{os.getpid()}"
+    # the write lock keeps the index and its manifest from changing while we copy them
+    with vectorstore_write_lock():
+        path = active_vectorstore_path()
+        db = load_vectorstore(path)
+        if db is None:
+            raise ValueError("There is no vector database to export")
+        index_manifest = read_manifest(path) or {"complete": False, "documents": {}}
+        try:
+            os.makedirs(os.path.join(temp, UPLOADS_FOLDER))
+            vectors = np.ascontiguousarray(_full_precision_vectors(db.index, path), dtype="<f4")
+            np.save(os.path.join(temp, VECTORS_FILE), vectors, allow_pickle=False)
+            with open(os.path.join(temp, CHUNKS_FILE), "w", encoding="utf-8") as f:
+                for position in range(db.index.ntotal):
+                    chunk_id = db.index_to_docstore_id[position]
+                    doc = db.docstore.search(chunk_id)
+                    record = {"id": chunk_id, "text": doc.page_content, "metadata": doc.metadata}
+                    f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+            documents = {}
+            for filename, entry in index_manifest["documents"].items():
+                source = os.path.join(_upload_dir(), filename)
+                if not os.path.exists(source) or _sha256(source) != entry.get("sha256"):
+                    # the new node would not be able to tell which chunks belong to this file
+                    logger.warning(f"Upload {filename} is missing or changed, leaving it out of the snapshot")
+                    continue
+                shutil.copy2(source, os.path.join(temp, UPLOADS_FOLDER, filename))
+                documents[filename] = entry
+            complete = index_manifest["complete"] and len(documents) == len(index_manifest["documents"])
+        except BaseException:
+            shutil.rmtree(temp, ignore_errors=True)
+            raise
+
+    files = {}
+    for root, _, names in os.walk(temp):
+        for name in names:
+            full = os.path.join(root, name)
+            relative = os.path.relpath(full, temp).replace(os.sep, "/")
+            files[relative] = {"bytes": os.path.getsize(full), "sha256": _sha256(full)}
+    manifest = {
+        "format": SNAPSHOT_FORMAT,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "embedding_model": settings.EMBEDDING_MODEL,
+        "dimensions": int(vectors.shape[1]),
+        "count": int(vectors.shape[0]),
+        "dtype": "float32",
+        "metric": "l2",
+        "settings": index_manifest.get("settings", index_settings()),
+        "complete": complete,
+        "documents": documents,
+        "files": files,
+    }
+    with open(os.path.join(temp, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(temp, dest)
+    logger.info(f"Exported {manifest['count']} vectors and {len(documents)} uploads to {dest}")
+    return manifest
+
+
+# checks a snapshot folder against its manifest and returns the manifest
+def verify_snapshot(src: str) -> dict:
+    with open(os.path.join(src, MANIFEST_FILE)) as f:
+        manifest = json.load(f)
+    if manifest.get("format") != SNAPSHOT_FORMAT:
+        raise ValueError(f"Unsupported snapshot format {manifest.get('format')!r}")
+    for relative, expected in manifest["files"].items():
+        if relative.startswith("/") or ".." in relative.split("/"):
+            raise ValueError(f"Snapshot lists a file outside its folder: {relative}")
+        full = os.path.join(src, *relative.split("/"))
+        if not os.path.isfile(full) or os.path.getsize(full) != expected["bytes"] or _sha256(full) != expected["sha256"]:
+            raise ValueError(f"Snapshot file {relative} is missing or does not match its checksum")
+    for required in (VECTORS_FILE, CHUNKS_FILE):
+        if required not in manifest["files"]:
+            raise ValueError(f"Snapshot has no {required}")
+    for filename in manifest["documents"]:
+        if os.path.basename(filename) != filename or f"{UPLOADS_FOLDER}/{filename}" not in manifest["files"]:
+            raise ValueError(f"Snapshot lists an upload it does not contain: {filename}")
+    return manifest
+
+
+# makes a snapshot the live database of this node (the current one is replaced, as one new version)
+def import_snapshot(src: str) -> dict:
+    import numpy as np
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.documents import Document
+
+    started = time.perf_counter()
+    manifest = verify_snapshot(src)
+    if manifest["embedding_model"] != settings.EMBEDDING_MODEL:
+        raise ValueError(
+            f"Snapshot was made with {manifest['embedding_model']}, this node uses {settings.EMBEDDING_MODEL}"
+        )
+    # mapped, not read: FAISS copies the vectors straight from the page cache into its index
+    vectors = np.load(os.path.join(src, VECTORS_FILE), mmap_mode="r", allow_pickle=False)
+    if vectors.dtype != np.float32 or vectors.shape != (manifest["count"], manifest["dimensions"]):
+        raise ValueError(f"Snapshot vectors are {vectors.dtype} {vectors.shape}, the manifest says otherwise")
+
+    docs = {}
+    index_to_docstore_id = {}
+    with open(os.path.join(src, CHUNKS_FILE), encoding="utf-8") as f:
+        for position, line in enumerate(f):
+            record = json.loads(line)
+            docs[record["id"]] = Document(page_content=record["text"], metadata=record["metadata"], id=record["id"])
+            index_to_docstore_id[position] = record["id"]
+    if len(index_to_docstore_id) != len(vectors):
+        raise ValueError(f"Snapshot has {len(vectors)} vectors but {len(index_to_docstore_id)} chunks")
+
+    with VectorstoreWriter(replace=True) as writer:
+        upload_dir = _upload_dir()
+        os.makedirs(upload_dir, exist_ok=True)
+        for filename in manifest["documents"]:
+            shutil.copy2(os.path.join(src, UPLOADS_FOLDER, filename), os.path.join(upload_dir, filename))
+        index = build_index(vectors, "flat", rerank_factor=0)
+        db = FAISS(get_embeddings(), index, InMemoryDocstore(docs), index_to_docstore_id)
+        # chunks made with other settings are rebuilt from the copied uploads by the next reconcile
+        complete = manifest["complete"] and manifest["settings"] == index_settings()
+        writer.set_database(db, manifest["documents"], complete)
+    from app.services import job_store
+    for filename, entry in manifest["documents"].items():
+        job_store.set_status(filename, "completed", pages=entry["pages"], chunks=entry["chunks"])
+    seconds = time.perf_counter() - started
+    logger.info(f"Imported {len(vectors)} vectors from {src} in {seconds:.1f}s")
+    return {"vectors": len(vectors), "uploads": len(manifest["documents"]), "complete": complete, "seconds": seconds}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Export or import a portable vector database snapshot")
+    parser.add_argument("command", choices=("export", "import", "verify"))
+    parser.add_argument("path", help="snapshot folder")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(name)s: %(message)s")
+    if args.command == "export":
+        manifest = export_snapshot(args.path)
+        print(f"exported {manifest['count']} vectors, {len(manifest['documents'])} uploads to {args.path}")
+    elif args.command == "verify":
+        manifest = verify_snapshot(args.path)
+        print(f"ok: {manifest['count']} vectors x {manifest['dimensions']} ({manifest['embedding_model']})")
+    else:
+        result = import_snapshot(args.path)
+        print(f"imported {result['vectors']} vectors, {result['uploads']} uploads in {result['seconds']:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1 @@
+# performance checks and benchmarks for the backend (run from the backend folder)
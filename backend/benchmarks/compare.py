@@ -0,0 +1,53 @@
+# diffs two benchmark result files and flags stages that got slower
+#
+# usage (from the backend folder):
+#   python -m benchmarks.compare baseline.json new.json [--threshold 0.10]
+import argparse
+import json
+import sys
+
+# the latency numbers compared for every stage
+METRICS = ("p50_ms", "p95_ms", "p99_ms")
+
+
+# returns one row per stage with the current/baseline ratio of each metric
+def compare_results(baseline: dict, current: dict, threshold: float = 0.10) -> list:
+    rows = []
+    for stage, now in current.get("stages", {}).items():
+        before = baseline.get("stages", {}).get(stage)
+        if not before:
+            continue
+        ratios = {m: (now[m] / before[m]) if before.get(m) else None for m in METRICS}
+        # p99 on a few dozen samples is noisy, so only p50 and p95 decide a regression
+        regressed = any(ratios[m] is not None and ratios[m] > 1 + threshold for m in ("p50_ms", "p95_ms"))
+        rows.append({"stage": stage, "ratios": ratios, "regressed": regressed})
+    return rows
+
+
+def print_comparison(rows: list):
+    print(f"{'stage':<18} " + " ".join(f"{m:>9}" for m in METRICS) + "  (current / baseline)")
+    for row in rows:
+        cells = " ".join(
+            f"{row['ratios'][m]:>8.2f}x" if row["ratios"][m] is not None else f"{'-':>9}" for m in METRICS
+        )
+        print(f"{row['stage']:<18} {cells}" + ("  REGRESSED" if row["regressed"] else ""))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=0.10)
+    args = parser.parse_args(argv)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    rows = compare_results(baseline, current, args.threshold)
+    print_comparison(rows)
+    return 1 if any(row["regressed"] for row in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,113 @@
+# generates a synthetic study corpus (pages of lecture-note-like text, questions, PDFs)
+# everything is seeded so two runs with the same arguments produce the same corpus
+import random
+
+# topics with their own vocabulary so retrieval has something real to find
+TOPICS = {
+    "apriori": "apriori frequent itemset support confidence candidate generation pruning lattice transaction basket",
+    "fpgrowth": "fp-growth tree header table conditional pattern base prefix path compression mining",
+    "clustering": "k-means centroid cluster distance euclidean silhouette elbow hierarchical dendrogram linkage",
+    "classification": "decision tree entropy information gain gini split leaf pruning overfitting accuracy",
+    "bayes": "naive bayes prior posterior likelihood conditional probability independence laplace smoothing",
+    "neural": "neural network neuron activation sigmoid backpropagation gradient descent epoch learning rate",
+    "regression": "linear regression least squares residual coefficient slope intercept variance error",
+    "warehouse": "data warehouse olap cube dimension fact table star schema snowflake etl",
+}
+_FILLER = "the of and a to in is that for this with as are be by on it from which can".split()
+
+
+# one sentence mostly about a single topic
+def _sentence(rng: random.Random, topic_words: list) -> str:
+    words = []
+    for _ in range(rng.randint(8, 18)):
+        words.append(rng.choice(topic_words) if rng.random() < 0.55 else rng.choice(_FILLER))
+    return " ".join(words).capitalize() + "."
+
+
+# returns the text of each page, every page focused on one topic
+def make_pages(count: int, seed: int = 42, sentences_per_page: int = 40) -> list:
+    rng = random.Random(seed)
+    topics = list(TOPICS)
+    pages = []
+    for _ in range(count):
+        topic_words = TOPICS[rng.choice(topics)].split()
+        paragraphs = []
+        for _ in range(sentences_per_page // 5):
+            paragraphs.append(" ".join(_sentence(rng, topic_words) for _ in range(5)))
+        pages.append("\n\n".join(paragraphs))
+    return pages
+
+
+# questions a student might ask about the corpus topics
+def make_questions(count: int, seed: int = 7) -> list:
+    rng = random.Random(seed)
+    templates = ["What is {}?", "Explain {} with an example.", "How does {} relate to {}?", "Define {} and {}."]
+    questions = []
+    for _ in range(count):
+        topic_words = TOPICS[rng.choice(list(TOPICS))].split()
+        template = rng.choice(templates)
+        questions.append(template.format(*rng.sample(topic_words, template.count("{}"))))
+    return questions
+
+
+# chunk-sized texts (used by the embedding benchmark)
+def sample_texts(count: int, words_per_text: int = 150, seed: int = 42) -> list:
+    rng = random.Random(seed)
+    vocabulary = " ".join(TOPICS.values()).split() + _FILLER
+    return [" ".join(rng.choice(vocabulary) for _ in range(words_per_text)) for _ in range(count)]
+
+
+# langchain documents for the pages, shaped like PyPDFLoader output
+def make_documents(pages: list, source: str = "synthetic.pdf") -> list:
+    from langchain_core.documents import Document
+    return [Document(page_content=text, metadata={"source": source, "page": i}) for i, text in enumerate(pages)]
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+# wraps text into lines short enough to fit an A4 page in 9pt Helvetica
+def _wrap(text: str, width: int = 95) -> list:
+    lines = []
+    for paragraph in text.split("\n"):
+        line = ""
+        for word in paragraph.split():
+            if len(line) + len(word) + 1 > width:
+                lines.append(line)
+                line = word
+            else:
+                line = f"{line} {word}".strip()
+        lines.append(line)
+    return lines
+
+
+# writes a minimal but valid text PDF (one page per entry) so ingest_pdf can be benchmarked
+def write_pdf(path: str, pages: list):
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for text in pages:
+        lines = "".join(f"({_escape(line)}) Tj T*\n" for line in _wrap(text))
+        stream = f"BT /F1 9 Tf 11 TL 40 800 Td\n{lines}ET"
+        objects.append(f"<< /Length {len(stream.encode('latin-1'))} >>\nstream\n{stream}\nendstream")
+        content_id = len(objects)
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>"
+        )
+        page_ids.append(len(objects))
+    kids = " ".join(f"{i} 0 R" for i in page_ids)
+    objects[1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>"
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref_at = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    for offset in offsets:
+        out += f"{offset:010d} 00000 n \n".encode("latin-1")
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref_at}\n%%EOF\n".encode("latin-1")
+    with open(path, "wb") as f:
+        f.write(out)
@@ -0,0 +1,107 @@
+# measures near-duplicate chunk dedup on a corpus with the kind of overlap students upload:
+# the same notes in two versions (a few words changed) and slides that copy half the pages
+# every file is ingested with dedup off and on, and the index size and search time are compared
+#
+# usage (from the backend folder):
+#   python -m benchmarks.dedup [--pages 100] [--max-hamming 3] [--min-ratio 0.3]
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+from benchmarks.corpus import make_pages, make_questions, write_pdf
+
+
+# a copy of the pages with one word changed in every paragraph of every other page
+def _revise(pages: list, seed: int) -> list:
+    rng = random.Random(seed)
+    revised = []
+    for number, page in enumerate(pages):
+        if number % 2:
+            revised.append(page)
+            continue
+        paragraphs = []
+        for paragraph in page.split("\n\n"):
+            words = paragraph.split(" ")
+            words[rng.randrange(len(words))] = rng.choice(["notably", "hence", "thus", "also"])
+            paragraphs.append(" ".join(words))
+        revised.append("\n\n".join(paragraphs))
+    return revised
+
+
+def _write_corpus(folder: str, pages: int):
+    notes = make_pages(pages, seed=1)
+    write_pdf(os.path.join(folder, "notes_v1.pdf"), notes)
+    write_pdf(os.path.join(folder, "notes_v2.pdf"), _revise(notes, seed=2) + make_pages(pages // 5, seed=3))
+    write_pdf(os.path.join(folder, "slides.pdf"), notes[::2] + make_pages(pages // 4, seed=4))
+
+
+def _folder_bytes(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+def measure(corpus: str, dedup: bool, max_hamming: int, questions: list) -> dict:
+    from app.core.config import settings
+    from app.services import ingestion_service
+    from app.vectorstore import faiss_store
+    with tempfile.TemporaryDirectory(prefix="rag_dedup_") as workdir:
+        settings.VECTOR_DB_PATH = os.path.join(workdir, "vector_db")
+        settings.STATE_DB_PATH = os.path.join(workdir, "state.db")
+        settings.TEXT_STORE_PATH = os.path.join(workdir, "text_store")
+        settings.DEDUP_CHUNKS = dedup
+        settings.DEDUP_MAX_HAMMING = max_hamming
+        ingestion_service.UPLOAD_DIR = corpus
+
+        started = time.perf_counter()
+        ingestion_service.reconcile_uploads()
+        ingest_seconds = time.perf_counter() - started
+        manifest = faiss_store.read_manifest(faiss_store.active_vectorstore_path())
+        db = faiss_store.load_vectorstore(faiss_store.active_vectorstore_path())
+        started = time.perf_counter()
+        for question in questions:
+            db.similarity_search(question, k=5)
+        search_ms = (time.perf_counter() - started) * 1000 / len(questions)
+        return {
+            "chunks": sum(entry["chunks"] for entry in manifest["documents"].values()),
+            "vectors": db.index.ntotal,
+            "index_kb": _folder_bytes(faiss_store.active_vectorstore_path()) // 1024,
+            "ingest_s": ingest_seconds,
+            "search_ms": search_ms,
+        }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Near-duplicate chunk dedup: index size with and without")
+    parser.add_argument("--pages", type=int, default=100)
+    parser.add_argument("--max-hamming", type=int, default=3)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--min-ratio", type=float, default=0.3,
+                        help="fail if dedup removes less than this share of the chunks")
+    args = parser.parse_args(argv)
+
+    from app.vectorstore.faiss_store import get_embeddings
+    get_embeddings().embed_query("warm-up")
+    questions = make_questions(args.queries)
+    with tempfile.TemporaryDirectory(prefix="rag_dedup_corpus_") as corpus:
+        _write_corpus(corpus, args.pages)
+        results = {dedup: measure(corpus, dedup, args.max_hamming, questions) for dedup in (False, True)}
+
+    print(f"{'dedup':<6} {'chunks':>7} {'vectors':>8} {'index KB':>9} {'ingest s':>9} {'search ms':>10}")
+    for dedup, r in results.items():
+        print(f"{'on' if dedup else 'off':<6} {r['chunks']:>7} {r['vectors']:>8} {r['index_kb']:>9} "
+              f"{r['ingest_s']:>9.2f} {r['search_ms']:>10.2f}")
+    off, on = results[False], results[True]
+    ratio = 1 - on["vectors"] / max(1, on["chunks"])
+    saved = 1 - on["index_kb"] / max(1, off["index_kb"])
+    print(f"dedup ratio {ratio:.0%} of chunks linked to a near-duplicate, index {saved:.0%} smaller")
+    if ratio < args.min_ratio:
+        print(f"FAIL: expected at least {args.min_ratio:.0%} of the chunks to be deduplicated")
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
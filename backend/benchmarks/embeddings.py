@@ -0,0 +1,92 @@
+# compares the embedding backends: speed (queries/sec, chunks/sec) and how close
+# their vectors are to the plain PyTorch ones (cosine similarity per text)
+#
+# usage (from the backend folder):
+#   python -m benchmarks.embeddings [--backends torch torch-int8 onnx] [--chunks 256] [--min-cosine 0.99]
+#
+# exits with 1 if any backend drifts below --min-cosine against the torch reference
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from app.core.config import settings
+from app.vectorstore.embeddings import EMBEDDING_BACKENDS, create_embeddings
+from benchmarks.corpus import sample_texts
+
+
+# row-wise cosine similarity between two sets of vectors
+def cosine_rows(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    a = a / np.linalg.norm(a, axis=1, keepdims=True)
+    b = b / np.linalg.norm(b, axis=1, keepdims=True)
+    return np.sum(a * b, axis=1)
+
+
+# times document embedding (batched) and query embedding (one at a time) for one backend
+def run_backend(backend: str, chunks: list, queries: list) -> dict:
+    started = time.perf_counter()
+    embeddings = create_embeddings(backend, settings.EMBEDDING_MODEL, settings.EMBEDDING_BATCH_SIZE)
+    # one warm-up call so lazy initialisation doesnt count as throughput
+    embeddings.embed_query("warm-up")
+    load_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    doc_vectors = np.asarray(embeddings.embed_documents(chunks), dtype="float32")
+    chunks_per_s = len(chunks) / (time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for query in queries:
+        embeddings.embed_query(query)
+    queries_per_s = len(queries) / (time.perf_counter() - started)
+
+    return {
+        "backend": backend,
+        "load_s": load_s,
+        "chunks_per_s": chunks_per_s,
+        "queries_per_s": queries_per_s,
+        "vectors": doc_vectors,
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark embedding backends")
+    parser.add_argument("--backends", nargs="+", default=list(EMBEDDING_BACKENDS), choices=EMBEDDING_BACKENDS)
+    parser.add_argument("--chunks", type=int, default=256, help="number of chunk-sized texts to embed")
+    parser.add_argument("--queries", type=int, default=64, help="number of single queries to embed")
+    parser.add_argument("--min-cosine", type=float, default=0.99, help="parity bound against torch")
+    args = parser.parse_args(argv)
+
+    chunks = sample_texts(args.chunks)
+    queries = sample_texts(args.queries, words_per_text=12, seed=7)
+
+    # torch is always run first because it is the reference for parity
+    backends = ["torch"] + [b for b in args.backends if b != "torch"]
+    results = []
+    for backend in backends:
+        try:
+            results.append(run_backend(backend, chunks, queries))
+        except Exception as e:
+            print(f"{backend:<11} skipped: {e}")
+
+    if not results or results[0]["backend"] != "torch":
+        print("The torch reference backend could not be loaded")
+        return 1
+
+    reference = results[0]["vectors"]
+    ok = True
+    print(f"{'backend':<11} {'load s':>7} {'chunks/s':>9} {'queries/s':>10} {'min cos':>8} {'mean cos':>9}")
+    for result in results:
+        cos = cosine_rows(reference, result["vectors"])
+        passed = float(cos.min()) >= args.min_cosine
+        ok = ok and passed
+        print(
+            f"{result['backend']:<11} {result['load_s']:>7.2f} {result['chunks_per_s']:>9.1f} "
+            f"{result['queries_per_s']:>10.1f} {cos.min():>8.4f} {cos.mean():>9.4f}"
+            + ("" if passed else "  FAIL")
+        )
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,78 @@
+# checks that importing the app stays fast and doesnt pull in heavy libraries
+# the heavy stuff (torch, faiss, langchain, Gemini SDK, PDF parsers) must only load on first use
+#
+# usage (from the backend folder):
+#   python -m benchmarks.import_time [--module app.main] [--budget-ms 1500] [--runs 3]
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+# modules that are slow to import and must stay behind the service boundaries
+HEAVY_MODULES = [
+    "torch",
+    "sentence_transformers",
+    "langchain_huggingface",
+    "langchain_community",
+    "langchain_core",
+    "langchain_text_splitters",
+    "faiss",
+    "google.generativeai",
+    "pypdf",
+    "docx",
+    "pdfplumber",
+]
+
+# tiny program run in a fresh interpreter so nothing is already imported
+_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import {module}
+elapsed_ms = (time.perf_counter() - started) * 1000
+heavy = [name for name in {heavy!r} if name in sys.modules]
+print(json.dumps({{"elapsed_ms": elapsed_ms, "heavy": heavy}}))
+"""
+
+
+# imports the module in a new python process and returns how long it took and what heavy modules got loaded
+def measure_import(module: str) -> dict:
+    result = subprocess.run(
+        [sys.executable, "-c", _PROBE.format(module=module, heavy=HEAVY_MODULES)],
+        capture_output=True,
+        text=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr}")
+    # the probe prints its json on the last line (the app may log before that)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Check the import time budget of the app")
+    parser.add_argument("--module", default="app.main", help="module to import")
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("IMPORT_TIME_BUDGET_MS", "1500")))
+    parser.add_argument("--runs", type=int, default=3, help="take the best of this many fresh imports")
+    args = parser.parse_args(argv)
+
+    # best of several runs so a cold disk cache doesnt fail the check
+    runs = [measure_import(args.module) for _ in range(max(1, args.runs))]
+    best_ms = min(run["elapsed_ms"] for run in runs)
+    heavy = sorted({name for run in runs for name in run["heavy"]})
+
+    print(f"import {args.module}: best {best_ms:.0f} ms over {len(runs)} runs (budget {args.budget_ms:.0f} ms)")
+    ok = True
+    if best_ms > args.budget_ms:
+        print(f"FAIL: import time is over budget by {best_ms - args.budget_ms:.0f} ms")
+        ok = False
+    if heavy:
+        print(f"FAIL: heavy modules imported eagerly: {', '.join(heavy)}")
+        ok = False
+    if ok:
+        print("OK")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
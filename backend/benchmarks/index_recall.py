@@ -0,0 +1,59 @@
+# compares the compressed index types against the exact one: recall@k, memory and search speed
+# so VECTOR_INDEX_TYPE / VECTOR_INDEX_RERANK_FACTOR can be picked on data
+#
+# usage (from the backend folder):
+#   python -m benchmarks.index_recall                    # uses the vectors of the current vectorstore
+#   python -m benchmarks.index_recall --synthetic 20000  # clustered random vectors instead
+#   python -m benchmarks.index_recall --rerank-factor 0 4 --k 5
+import argparse
+import json
+import sys
+
+import numpy as np
+
+from app.vectorstore.faiss_store import INDEX_TYPES, compare_index_recall
+
+
+# random vectors grouped around topic centres, normalised like sentence embeddings
+def synthetic_vectors(count: int, dim: int = 384, topics: int = 50, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(topics, dim))
+    vectors = centres[rng.integers(0, topics, count)] + rng.normal(scale=0.6, size=(count, dim))
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors.astype("float32")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Recall@k and memory of compressed FAISS indexes")
+    parser.add_argument("--synthetic", type=int, default=0, help="use N synthetic vectors instead of the vectorstore")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--index-types", nargs="+", default=list(INDEX_TYPES), choices=INDEX_TYPES)
+    parser.add_argument("--rerank-factor", nargs="+", type=int, default=[0])
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    vectors = synthetic_vectors(args.synthetic) if args.synthetic else None
+    results = []
+    for factor in args.rerank_factor:
+        # re-ranking only applies to compressed indexes
+        index_types = [t for t in args.index_types if factor == 0 or t != "flat"]
+        results.extend(compare_index_recall(
+            vectors, k=args.k, index_types=index_types, n_queries=args.queries, rerank_factor=factor
+        ))
+
+    recall_key = next(key for key in results[0] if key.startswith("recall@"))
+    print(f"{'index':<9} {'rerank':>6} {recall_key:>9} {'bytes/vec':>10} {'index MB':>9} {'build s':>8} {'ms/query':>9}")
+    for r in results:
+        print(
+            f"{r['index_type']:<9} {r['rerank_factor']:>6} {r[recall_key]:>9.4f} {r['bytes_per_vector']:>10.1f} "
+            f"{r['index_bytes'] / 1e6:>9.2f} {r['build_s']:>8.2f} {r['search_ms_per_query']:>9.4f}"
+        )
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+# compares ingestion memory of the streaming pipeline (ingest_pdf) with the old way of
+# materializing everything (all pages -> all chunks -> all embeddings -> one index build)
+# every run uses a fresh interpreter and a throwaway vector DB. "transient" is the peak Python
+# memory during ingestion minus what is still held afterwards (the index and docstore are kept,
+# so they dont count). what still grows with the PDF in streaming mode is pypdf's cache of the
+# parsed file (bounded by MAX_FILE_SIZE) and the pickling of the index when a version is saved
+#
+# usage (from the backend folder):
+#   python -m benchmarks.ingest_memory [--pages 50 200 800] [--max-ratio 0.5]
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+# tiny program run in a fresh interpreter per PDF size
+_PROBE = """
+import json, os, resource, sys, tempfile, tracemalloc
+from app.core.config import settings
+from app.services.ingestion_service import ingest_pdf
+from app.vectorstore.faiss_store import get_embeddings
+from benchmarks.corpus import make_pages, write_pdf
+
+
+def ingest_materialized(path):
+    from langchain_community.document_loaders import PyPDFLoader
+    from langchain_community.vectorstores import FAISS
+    from app.rag.chunking import chunk_documents
+    documents = PyPDFLoader(path).load()
+    chunks = chunk_documents(documents)
+    vectors = get_embeddings().embed_documents([c.page_content for c in chunks])
+    db = FAISS.from_embeddings(list(zip([c.page_content for c in chunks], vectors)), get_embeddings(),
+                               metadatas=[c.metadata for c in chunks])
+    db.save_local(settings.VECTOR_DB_PATH)
+    return {{"chunks": len(chunks)}}
+
+
+with tempfile.TemporaryDirectory(prefix="rag_mem_") as workdir:
+    settings.VECTOR_DB_PATH = os.path.join(workdir, "vector_db")
+    path = os.path.join(workdir, "doc.pdf")
+    write_pdf(path, make_pages({pages}))
+    get_embeddings().embed_query("warm-up")
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    tracemalloc.start()
+    result = ingest_pdf(path) if "{mode}" == "streaming" else ingest_materialized(path)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({{"mode": "{mode}", "pages": {pages}, "chunks": result["chunks"], "transient_kb": (peak - current) // 1024,
+                  "retained_kb": current // 1024, "peak_rss_growth_kb": rss_after - rss_before}}))
+"""
+
+
+def measure(pages: int, mode: str) -> dict:
+    result = subprocess.run(
+        [sys.executable, "-c", _PROBE.format(pages=pages, mode=mode)],
+        capture_output=True,
+        text=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Ingesting {pages} pages failed:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Ingestion memory: streaming vs materialized")
+    parser.add_argument("--pages", nargs="+", type=int, default=[50, 200, 800])
+    parser.add_argument("--max-ratio", type=float, default=0.5,
+                        help="fail if streaming needs more than this share of the materialized transient memory "
+                             "on the biggest PDF")
+    args = parser.parse_args(argv)
+
+    print(f"{'mode':<13} {'pages':>6} {'chunks':>7} {'transient KB':>13} {'retained KB':>12} {'peak RSS growth KB':>19}")
+    results = {}
+    for pages in sorted(args.pages):
+        for mode in ("materialized", "streaming"):
+            r = measure(pages, mode)
+            results[(mode, pages)] = r
+            print(f"{mode:<13} {r['pages']:>6} {r['chunks']:>7} {r['transient_kb']:>13} {r['retained_kb']:>12} "
+                  f"{r['peak_rss_growth_kb']:>19}")
+
+    biggest = max(args.pages)
+    ratio = results[("streaming", biggest)]["transient_kb"] / max(1, results[("materialized", biggest)]["transient_kb"])
+    if ratio > args.max_ratio:
+        print(f"FAIL: streaming used {ratio:.0%} of the materialized transient memory at {biggest} pages")
+        return 1
+    print(f"OK: streaming used {ratio:.0%} of the materialized transient memory at {biggest} pages")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
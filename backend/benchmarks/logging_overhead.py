@@ -0,0 +1,82 @@
+# how long a log call keeps the calling (request) thread busy: writing synchronously to a handler
+# vs handing the record to the background writer of app.core.logging. the handler sleeps
+# --write-ms per record to stand in for a slow disk or a stdout pipe nobody is reading fast enough
+#
+# usage (from the backend folder):
+#   python -m benchmarks.logging_overhead [--records 2000] [--write-ms 0.2]
+#
+# exits with 1 if a queued log call is not faster than the synchronous one
+import argparse
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+
+from app.core.logging import JsonFormatter, _QueueHandler, _QueueListener
+
+
+class _SlowHandler(logging.Handler):
+    def __init__(self, write_seconds: float):
+        super().__init__()
+        self.write_seconds = write_seconds
+        self.written = 0
+
+    def emit(self, record):
+        self.format(record)
+        time.sleep(self.write_seconds)
+        self.written += 1
+
+
+def _time_calls(logger: logging.Logger, records: int) -> float:
+    started = time.perf_counter()
+    for n in range(records):
+        logger.info("Sending RAG request with %d chars context and marks=%s", 4000 + n, 5,
+                    extra={"stage": "llm", "duration_ms": 812.5})
+    return (time.perf_counter() - started) * 1e6 / records
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Caller-side cost of a log call, synchronous vs queued")
+    parser.add_argument("--records", type=int, default=2000)
+    parser.add_argument("--write-ms", type=float, default=0.2, help="time the handler takes per record")
+    args = parser.parse_args(argv)
+
+    logger = logging.getLogger("benchmarks.logging_overhead")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+
+    handler = _SlowHandler(args.write_ms / 1000)
+    handler.setFormatter(JsonFormatter())
+    logger.addHandler(handler)
+    sync_us = _time_calls(logger, args.records)
+    logger.removeHandler(handler)
+
+    handler = _SlowHandler(args.write_ms / 1000)
+    handler.setFormatter(JsonFormatter())
+    # unbounded, so no record is dropped and both runs write the same records
+    log_queue = queue.Queue()
+    listener = _QueueListener(log_queue, handler)
+    listener.start()
+    logger.addHandler(_QueueHandler(log_queue))
+    queued_us = _time_calls(logger, args.records)
+    started = time.perf_counter()
+    listener.stop()
+    drain_s = time.perf_counter() - started
+
+    print(f"{args.records} records, handler takes {args.write_ms}ms per record")
+    print(f"{'':<12} {'us/call':>9}")
+    print(f"{'synchronous':<12} {sync_us:>9.1f}")
+    print(f"{'queued':<12} {queued_us:>9.1f}   (writer finished {drain_s:.2f}s later, {handler.written} written)")
+    if handler.written != args.records:
+        print("FAIL: the writer thread lost records")
+        return 1
+    if queued_us >= sync_us:
+        print("FAIL: a queued log call is not faster than a synchronous one")
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,84 @@
+# compares langchain's MMR search with our vectorized one (app/rag/mmr.py)
+# on the same FAISS index, for growing fetch_k and for batches of queries
+#
+# usage (from the backend folder):
+#   python -m benchmarks.mmr [--vectors 20000] [--queries 64] [--fetch-k 15 50 100 200 400] [--batch 1 16]
+import argparse
+import sys
+import time
+from typing import List
+
+import numpy as np
+
+from benchmarks.index_recall import synthetic_vectors
+
+
+# a FAISS database over synthetic vectors (searched by vector, so the embedding model is never used)
+def build_store(vectors: np.ndarray):
+    import faiss
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.documents import Document
+    from langchain_core.embeddings import Embeddings
+
+    class _UnusedEmbeddings(Embeddings):
+        def embed_documents(self, texts: List[str]) -> List[List[float]]:
+            raise NotImplementedError
+
+        def embed_query(self, text: str) -> List[float]:
+            raise NotImplementedError
+
+    index = faiss.IndexFlatL2(vectors.shape[1])
+    index.add(vectors)
+    ids = {i: str(i) for i in range(len(vectors))}
+    docstore = InMemoryDocstore({str(i): Document(page_content=f"chunk {i}") for i in range(len(vectors))})
+    return FAISS(_UnusedEmbeddings(), index, docstore, ids)
+
+
+def main(argv=None) -> int:
+    from app.rag.mmr import mmr_search_by_vectors
+
+    parser = argparse.ArgumentParser(description="LangChain MMR vs vectorized MMR")
+    parser.add_argument("--vectors", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=64)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--fetch-k", nargs="+", type=int, default=[15, 50, 100, 200, 400])
+    parser.add_argument("--batch", nargs="+", type=int, default=[1, 16])
+    parser.add_argument("--lambda", dest="lambda_mult", type=float, default=0.9)
+    args = parser.parse_args(argv)
+
+    vectors = synthetic_vectors(args.vectors)
+    queries = synthetic_vectors(args.queries, seed=1)
+    db = build_store(vectors)
+
+    print(f"{'fetch_k':>7} {'langchain ms/q':>15} " + " ".join(f"{'batch ' + str(b) + ' ms/q':>15}" for b in args.batch)
+          + f" {'speedup':>8} {'same picks':>10}")
+    for fetch_k in args.fetch_k:
+        started = time.perf_counter()
+        reference = [
+            db.max_marginal_relevance_search_by_vector(q.tolist(), k=args.k, fetch_k=fetch_k, lambda_mult=args.lambda_mult)
+            for q in queries
+        ]
+        langchain_ms = (time.perf_counter() - started) * 1000 / len(queries)
+
+        timings = []
+        ours = []
+        for batch in args.batch:
+            ours = []
+            started = time.perf_counter()
+            for start in range(0, len(queries), batch):
+                ours.extend(mmr_search_by_vectors(db, queries[start:start + batch], args.k, fetch_k, args.lambda_mult))
+            timings.append((time.perf_counter() - started) * 1000 / len(queries))
+
+        same = sum(
+            [d.page_content for d in a] == [d.page_content for d in b] for a, b in zip(reference, ours)
+        ) / len(queries)
+        print(
+            f"{fetch_k:>7} {langchain_ms:>15.3f} " + " ".join(f"{t:>15.3f}" for t in timings)
+            + f" {langchain_ms / min(timings):>7.1f}x {same:>10.0%}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
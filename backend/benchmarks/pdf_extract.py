@@ -0,0 +1,115 @@
+# compares the PDF extraction backends (PDF_BACKEND): pages/sec, and how much of the text each one
+# gets compared with a reference backend. parity is the share of non-whitespace characters two
+# backends agree on per page (as multisets, so a different line order or spacing does not count)
+#
+# usage (from the backend folder):
+#   python -m benchmarks.pdf_extract [--pdfs app/data/uploads] [--backends pypdf pdfplumber pypdfium2]
+#                                    [--reference pypdf] [--min-parity 0.95]
+#
+# without --pdfs a synthetic corpus is used. exits with 1 if a backend is below --min-parity
+import argparse
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+
+from app.services.pdf_extraction import PDF_BACKENDS, extract_pages
+from benchmarks.corpus import make_pages, write_pdf
+
+
+def _pdf_files(paths: list) -> list:
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(
+                os.path.join(path, name) for name in sorted(os.listdir(path)) if name.lower().endswith(".pdf")
+            )
+        else:
+            files.append(path)
+    return files
+
+
+# characters both texts have (whitespace ignored), out of the longer one
+def page_parity(text: str, reference: str) -> tuple:
+    a = Counter(c for c in text if not c.isspace())
+    b = Counter(c for c in reference if not c.isspace())
+    return sum((a & b).values()), max(sum(a.values()), sum(b.values()))
+
+
+def run_backend(backend: str, files: list, repeats: int) -> dict:
+    best = float("inf")
+    pages = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        pages = [list(extract_pages(path, backend)) for path in files]
+        best = min(best, time.perf_counter() - started)
+    count = sum(len(p) for p in pages)
+    return {"pages": pages, "count": count, "pages_per_s": count / best, "chars": sum(len(t) for p in pages for t in p)}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark PDF text extraction backends")
+    parser.add_argument("--pdfs", nargs="+", help="PDF files or folders (default: a synthetic corpus)")
+    parser.add_argument("--pages", type=int, default=100, help="pages of the synthetic corpus")
+    parser.add_argument("--backends", nargs="+", default=list(PDF_BACKENDS), choices=PDF_BACKENDS)
+    parser.add_argument("--reference", default="pypdf", choices=PDF_BACKENDS)
+    parser.add_argument("--repeats", type=int, default=2)
+    parser.add_argument("--min-parity", type=float, default=0.95, help="parity bound against the reference")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="rag_pdf_extract_") as workdir:
+        if args.pdfs:
+            files = _pdf_files(args.pdfs)
+        else:
+            files = [os.path.join(workdir, "synthetic.pdf")]
+            write_pdf(files[0], make_pages(args.pages))
+        if not files:
+            print("no PDF files found")
+            return 1
+
+        results = {}
+        for backend in dict.fromkeys([args.reference] + args.backends):
+            try:
+                results[backend] = run_backend(backend, files, args.repeats)
+            except ImportError as e:
+                print(f"skipping {backend}: {e}")
+    if args.reference not in results:
+        print(f"FAIL: the reference backend {args.reference} is not installed")
+        return 1
+
+    reference = results[args.reference]["pages"]
+    print(f"{len(files)} PDFs, {results[args.reference]['count']} pages, reference {args.reference}")
+    print(f"{'backend':<11} {'pages/s':>9} {'chars':>9} {'parity':>7} {'min page':>9}")
+    failed = []
+    for backend, r in results.items():
+        shared = total = 0
+        worst = 1.0
+        for doc, ref_doc in zip(r["pages"], reference):
+            if len(doc) != len(ref_doc):
+                # a different page count means pages cannot be compared one to one
+                worst = 0.0
+                continue
+            for text, ref_text in zip(doc, ref_doc):
+                same, size = page_parity(text, ref_text)
+                shared += same
+                total += size
+                if size:
+                    worst = min(worst, same / size)
+        parity = shared / total if total else 1.0
+        print(f"{backend:<11} {r['pages_per_s']:>9.1f} {r['chars']:>9} {parity:>7.1%} {worst:>9.1%}")
+        if parity < args.min_parity:
+            failed.append(backend)
+
+    passing = [backend for backend in results if backend not in failed]
+    fastest = max(passing, key=lambda backend: results[backend]["pages_per_s"])
+    print(f"fastest backend at or above {args.min_parity:.0%} parity: {fastest} (PDF_BACKEND={fastest})")
+    if failed:
+        print(f"FAIL: below {args.min_parity:.0%} parity: {', '.join(failed)}")
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
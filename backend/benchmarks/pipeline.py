@@ -0,0 +1,147 @@
+# benchmarks every stage of ingestion and question answering on a synthetic corpus
+# Gemini is replaced by a stub that sleeps for --llm-ms, so only our own code is measured
+#
+# usage (from the backend folder):
+#   python -m benchmarks.pipeline --pages 200 --queries 50 --out results.json
+#   python -m benchmarks.pipeline --out new.json --baseline results.json   # also diff against a baseline
+#
+# stages: chunk_documents, save_vectorstore, ingest_pdf, retriever.invoke, rank_documents, run_rag
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from app.core.config import settings
+from benchmarks.corpus import make_documents, make_pages, make_questions, write_pdf
+from benchmarks.stats import StageTimer
+
+
+# stands in for gemini_llm.generate_text: fixed latency, fixed answer, no network
+def _stub_llm(latency_ms: float):
+    def generate_text(prompt: str, temperature: float = 0.3, max_tokens: int = 4096, timeout: float = None) -> str:
+        time.sleep(latency_ms / 1000)
+        return "Stub answer used for benchmarking."
+    return generate_text
+
+
+# runs all stages inside a throwaway vector DB folder and returns the results dict
+def run_benchmark(pages: int, queries: int, repeats: int, llm_ms: float, seed: int) -> dict:
+    from app.rag.chunking import chunk_documents
+    from app.rag.retriever import get_retriever
+    from app.services import rag_service
+    from app.services.ingestion_service import ingest_pdf
+    from app.vectorstore.faiss_store import get_embeddings, get_vectorstore, save_vectorstore
+
+    page_texts = make_pages(pages, seed=seed)
+    documents = make_documents(page_texts)
+    questions = make_questions(queries, seed=seed + 1)
+    stages = {}
+
+    with tempfile.TemporaryDirectory(prefix="rag_bench_") as workdir:
+        settings.VECTOR_DB_PATH = os.path.join(workdir, "vector_db")
+        # load the model up front so the first stage doesnt pay for it
+        get_embeddings().embed_query("warm-up")
+
+        timer = StageTimer("chunk_documents", "pages")
+        for _ in range(repeats):
+            chunks = timer.time(chunk_documents, documents, items=len(documents))
+        stages["chunk_documents"] = timer.summary()
+
+        timer = StageTimer("save_vectorstore", "chunks")
+        for _ in range(repeats):
+            timer.time(save_vectorstore, chunks, replace=True, items=len(chunks))
+        stages["save_vectorstore"] = timer.summary()
+
+        # full ingest of a real PDF file on top of the existing store (parse + chunk + embed + merge)
+        pdf_path = os.path.join(workdir, "synthetic.pdf")
+        write_pdf(pdf_path, page_texts)
+        timer = StageTimer("ingest_pdf", "pages")
+        timer.time(ingest_pdf, pdf_path, items=len(page_texts))
+        stages["ingest_pdf"] = timer.summary()
+
+        vectorstore = get_vectorstore()
+        retriever = get_retriever(vectorstore)
+        retrieve = StageTimer("retriever.invoke", "queries")
+        rank = StageTimer("rank_documents", "queries")
+        for question in questions:
+            docs = retrieve.time(retriever.invoke, question)
+            rank.time(rag_service.rank_documents, docs, question)
+        stages["retriever.invoke"] = retrieve.summary()
+        stages["rank_documents"] = rank.summary()
+
+        original_llm = rag_service.generate_text
+        rag_service.generate_text = _stub_llm(llm_ms)
+        try:
+            timer = StageTimer("run_rag", "queries")
+            for question in questions:
+                timer.time(rag_service.run_rag, question=question, vectorstore=vectorstore, marks=5)
+            stages["run_rag"] = timer.summary()
+        finally:
+            rag_service.generate_text = original_llm
+
+    return {
+        "meta": {
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "pages": pages,
+            "chunks": len(chunks),
+            "queries": queries,
+            "repeats": repeats,
+            "llm_stub_ms": llm_ms,
+            "seed": seed,
+            "embedding_backend": settings.EMBEDDING_BACKEND,
+            "vector_index_type": settings.VECTOR_INDEX_TYPE,
+        },
+        "stages": stages,
+    }
+
+
+def print_results(results: dict):
+    print(f"{'stage':<18} {'unit':<7} {'throughput/s':>12} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, s in results["stages"].items():
+        print(
+            f"{name:<18} {s['unit']:<7} {s['throughput_per_s']:>12.1f} "
+            f"{s['p50_ms']:>9.2f} {s['p95_ms']:>9.2f} {s['p99_ms']:>9.2f}"
+        )
+
+
+def main(argv=None) -> int:
+    from benchmarks.compare import compare_results, print_comparison
+
+    parser = argparse.ArgumentParser(description="Benchmark ingestion, retrieval and end-to-end QA")
+    parser.add_argument("--pages", type=int, default=100, help="pages in the synthetic corpus")
+    parser.add_argument("--queries", type=int, default=50, help="questions to run through retrieval and QA")
+    parser.add_argument("--repeats", type=int, default=3, help="repeats of the chunk and save stages")
+    parser.add_argument("--llm-ms", type=float, default=0.0, help="latency of the stubbed LLM call")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", help="compare against a previously saved results file")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed slowdown before a stage counts as a regression")
+    args = parser.parse_args(argv)
+
+    results = run_benchmark(args.pages, args.queries, args.repeats, args.llm_ms, args.seed)
+    print_results(results)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.out}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        rows = compare_results(baseline, results, args.threshold)
+        print_comparison(rows)
+        if any(row["regressed"] for row in rows):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
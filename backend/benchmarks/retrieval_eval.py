@@ -0,0 +1,176 @@
+# measures retrieval quality against latency for a grid of retriever settings
+# so RETRIEVER_* and VECTOR_INDEX_TYPE defaults can be chosen on data
+#
+# usage (from the backend folder):
+#   python -m benchmarks.retrieval_eval                                  # synthesize questions from the current index
+#   python -m benchmarks.retrieval_eval --labels questions.jsonl         # use a labelled question set
+#   python -m benchmarks.retrieval_eval --synthetic-pages 200            # throwaway index from the synthetic corpus
+#   python -m benchmarks.retrieval_eval --search-types mmr --k 3 5 8 --fetch-k 15 30 --lambda 0.5 0.9 --json out.json
+#
+# labelled file: one JSON object per line
+#   {"question": "What is apriori?", "relevant": [{"source": "notes.pdf", "page": 3}, {"page": 4}]}
+# a relevant entry without "source" matches that page in any file
+import argparse
+import itertools
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+from app.core.config import settings
+from benchmarks.stats import percentile
+
+
+# reads a labelled question set (JSON lines)
+def load_labels(path: str) -> list:
+    items = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                item = json.loads(line)
+                items.append({"question": item["question"], "relevant": item["relevant"]})
+    return items
+
+
+# makes questions out of the indexed chunks: a stretch of words from one chunk, labelled with its page
+def synthesize_labels(db, count: int, words: int = 12, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    ids = list(db.index_to_docstore_id.values())
+    items = []
+    for doc_id in rng.sample(ids, min(count, len(ids))):
+        doc = db.docstore.search(doc_id)
+        tokens = doc.page_content.split()
+        if len(tokens) < words:
+            continue
+        start = rng.randint(0, len(tokens) - words)
+        items.append({
+            "question": " ".join(tokens[start:start + words]),
+            "relevant": [{
+                "source": os.path.basename(str(doc.metadata.get("source", ""))),
+                "page": doc.metadata.get("page"),
+            }],
+        })
+    return items
+
+
+# does a retrieved document match one of the relevant (source, page) labels
+def _matches(doc, relevant: list) -> int:
+    source = os.path.basename(str(doc.metadata.get("source", "")))
+    page = str(doc.metadata.get("page"))
+    for i, label in enumerate(relevant):
+        if str(label.get("page")) == page and label.get("source", source) == source:
+            return i
+    return -1
+
+
+# every retriever configuration in the sweep (similarity ignores fetch_k and lambda)
+def build_grid(search_types, ks, fetch_ks, lambdas, index_types) -> list:
+    grid = []
+    for index_type, search_type, k in itertools.product(index_types, search_types, ks):
+        if search_type == "similarity":
+            grid.append({"index_type": index_type, "search_type": search_type, "k": k})
+            continue
+        for fetch_k, lambda_mult in itertools.product(fetch_ks, lambdas):
+            if fetch_k >= k:
+                grid.append({"index_type": index_type, "search_type": search_type, "k": k,
+                             "fetch_k": fetch_k, "lambda_mult": lambda_mult})
+    return grid
+
+
+# runs every question through one retriever configuration
+def evaluate_config(db, labels: list, config: dict) -> dict:
+    from app.rag.retriever import get_retriever
+    retriever = get_retriever(
+        db, search_type=config["search_type"], k=config["k"],
+        fetch_k=config.get("fetch_k"), lambda_mult=config.get("lambda_mult"),
+    )
+    recall_total = 0.0
+    rr_total = 0.0
+    latencies = []
+    for item in labels:
+        started = time.perf_counter()
+        docs = retriever.invoke(item["question"])
+        latencies.append((time.perf_counter() - started) * 1000)
+
+        found = set()
+        first_rank = None
+        for rank, doc in enumerate(docs, start=1):
+            match = _matches(doc, item["relevant"])
+            if match >= 0:
+                found.add(match)
+                first_rank = first_rank or rank
+        recall_total += len(found) / len(item["relevant"])
+        rr_total += 1 / first_rank if first_rank else 0.0
+
+    n = len(labels)
+    return {
+        **config,
+        "recall@k": round(recall_total / n, 4),
+        "mrr": round(rr_total / n, 4),
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+    }
+
+
+def run_sweep(db, labels: list, grid: list) -> list:
+    from app.vectorstore.faiss_store import with_index_type
+    results = []
+    for index_type, configs in itertools.groupby(grid, key=lambda c: c["index_type"]):
+        searched_db = db if index_type == "flat" else with_index_type(db, index_type)
+        for config in configs:
+            results.append(evaluate_config(searched_db, labels, config))
+    return results
+
+
+def print_results(results: list):
+    print(f"{'index':<8} {'search':<10} {'k':>3} {'fetch_k':>7} {'lambda':>6} {'recall@k':>9} {'MRR':>6} {'p50 ms':>8} {'p95 ms':>8}")
+    for r in sorted(results, key=lambda r: (-r["recall@k"], -r["mrr"], r["p50_ms"])):
+        print(
+            f"{r['index_type']:<8} {r['search_type']:<10} {r['k']:>3} {r.get('fetch_k', '-'):>7} "
+            f"{r.get('lambda_mult', '-'):>6} {r['recall@k']:>9.4f} {r['mrr']:>6.3f} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f}"
+        )
+
+
+def main(argv=None) -> int:
+    from app.vectorstore.faiss_store import INDEX_TYPES, get_vectorstore, save_vectorstore
+
+    parser = argparse.ArgumentParser(description="Retrieval quality vs latency sweep")
+    parser.add_argument("--labels", help="labelled question set (JSON lines)")
+    parser.add_argument("--questions", type=int, default=100, help="questions to synthesize when no labels are given")
+    parser.add_argument("--synthetic-pages", type=int, default=0, help="evaluate on a throwaway index of N synthetic pages")
+    parser.add_argument("--search-types", nargs="+", default=["similarity", "mmr"], choices=["similarity", "mmr"])
+    parser.add_argument("--k", nargs="+", type=int, default=[3, 5, 8])
+    parser.add_argument("--fetch-k", nargs="+", type=int, default=[15, 30])
+    parser.add_argument("--lambda", dest="lambdas", nargs="+", type=float, default=[0.5, 0.7, 0.9])
+    parser.add_argument("--index-types", nargs="+", default=["flat"], choices=INDEX_TYPES)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="rag_eval_") as workdir:
+        if args.synthetic_pages:
+            from benchmarks.corpus import make_documents, make_pages
+            from app.rag.chunking import chunk_documents
+            settings.VECTOR_DB_PATH = os.path.join(workdir, "vector_db")
+            save_vectorstore(chunk_documents(make_documents(make_pages(args.synthetic_pages))), replace=True)
+
+        db = get_vectorstore()
+        if db is None:
+            print("No vectorstore found. Upload documents or use --synthetic-pages.")
+            return 1
+
+        labels = load_labels(args.labels) if args.labels else synthesize_labels(db, args.questions)
+        grid = build_grid(args.search_types, args.k, args.fetch_k, args.lambdas, args.index_types)
+        print(f"Evaluating {len(grid)} configurations on {len(labels)} questions")
+        results = run_sweep(db, labels, grid)
+
+    print_results(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,71 @@
+# compares search on one flat index with the same vectors split into N shards (ShardedIndex)
+# reports per-query latency for single queries and batches, and checks that the merged top-k
+# is exactly what the single index returns. the speed-up needs as many free cores as shards
+#
+# usage (from the backend folder):
+#   python -m benchmarks.shards [--vectors 200000] [--shards 1 2 4 8] [--k 15]
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+
+def _timed_search(index, queries, k: int, batch: int, repeats: int) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        started = time.perf_counter()
+        for start in range(0, len(queries), batch):
+            index.search(queries[start:start + batch], k)
+        best = min(best, time.perf_counter() - started)
+    return best * 1000 / len(queries)
+
+
+def main(argv=None) -> int:
+    import faiss
+    from app.vectorstore.shards import ShardedIndex
+
+    parser = argparse.ArgumentParser(description="Search latency of one index vs N shards searched in parallel")
+    parser.add_argument("--vectors", type=int, default=200000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--shards", nargs="+", type=int, default=[1, 2, 4, 8])
+    parser.add_argument("--k", type=int, default=15)
+    parser.add_argument("--batch", nargs="+", type=int, default=[1, 16])
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((args.vectors, args.dim), dtype=np.float32)
+    queries = rng.standard_normal((args.queries, args.dim), dtype=np.float32)
+    single = faiss.IndexFlatL2(args.dim)
+    single.add(vectors)
+    _, truth = single.search(queries, args.k)
+
+    print(f"{os.cpu_count()} CPUs, {args.vectors} vectors x {args.dim}, k={args.k}")
+    print(f"{'shards':>6} " + " ".join(f"{f'ms/query b={b}':>14}" for b in args.batch) + f" {'same top-k':>11}")
+    failed = False
+    for count in args.shards:
+        if count == 1:
+            index = single
+        else:
+            parts = []
+            for part in np.array_split(vectors, count):
+                shard = faiss.IndexFlatL2(args.dim)
+                shard.add(part)
+                parts.append(shard)
+            index = ShardedIndex(parts, [""] * count)
+        _, found = index.search(queries, args.k)
+        same = bool(np.array_equal(found, truth))
+        failed = failed or not same
+        timings = [_timed_search(index, queries, args.k, batch, args.repeats) for batch in args.batch]
+        print(f"{count:>6} " + " ".join(f"{t:>14.3f}" for t in timings) + f" {str(same):>11}")
+    if failed:
+        print("FAIL: a sharded search returned different results than the single index")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
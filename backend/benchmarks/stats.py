@@ -0,0 +1,47 @@
+# small helpers for timing benchmark stages and summarising the latencies
+import math
+import time
+
+
+# percentile with linear interpolation between the closest ranks (p between 0 and 100)
+def percentile(values: list, p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * p / 100
+    low, high = math.floor(rank), math.ceil(rank)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+# collects per-call latencies for one stage and how many items each call processed
+class StageTimer:
+    """Times repeated calls of one benchmark stage"""
+
+    def __init__(self, name: str, unit: str):
+        self.name = name
+        self.unit = unit
+        self.latencies = []
+        self.items = 0
+
+    def time(self, fn, *args, items: int = 1, **kwargs):
+        """Run fn once, record its latency and return its result"""
+        started = time.perf_counter()
+        result = fn(*args, **kwargs)
+        self.latencies.append(time.perf_counter() - started)
+        self.items += items
+        return result
+
+    def summary(self) -> dict:
+        total = sum(self.latencies)
+        ms = [s * 1000 for s in self.latencies]
+        return {
+            "unit": self.unit,
+            "calls": len(self.latencies),
+            "items": self.items,
+            "total_s": round(total, 4),
+            "throughput_per_s": round(self.items / total, 2) if total else 0.0,
+            "mean_ms": round(sum(ms) / len(ms), 3) if ms else 0.0,
+            "p50_ms": round(percentile(ms, 50), 3),
+            "p95_ms": round(percentile(ms, 95), 3),
+            "p99_ms": round(percentile(ms, 99), 3),
+        }
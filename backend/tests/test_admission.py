@@ -0,0 +1,28 @@
+import sqlite3
+import time
+
+from app.core.admission import AdmissionController
+from app.core.config import settings
+from app.services import job_store
+
+
+def test_ingest_queue_ignores_entries_of_dead_workers(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "STATE_DB_PATH", str(tmp_path / "state.db"))
+    monkeypatch.setattr(settings, "MAX_INGEST_QUEUE", 2)
+    admission = AdmissionController()
+
+    job_store.mark_pending("a.pdf")
+    job_store.claim("b.pdf")
+    assert admission.ingest_queue_full()
+
+    # the workers holding them crashed long ago
+    conn = sqlite3.connect(settings.STATE_DB_PATH)
+    conn.execute("UPDATE ingestion_status SET updated_at = ?", (time.time() - job_store.STALE_AFTER_SECONDS - 1,))
+    conn.commit()
+    conn.close()
+    assert job_store.count_in_progress() == 0
+    assert not admission.ingest_queue_full()
+
+    job_store.mark_pending("c.pdf")
+    assert job_store.count_in_progress() == 1
+    assert not admission.ingest_queue_full()
@@ -0,0 +1,42 @@
+import os
+
+from app.core.config import settings
+from app.services import ingestion_service
+from app.vectorstore import faiss_store
+from app.vectorstore.faiss_store import active_vectorstore_path, document_chunk_ids, load_vectorstore, read_manifest
+from benchmarks.corpus import make_pages, write_pdf
+
+
+def _live_index():
+    path = active_vectorstore_path()
+    return read_manifest(path)["documents"], load_vectorstore(path)
+
+
+def test_changed_file_replaces_its_old_chunks(monkeypatch, tmp_path):
+    uploads = tmp_path / "uploads"
+    uploads.mkdir()
+    monkeypatch.setattr(ingestion_service, "UPLOAD_DIR", str(uploads))
+    monkeypatch.setattr(settings, "VECTOR_DB_PATH", str(tmp_path / "vector_db"))
+    monkeypatch.setattr(settings, "TEXT_STORE_PATH", str(tmp_path / "text_store"))
+    monkeypatch.setattr(settings, "STATE_DB_PATH", str(tmp_path / "state.db"))
+    monkeypatch.setattr(faiss_store, "_vectorstore_cache", None)
+
+    pages = make_pages(6, seed=1)
+    write_pdf(str(uploads / "notes.pdf"), pages)
+    write_pdf(str(uploads / "other.pdf"), make_pages(4, seed=2))
+    ingestion_service.reconcile_uploads()
+    before, db = _live_index()
+    ntotal = db.index.ntotal
+
+    # a changed file with as many chunks as before
+    write_pdf(str(uploads / "notes.pdf"), pages[::-1])
+    os.utime(uploads / "notes.pdf", (1, 1))
+    summary = ingestion_service.reconcile_uploads()
+    after, db = _live_index()
+
+    assert summary["updated"] == ["notes.pdf"]
+    assert after["notes.pdf"]["doc_id"] != before["notes.pdf"]["doc_id"]
+    assert db.index.ntotal == ntotal
+    live_ids = set(db.index_to_docstore_id.values())
+    assert not live_ids & set(document_chunk_ids(before["notes.pdf"]))
+    assert set(document_chunk_ids(before["other.pdf"])) <= live_ids
@@ -0,0 +1,24 @@
+from app.services import warmup_service
+
+
+def test_failed_component_is_retried_until_ready(monkeypatch):
+    attempts = []
+
+    def flaky_llm():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("list_models: connection reset")
+        return "ready"
+
+    monkeypatch.setattr(warmup_service, "_STEPS", (("llm", flaky_llm),))
+    monkeypatch.setattr(warmup_service, "_RETRY_FIRST_SECONDS", 0.01)
+    monkeypatch.setitem(
+        warmup_service.WARMUP_STATUS, "llm", {"status": "pending", "seconds": None, "error": None, "attempts": 0}
+    )
+
+    warmup_service.warm_up()
+
+    state = warmup_service.WARMUP_STATUS["llm"]
+    assert state["status"] == "ready"
+    assert state["error"] is None
+    assert state["attempts"] == 2